@@ -94,9 +94,54 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # BEGIN IMMEDIATE: параллельные проводки ждут блокировку записи,
+            # а не падают с "database is locked" при повышении блокировки
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
         }
     }
 
+# Cache
+# Кэш должен быть общим для всех воркеров Gunicorn: в нем лежат выписки карт,
+# которые сбрасываются при проводках (dbo/statements.py). Redis — если задан
+# REDIS_URL (нужен пакет redis), иначе таблица в PostgreSQL (создается
+# командой createcachetable); локальная память — только для разработки на SQLite.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+elif os.environ.get('POSTGRES_DB'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'dbo_cache',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Срок жизни кэшированной выписки по карте, с
+STATEMENTS_CACHE_TIMEOUT = 10 * 60
+
+# Срок жизни кэшированного графика платежей по кредиту, с (сбрасывается платежом, dbo/credits.py)
+CREDIT_SCHEDULE_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Срок жизни кэшированной выборки каталога услуг, с (сбрасывается изменением услуг, dbo/catalog.py)
+CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# Как часто индекс подсказок услуг процесса проверяет изменения в БД, с (dbo/service_search.py)
+SERVICE_INDEX_REFRESH = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -158,6 +203,32 @@ SECURE_PROXY_SSL_HEADER = None  # Установите ('HTTP_X_FORWARDED_PROTO'
 # Can be overridden via env var DEFAULT_NEW_CLIENT_PASSWORD
 DEFAULT_NEW_CLIENT_PASSWORD = os.environ.get('DEFAULT_NEW_CLIENT_PASSWORD', '1q2w#E$R')
 
+# Ключи идемпотентности (заголовок Idempotency-Key / поле idempotency_key):
+# срок хранения ответа, размер LRU в памяти процесса и время, после которого
+# незавершенный запрос с тем же ключом считается оборванным
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 2048))
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# Групповая фиксация переводов (dbo/group_commit.py): переводы из запросов
+# одного процесса проводятся пачками; имеет смысл при Gunicorn с --threads
+TRANSFER_BATCHING = os.environ.get('TRANSFER_BATCHING', '').lower() in ('1', 'true', 'yes')
+TRANSFER_BATCH_WINDOW_MS = float(os.environ.get('TRANSFER_BATCH_WINDOW_MS', 3))
+TRANSFER_BATCH_MAX_SIZE = int(os.environ.get('TRANSFER_BATCH_MAX_SIZE', 200))
+# Сколько секунд запрос ждет свою пачку; не взятая в работу операция проводится отдельно
+TRANSFER_BATCH_TIMEOUT = float(os.environ.get('TRANSFER_BATCH_TIMEOUT', 5))
+
+# Отложенный расчет переводов (dbo/settlement.py): переводы записываются в
+# статусе pending с резервом средств, балансы меняет команда settle_transactions
+TRANSFER_SETTLEMENT = os.environ.get('TRANSFER_SETTLEMENT', '').lower() in ('1', 'true', 'yes')
+SETTLEMENT_BATCH_SIZE = int(os.environ.get('SETTLEMENT_BATCH_SIZE', 5000))
+
+# Авторизация покупок (dbo/holds.py): удержания копятся в памяти процесса и
+# записываются раз в HOLD_FLUSH_INTERVAL_MS; снимок доступных средств карты
+# перечитывается не реже раза в HOLD_SNAPSHOT_TTL секунд
+HOLD_FLUSH_INTERVAL_MS = float(os.environ.get('HOLD_FLUSH_INTERVAL_MS', 50))
+HOLD_SNAPSHOT_TTL = float(os.environ.get('HOLD_SNAPSHOT_TTL', 2))
+
 # Login / Logout URLs
 LOGIN_URL = '/login/'
 LOGOUT_URL = '/logout/'
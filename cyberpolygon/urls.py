@@ -57,6 +57,7 @@ urlpatterns = [
     path("client/transfers/", views.transfers_view, name="transfers"),  # Отдельная страница переводов
     path("client/deposits/", views.deposits_view, name="deposits"),
     path("client/transactions/", views.transactions_view, name="transactions"),  # Страница истории операций
+    path("client/transactions/export/", views.export_transactions, name="export_transactions"),  # Выгрузка CSV/JSONL
     path("client/history/", views.history_view, name="history"),  # Алиас для истории операций
     # кредиты вырезаны
     
@@ -74,6 +75,11 @@ urlpatterns = [
     path("card/<int:card_id>/unblock/", views.unblock_card, name="unblock_card"),
     path("card/<int:card_id>/pin/", views.change_card_pin, name="change_card_pin"),
     path("card/<int:card_id>/set-primary/", views.set_primary_card, name="set_primary_card"),
+    path("card/<int:card_id>/details/", views.get_card_details, name="get_card_details"),
+    path("card/<int:card_id>/statements/", views.get_card_statements, name="get_card_statements"),  # Последние операции (ETag)
+    path("card/<int:card_id>/balance/", views.get_card_balance, name="get_card_balance"),  # Баланс на дату (?date= / ?at=)
+    path("client/balance-history/", views.balance_history, name="balance_history"),  # Балансы карт по дням (?days=)
+    path("deposit/<int:deposit_id>/accruals/", views.deposit_accruals, name="deposit_accruals"),  # Журнал начисления процентов
     
     # Новые банковские сервисы
     # кредиты вырезаны
@@ -83,6 +89,13 @@ urlpatterns = [
     path("service/investments/", views.investments_service, name="investments_service"),
     path("api/check-recipient-phone/", views.check_recipient_phone, name="check_recipient_phone"),
     path("api/login/", views.api_login, name="api_login"),
+    path("api/cards/<int:card_id>/authorize/", views.authorize_card, name="authorize_card"),  # Удержание (dbo/holds.py)
+    path("api/holds/<uuid:hold_id>/capture/", views.capture_hold, name="capture_hold"),
+    path("api/holds/<uuid:hold_id>/release/", views.release_hold, name="release_hold"),
+    path("api/credits/<int:credit_id>/schedule/", views.credit_schedule_view, name="credit_schedule"),  # График (dbo/credits.py)
+    path("api/credits/<int:credit_id>/pay/", views.credit_payment, name="credit_payment"),
+    path("api/services/autocomplete/", views.service_autocomplete, name="service_autocomplete"),  # Подсказки (dbo/service_search.py)
+    path("api/services/<uuid:service_uuid>/rate/", views.rate_service, name="rate_service"),  # Оценки (dbo/ratings.py)
     
     
     # Старые маршруты для совместимости
@@ -83,14 +83,14 @@ class TransactionAdmin(admin.ModelAdmin):
 
 @admin.register(Deposit)
 class DepositAdmin(admin.ModelAdmin):
-    list_display = ('client', 'card', 'amount', 'interest_rate', 'term_months', 'start_date', 'end_date', 'is_active', 'created_at')
+    list_display = ('client', 'card', 'amount', 'interest_rate', 'term_months', 'start_date', 'end_date', 'accrued_interest', 'is_active', 'created_at')
     list_filter = ('is_active', 'term_months')
     search_fields = ('client__full_name', 'card__card_number')
 
 
 @admin.register(Credit)
 class CreditAdmin(admin.ModelAdmin):
-    list_display = ('client', 'amount', 'interest_rate', 'term_months', 'monthly_payment', 'remaining_amount', 'status', 'start_date', 'end_date')
+    list_display = ('client', 'amount', 'interest_rate', 'term_months', 'monthly_payment', 'remaining_amount', 'paid_amount', 'status', 'start_date', 'end_date')
     list_filter = ('status', 'term_months')
     search_fields = ('client__full_name',)
 
@@ -104,6 +104,6 @@ class InvestmentProductAdmin(admin.ModelAdmin):
 
 @admin.register(ClientInvestment)
 class ClientInvestmentAdmin(admin.ModelAdmin):
-    list_display = ('client', 'product', 'amount', 'current_value', 'status', 'purchase_date', 'created_at')
+    list_display = ('client', 'product', 'amount', 'current_value', 'return_percent', 'revalued_on', 'status', 'purchase_date', 'created_at')
     list_filter = ('status', 'product__product_type')
     search_fields = ('client__full_name', 'product__name')
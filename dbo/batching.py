@@ -0,0 +1,50 @@
+"""
+Общие заготовки ночных пересчетов порциями (депозиты, кредиты, инвестиции).
+
+Пересчет проходит строки порциями по id (keyset: id > последнего id
+предыдущей порции), каждая порция — отдельная транзакция БД в функции
+модуля; итоги порций складываются по полям RESULT_FIELDS модуля. Суммы в
+расчете — копейки в массивах int64.
+"""
+from decimal import Decimal
+
+import numpy as np
+
+
+def cents(values):
+    """Массив копеек (int64) из сумм Decimal"""
+    return np.array([round(value * 100) for value in values], dtype=np.int64)
+
+
+def money(cents):
+    """Сумма Decimal из числа копеек"""
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def run_chunks(queryset, chunk, fields, chunk_size, progress=None):
+    """
+    Вызывает chunk(ids) для id строк queryset порциями по chunk_size и
+    складывает результаты по полям fields. Возвращает итог; progress(итог)
+    вызывается после каждой порции.
+    """
+    total = dict.fromkeys(fields, 0)
+    last_id = 0
+    while True:
+        ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return total
+        last_id = ids[-1]
+        result = chunk(ids)
+        for field in fields:
+            total[field] += result[field]
+        if progress is not None:
+            progress(total)
+
+
+def upsert(model, objects, update_fields, batch_size=1000):
+    """Записывает поля update_fields заблокированных строк objects"""
+    # Upsert по id: строки существуют и заблокированы, так что это UPDATE одним
+    # запросом на пачку (bulk_update строит CASE по каждой строке и заметно медленнее)
+    model.objects.bulk_create(
+        objects, update_conflicts=True, unique_fields=['id'], update_fields=update_fields, batch_size=batch_size,
+    )
@@ -0,0 +1,178 @@
+"""
+Ежемесячное списание платы за подключенные услуги (ClientService).
+
+Команда run_billing выбирает подписки, у которых next_payment_date не позже
+даты списания, порциями по ключу (next_payment_date, id) и обрабатывает
+каждую порцию одной транзакцией БД:
+- строки подписок блокируются (SKIP LOCKED — параллельный запуск их
+  пропустит), строки карт списания — в порядке id;
+- за каждый пропущенный период (BILLING_PERIOD) создается своя операция
+  'fee'; все Transaction — одним bulk_create, балансы карт — одним UPDATE;
+- оплаченные подписки сдвигают next_payment_date за дату списания, не
+  оплаченные (нет активной карты или средств) приостанавливаются, а
+  подписки без auto_renewal после окончания оплаченного периода истекают —
+  каждое изменение одним UPDATE на порцию.
+
+После обработки подписка выходит из выборки, поэтому повторный запуск с той
+же датой ничего не списывает. Карта списания — основная карта клиента, если
+она активна, иначе первая активная.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction as db_transaction
+from django.db.models import Case, DecimalField, F, Min, Q, Value, When
+from django.utils import timezone
+
+from .hot_accounts import fold
+from .ledger import record_postings
+from .models import BankCard, Client, ClientService, Transaction
+from .posting import reserved_amounts
+from .statements import invalidate_cards
+from .stats import record_transactions
+
+# Период подписки: как при подключении услуги (views.connect_service)
+BILLING_PERIOD = timedelta(days=30)
+
+RESULT_FIELDS = ('subscriptions', 'charged', 'suspended', 'expired', 'transactions', 'amount')
+
+
+def due_subscriptions(billing_date):
+    """Подписки, по которым к billing_date пора списывать плату или истек срок"""
+    return ClientService.objects.filter(
+        status='active', is_active=True, monthly_fee__gt=0, next_payment_date__lte=billing_date,
+    )
+
+
+def periods_due(next_payment_date, billing_date):
+    """Сколько периодов подписки наступило к billing_date (next_payment_date <= billing_date)"""
+    return (billing_date - next_payment_date) // BILLING_PERIOD + 1
+
+
+def _billing_cards(client_ids):
+    """{client_id: card_id} — основная активная карта клиента или первая активная"""
+    cards = dict(
+        Client.objects.filter(id__in=client_ids, primary_card__is_active=True)
+        .values_list('id', 'primary_card_id')
+    )
+    missing = [client_id for client_id in client_ids if client_id not in cards]
+    if missing:
+        cards.update(
+            BankCard.objects.filter(client_id__in=missing, is_active=True)
+            .values('client_id').annotate(card_id=Min('id')).values_list('client_id', 'card_id')
+            .order_by()
+        )
+    return cards
+
+
+def bill_chunk(subscription_ids, billing_date):
+    """
+    Обрабатывает подписки одной транзакцией БД; подписки, которые уже
+    обработал параллельный запуск, пропускаются. Возвращает
+    {поле RESULT_FIELDS: значение}.
+    """
+    result = dict.fromkeys(RESULT_FIELDS, 0)
+    with db_transaction.atomic():
+        subscriptions = list(
+            due_subscriptions(billing_date).filter(id__in=subscription_ids)
+            .select_for_update(skip_locked=True, of=('self',))
+            .select_related('service')
+            .order_by('id')
+        )
+        if not subscriptions:
+            return result
+        result['subscriptions'] = len(subscriptions)
+
+        renewing = [sub for sub in subscriptions if sub.auto_renewal]
+        expired = [sub.id for sub in subscriptions if not sub.auto_renewal]
+        cards = _billing_cards(sorted({sub.client_id for sub in renewing}))
+        card_ids = sorted(set(cards.values()))
+        rows = list(
+            BankCard.objects.select_for_update().filter(id__in=card_ids, is_active=True).order_by('id')
+            .values_list('id', 'balance', 'balance_shards')
+        )
+        balances = {card_id: balance for card_id, balance, _ in rows}
+        for card_id in [row[0] for row in rows if row[2]]:
+            balances[card_id] += fold(card_id)
+        reserved = reserved_amounts(card_ids)
+        available = {card_id: balance - reserved.get(card_id, 0) for card_id, balance in balances.items()}
+
+        now = timezone.now()
+        transactions = []
+        debits = defaultdict(int)
+        advanced = defaultdict(list)
+        suspended = []
+        for sub in renewing:
+            card_id = cards.get(sub.client_id)
+            periods = periods_due(sub.next_payment_date, billing_date)
+            total = sub.monthly_fee * periods
+            # Подписка оплачивается целиком за все наступившие периоды или приостанавливается
+            if card_id not in available or available[card_id] < total:
+                suspended.append(sub.id)
+                continue
+            available[card_id] -= total
+            debits[card_id] += total
+            for period in range(periods):
+                period_start = sub.next_payment_date + BILLING_PERIOD * period
+                transactions.append(Transaction(
+                    from_card_id=card_id,
+                    from_client_id=sub.client_id,
+                    amount=sub.monthly_fee,
+                    transaction_type='fee',
+                    description=f'Абонентская плата за услугу "{sub.service.name}" с {period_start:%d.%m.%Y}',
+                    status='completed',
+                    completed_at=now,
+                ))
+            advanced[sub.next_payment_date + BILLING_PERIOD * periods].append(sub.id)
+            result['amount'] += total
+
+        if debits:
+            BankCard.objects.filter(id__in=debits).update(balance=F('balance') - Case(
+                *[When(id=card_id, then=Value(amount)) for card_id, amount in debits.items()],
+                output_field=DecimalField(max_digits=15, decimal_places=2),
+            ))
+            Transaction.objects.bulk_create(transactions)
+            record_postings(transactions)
+            record_transactions(transactions)
+            db_transaction.on_commit(lambda: invalidate_cards(sorted(debits)), robust=True)
+        # Даты следующего платежа совпадают у многих подписок: UPDATE на каждую дату
+        for next_date, ids in advanced.items():
+            ClientService.objects.filter(id__in=ids).update(next_payment_date=next_date)
+        if suspended:
+            ClientService.objects.filter(id__in=suspended).update(status='suspended', is_active=False)
+        if expired:
+            ClientService.objects.filter(id__in=expired).update(status='expired', is_active=False)
+
+    result.update(
+        charged=sum(len(ids) for ids in advanced.values()),
+        suspended=len(suspended),
+        expired=len(expired),
+        transactions=len(transactions),
+    )
+    return result
+
+
+def run_billing(billing_date, chunk_size=1000, progress=None):
+    """
+    Обрабатывает все подписки к billing_date порциями по chunk_size.
+    Возвращает итог {поле RESULT_FIELDS: значение}; progress(итог) вызывается
+    после каждой порции.
+    """
+    total = dict.fromkeys(RESULT_FIELDS, 0)
+    cursor = None
+    while True:
+        queryset = due_subscriptions(billing_date)
+        if cursor is not None:
+            last_date, last_id = cursor
+            queryset = queryset.filter(
+                Q(next_payment_date__gt=last_date) | Q(next_payment_date=last_date, id__gt=last_id)
+            )
+        keys = list(queryset.order_by('next_payment_date', 'id').values_list('next_payment_date', 'id')[:chunk_size])
+        if not keys:
+            return total
+        cursor = keys[-1]
+        result = bill_chunk([subscription_id for _, subscription_id in keys], billing_date)
+        for field in RESULT_FIELDS:
+            total[field] += result[field]
+        if progress is not None:
+            progress(total)
@@ -0,0 +1,157 @@
+"""
+Каталог услуг (страница banking_services).
+
+Выборка строится ORM-запросом с параметрами: категория (по названию),
+ценовой диапазон PRICE_BUCKETS, сортировка CATALOG_ORDERINGS и поиск —
+каждое слово запроса как префикс слова названия или описания, с рангом
+релевантности (dbo/service_search.py); с запросом и без явной сортировки
+услуги идут по релевантности. Страница показывает первые CATALOG_LIMIT
+услуг выборки. Число всех и бесплатных услуг без поискового запроса
+берется из счетчиков фасетов (dbo/facets.py), с запросом — одним агрегатом.
+
+Результат хранится в кэше под ключом из версии каталога и параметров
+(запрос нормализуется так же, как для поиска: регистр, ё/е, пробелы и
+повторы слов не дают новых ключей). Сохранение и удаление Service и
+ServiceCategory (dbo/signals.py) после фиксации транзакции удаляют
+версию — следующий запрос заводит новую, так что одобренная оператором
+услуга видна в каталоге сразу. Массовые bulk_create / update сигналов не
+вызывают: после них нужен invalidate_catalog().
+"""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+
+from .facets import PRICE_BUCKETS, facet_counts
+from .models import Service, ServiceCategory
+from .search import tokenize
+from .service_search import HIDDEN_CATEGORIES, search_services
+
+CATALOG_LIMIT = 60
+
+CATALOG_ORDERINGS = {
+    'name': ('name', 'id'),
+    'price-low': ('price', 'id'),
+    'price-high': ('-price', 'id'),
+    'popular': ('-rating_count', '-rating', 'id'),
+    'relevance': ('-search_rank', 'id'),
+}
+
+_VERSION_KEY = 'dbo:catalog-version'
+_MAX_QUERY_WORDS = 8
+_SERVICE_FIELDS = ('id', 'uuid', 'name', 'description', 'price', 'is_active', 'rating', 'rating_count')
+
+
+def normalize_query(q):
+    """Токены поискового запроса без повторов (не больше _MAX_QUERY_WORDS)"""
+    return tuple(dict.fromkeys(tokenize((q or '')[:200])))[:_MAX_QUERY_WORDS]
+
+
+def _catalog_version():
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        cache.add(_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(_VERSION_KEY)
+    return version
+
+
+def invalidate_catalog():
+    """Сбрасывает кэшированные выборки каталога (вызывать после фиксации изменений)"""
+    cache.delete(_VERSION_KEY)
+
+
+def catalog_categories():
+    """Категории каталога [{'id', 'name'}, ...] в порядке id"""
+    key = f'dbo:catalog-categories:{_catalog_version()}'
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(
+            ServiceCategory.objects.exclude(name__icontains=HIDDEN_CATEGORIES).order_by('id').values('id', 'name')
+        )
+        cache.set(key, categories, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return categories
+
+
+def catalog_queryset(category, price, sort, words):
+    """Активные услуги каталога по параметрам (без кэша)"""
+    services = Service.objects.filter(is_active=True)
+    if category:
+        services = services.filter(category__name=category)
+    if price in PRICE_BUCKETS:
+        services = services.filter(PRICE_BUCKETS[price])
+    if words:
+        services = search_services(services, words)
+    return services.order_by(*CATALOG_ORDERINGS[sort])
+
+
+def catalog_facets():
+    """Активные услуги по фасетам {(category_id, ценовой диапазон): count} из кэша или одним запросом"""
+    key = f'dbo:catalog-facets:{_catalog_version()}'
+    counts = cache.get(key)
+    if counts is None:
+        counts = {
+            (category_id, bucket): count
+            for (category_id, bucket, is_active), count in facet_counts().items() if is_active
+        }
+        cache.set(key, counts, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return counts
+
+
+def bucket_counts(counts, category_ids=None):
+    """
+    Число активных услуг категорий category_ids (None — всех) по ценовым
+    диапазонам: {'all': всего, 'free': ..., 'low': ..., ...}
+    """
+    totals = dict.fromkeys(['all', *PRICE_BUCKETS], 0)
+    for (category_id, bucket), count in counts.items():
+        if category_ids is None or category_id in category_ids:
+            totals[bucket] += count
+            totals['all'] += count
+    return totals
+
+
+def _facet_totals(category, price):
+    """(всего, бесплатных) по счетчикам фасетов; None — категории нет среди категорий каталога"""
+    category_ids = None
+    if category:
+        category_ids = {item['id'] for item in catalog_categories() if item['name'] == category}
+        if not category_ids:
+            return None
+    totals = bucket_counts(catalog_facets(), category_ids)
+    return totals[price], totals['free'] if price in ('all', 'free') else 0
+
+
+def query_catalog(category, price, sort, words):
+    """Выборка каталога без кэша: {'services': [...], 'total', 'free'}"""
+    services = catalog_queryset(category, price, sort, words)
+    totals = None if words else _facet_totals(category, price)
+    if totals is None:
+        counts = services.order_by().aggregate(total=Count('id'), free=Count('id', filter=Q(price=0)))
+        totals = counts['total'], counts['free']
+    rows = list(services.values(*_SERVICE_FIELDS, category_name=F('category__name'))[:CATALOG_LIMIT])
+    for row in rows:
+        row['uuid'] = str(row['uuid'])
+    return {'services': rows, 'total': totals[0], 'free': totals[1]}
+
+
+def catalog_page(category='', price='all', sort='', q=''):
+    """
+    Выборка каталога из кэша или из БД: {'services': [...], 'total': число
+    услуг выборки, 'free': из них бесплатных}. services — первые
+    CATALOG_LIMIT строк (словари с полями услуги и category_name).
+    """
+    words = normalize_query(q)
+    price = price if price in PRICE_BUCKETS else 'all'
+    if sort not in CATALOG_ORDERINGS or (sort == 'relevance' and not words):
+        sort = 'relevance' if words else 'name'
+    params = json.dumps([category, price, sort, words], ensure_ascii=False)
+    digest = hashlib.sha1(params.encode()).hexdigest()
+    key = f'dbo:catalog:{_catalog_version()}:{digest}'
+    page = cache.get(key)
+    if page is None:
+        page = query_catalog(category, price, sort, words)
+        cache.set(key, page, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return page
@@ -0,0 +1,275 @@
+"""
+Графики платежей по кредитам (аннуитет) и ночной пересчет кредитов.
+
+Расчет векторный: поля порции кредитов загружаются в массивы NumPy (суммы —
+в копейках), цикл идет по месяцам — не дольше срока самого длинного кредита
+порции, — и каждый шаг считает сразу все кредиты:
+- ежемесячный платеж — аннуитет amount * r / (1 - (1 + r)^-n), r = ставка / 12,
+  округленный до копеек; проценты месяца — остаток долга * r, последний
+  платеж закрывает остаток целиком;
+- дата платежа k — тот же день месяца, что start_date, через k месяцев
+  (в коротком месяце — его последний день).
+
+Внесенные платежи (paid_amount) гасят график по порядку: остаток долга
+(remaining_amount) — основной долг после последнего полностью оплаченного
+платежа минус часть следующего платежа, внесенная сверх его процентов. Кредит просрочен, если к дате расчета
+наступило платежей на большую сумму, чем внесено, и погашен, если внесена
+сумма всего графика.
+
+График кредита для страницы кредитов хранится в кэше под ключом с версией
+кредита (как выписка карты, dbo/statements.py); платеж и ночной пересчет
+после фиксации сбрасывают версию. Команда update_credits пересчитывает
+статус, платеж и остаток всех непогашенных кредитов порциями по id; строки
+порции блокируются (SKIP LOCKED), изменившиеся пишутся одним upsert.
+"""
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .batching import cents, money, run_chunks, upsert
+from .models import Credit, CreditPayment
+from .posting import PostingError, post_transaction, validate_operation
+
+RESULT_FIELDS = ('credits', 'changed', 'overdue', 'paid')
+
+_FIELDS = ('id', 'client_id', 'amount', 'interest_rate', 'term_months', 'monthly_payment', 'remaining_amount',
+           'status', 'start_date', 'end_date', 'created_at', 'paid_amount')
+
+
+def annuity_payment(amount, rate, term):
+    """Ежемесячный платеж в копейках (amount — копейки, rate — сотые доли процента годовых)"""
+    monthly = rate / 120_000
+    term = np.maximum(term, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        annuity = amount * monthly / (1 - (1 + monthly) ** -term)
+    return np.floor(np.where(monthly > 0, annuity, amount / term) + 0.5).astype(np.int64)
+
+
+def _due_dates(start, month):
+    """Даты платежа номер month для дат выдачи start (datetime64[D])"""
+    first = start.astype('datetime64[M]')
+    day = (start - first.astype('datetime64[D]')).astype(np.int64)
+    due_month = first + month
+    length = ((due_month + 1).astype('datetime64[D]') - due_month.astype('datetime64[D]')).astype(np.int64)
+    return due_month.astype('datetime64[D]') + np.minimum(day, length - 1)
+
+
+def months_due(start, on_date):
+    """Сколько платежей по графику наступило к on_date для дат выдачи start"""
+    on_date = np.datetime64(on_date, 'D')
+    months = (on_date.astype('datetime64[M]') - start.astype('datetime64[M]')).astype(np.int64)
+    return np.maximum(months - (_due_dates(start, months) > on_date), 0)
+
+
+def iterate_schedule(amount, rate, term):
+    """
+    Строки графиков по месяцам для массивов кредитов: для k = 1..max(term)
+    выдает словарь массивов month, payment, interest, principal, balance
+    (долг после платежа), cumulative (сумма платежей 1..k). После погашения
+    платеж кредита нулевой. Срок меньше месяца считается одним месяцем, как
+    в annuity_payment: иначе у кредита не было бы ни одного платежа.
+    """
+    term = np.maximum(term, 1)
+    monthly = rate / 120_000
+    payment = annuity_payment(amount, rate, term)
+    balance = amount.copy()
+    cumulative = np.zeros_like(amount)
+    for month in range(1, int(term.max(initial=0)) + 1):
+        live = (month <= term) & (balance > 0)
+        interest = np.where(live, np.floor(balance * monthly + 0.5).astype(np.int64), 0)
+        owed = balance + interest
+        due = np.where(live, np.where(month >= term, owed, np.minimum(payment, owed)), 0)
+        balance = balance - (due - interest)
+        cumulative = cumulative + due
+        yield {
+            'month': month, 'payment': due, 'interest': interest,
+            'principal': due - interest, 'balance': balance, 'cumulative': cumulative,
+        }
+
+
+def evaluate(amount, rate, term, start, paid, on_date):
+    """
+    Состояние кредитов на дату on_date (массивы, суммы в копейках). Возвращает
+    словарь массивов: payment (ежемесячный платеж), total (сумма графика),
+    remaining (остаток долга), overdue и repaid (признаки).
+    """
+    remaining = amount.copy()
+    due_total = np.zeros_like(amount)
+    previous = {'balance': amount, 'cumulative': np.zeros_like(amount)}
+    due = months_due(start, on_date)
+    for row in iterate_schedule(amount, rate, term):
+        # Платеж k оплачен частично: часть сверх предыдущих платежей сначала идет на его проценты
+        partial = (previous['cumulative'] <= paid) & (paid < row['cumulative'])
+        covered = np.maximum(paid - previous['cumulative'] - row['interest'], 0)
+        remaining = np.where(partial, previous['balance'] - covered, remaining)
+        due_total = np.where(row['month'] <= due, row['cumulative'], due_total)
+        previous = row
+    total = previous['cumulative']
+    return {
+        'payment': annuity_payment(amount, rate, term),
+        'total': total,
+        'remaining': np.where(paid >= total, 0, remaining),
+        'overdue': paid < due_total,
+        'repaid': paid >= total,
+    }
+
+
+def _arrays(rows):
+    """Массивы evaluate из строк values_list(*_FIELDS)"""
+    columns = dict(zip(_FIELDS, zip(*rows)))
+    return (
+        cents(columns['amount']),
+        cents(columns['interest_rate']),
+        np.array(columns['term_months'], dtype=np.int64),
+        np.array(columns['start_date'], dtype='datetime64[D]'),
+        cents(columns['paid_amount']),
+    )
+
+
+def _statuses(state):
+    return np.where(state['repaid'], 'paid', np.where(state['overdue'], 'overdue', 'active'))
+
+
+def update_chunk(credit_ids, on_date):
+    """
+    Пересчитывает статус, платеж и остаток непогашенных кредитов одной
+    транзакцией БД. Возвращает {поле RESULT_FIELDS: значение}.
+    """
+    result = dict.fromkeys(RESULT_FIELDS, 0)
+    with db_transaction.atomic():
+        rows = list(
+            Credit.objects.filter(id__in=credit_ids).exclude(status='paid')
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list(*_FIELDS)
+        )
+        if not rows:
+            return result
+        state = evaluate(*_arrays(rows), on_date)
+        statuses = _statuses(state)
+        updated = []
+        for i, row in enumerate(rows):
+            values = dict(zip(_FIELDS, row))
+            changes = {
+                'monthly_payment': money(state['payment'][i]),
+                'remaining_amount': money(state['remaining'][i]),
+                'status': str(statuses[i]),
+            }
+            if any(values[field] != value for field, value in changes.items()):
+                updated.append(Credit(**{**values, **changes}))
+        upsert(Credit, updated, ['monthly_payment', 'remaining_amount', 'status'])
+        changed = [credit.id for credit in updated]
+        db_transaction.on_commit(lambda: invalidate_credits(changed), robust=True)
+
+    result.update(
+        credits=len(rows),
+        changed=len(updated),
+        overdue=int((statuses == 'overdue').sum()),
+        paid=int((statuses == 'paid').sum()),
+    )
+    return result
+
+
+def update_credits(on_date, chunk_size=50_000, progress=None):
+    """
+    Пересчитывает все непогашенные кредиты на дату on_date порциями по
+    chunk_size. Возвращает итог {поле RESULT_FIELDS: значение}; progress(итог)
+    вызывается после каждой порции.
+    """
+    return run_chunks(
+        Credit.objects.exclude(status='paid'), lambda ids: update_chunk(ids, on_date), RESULT_FIELDS, chunk_size,
+        progress,
+    )
+
+
+def build_schedules(credits, on_date):
+    """
+    Графики платежей сразу для многих кредитов: {credit_id: [строка, ...]},
+    строка — номер, дата, платеж, проценты, основной долг, остаток и статус
+    платежа (paid, overdue или upcoming).
+    """
+    credits = list(credits)
+    if not credits:
+        return {}
+    rows = [tuple(getattr(credit, field) for field in _FIELDS) for credit in credits]
+    amount, rate, term, start, paid = _arrays(rows)
+    on_date = np.datetime64(on_date, 'D')
+    schedules = {credit.id: [] for credit in credits}
+    for row in iterate_schedule(amount, rate, term):
+        dates = _due_dates(start, row['month'])
+        statuses = np.where(
+            row['cumulative'] <= paid, 'paid', np.where(dates <= on_date, 'overdue', 'upcoming')
+        )
+        for i in np.flatnonzero(row['payment']):
+            schedules[credits[i].id].append({
+                'month': row['month'],
+                'date': str(dates[i]),
+                'payment': float(money(row['payment'][i])),
+                'interest': float(money(row['interest'][i])),
+                'principal': float(money(row['principal'][i])),
+                'balance': float(money(row['balance'][i])),
+                'status': str(statuses[i]),
+            })
+    return schedules
+
+
+def _version_key(credit_id):
+    return f'dbo:credit-schedule-version:{credit_id}'
+
+
+def _credit_version(credit_id):
+    version = cache.get(_version_key(credit_id))
+    if version is None:
+        cache.add(_version_key(credit_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(credit_id))
+    return version
+
+
+def credit_schedule(credit):
+    """График кредита из кэша или рассчитанный заново (на сегодня)"""
+    today = timezone.localdate()
+    key = f'dbo:credit-schedule:{credit.id}:{_credit_version(credit.id)}:{today.isoformat()}'
+    schedule = cache.get(key)
+    if schedule is None:
+        schedule = build_schedules([credit], today)[credit.id]
+        cache.set(key, schedule, timeout=settings.CREDIT_SCHEDULE_CACHE_TIMEOUT)
+    return schedule
+
+
+def invalidate_credits(credit_ids):
+    """Сбрасывает кэшированные графики кредитов (вызывать после фиксации изменений)"""
+    cache.delete_many([_version_key(credit_id) for credit_id in credit_ids])
+
+
+def pay_credit(credit_id, client, card, amount):
+    """
+    Платеж по кредиту клиента с карты card: проводка 'payment', строка
+    CreditPayment и пересчет статуса и остатка кредита. Возвращает кредит;
+    исключения — как у post_transaction, PostingError — если кредит не
+    найден, погашен или сумма больше задолженности.
+    """
+    amount = validate_operation(amount, card, None)
+    with db_transaction.atomic():
+        credit = Credit.objects.select_for_update().filter(id=credit_id, client=client).exclude(status='paid').first()
+        if credit is None:
+            raise PostingError('Кредит не найден или уже погашен')
+        row = tuple(getattr(credit, field) for field in _FIELDS)
+        owed = money(evaluate(*_arrays([row]), timezone.localdate())['total'][0]) - credit.paid_amount
+        if amount > owed:
+            raise PostingError(f'Сумма больше задолженности по кредиту ({owed} ₽)')
+
+        tx = post_transaction('payment', amount, from_card=card, description=f'Платеж по кредиту #{credit.id}')
+        CreditPayment.objects.create(credit=credit, transaction=tx, amount=amount)
+        credit.paid_amount += amount
+        row = tuple(getattr(credit, field) for field in _FIELDS)
+        state = evaluate(*_arrays([row]), timezone.localdate())
+        credit.monthly_payment = money(state['payment'][0])
+        credit.remaining_amount = money(state['remaining'][0])
+        credit.status = str(_statuses(state)[0])
+        credit.save(update_fields=['paid_amount', 'monthly_payment', 'remaining_amount', 'status'])
+        db_transaction.on_commit(lambda: invalidate_credits([credit.id]), robust=True)
+    return credit
@@ -0,0 +1,183 @@
+"""
+Начисление процентов по депозитам и выплата по окончании срока.
+
+Команда accrue_deposit_interest проходит действующие депозиты, по которым
+проценты начислены не по дату расчета, порциями по id; каждая порция — одна
+транзакция БД (строки депозитов блокируются, SKIP LOCKED — параллельный
+запуск их пропустит). Поля порции загружаются в массивы NumPy, и расчет
+идет сразу по всем депозитам порции:
+- проценты простые, по дням: amount * rate / 100 * дни / DAYS_IN_YEAR,
+  где дни считаются от start_date до даты расчета, но не дальше end_date;
+- начисленное нарастающим итогом округляется до копеек целиком, а
+  приращение — разность с уже начисленным, поэтому округления не копятся
+  и результат не зависит от того, ежедневно идет расчет или с пропусками;
+- депозит, у которого наступил end_date, выплачивается на его карту:
+  тело и проценты — двумя операциями 'deposit'; если карта заблокирована,
+  выплата откладывается до следующего запуска.
+
+Результат пишется пачками: accrued_interest / accrued_through — одним
+upsert, строки журнала DepositAccrual и Transaction — bulk_create,
+балансы карт — одним UPDATE. Журнал хранит по строке на запуск (период,
+сумма, итог), его читает страница депозита. Повторный запуск с той же
+датой ничего не начисляет.
+"""
+from collections import defaultdict
+from datetime import date
+
+import numpy as np
+from django.db import transaction as db_transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from .batching import cents, money, run_chunks, upsert
+from .ledger import record_postings
+from .models import BankCard, Deposit, DepositAccrual, Transaction
+from .statements import invalidate_cards
+from .stats import record_transactions
+
+DAYS_IN_YEAR = 365
+
+RESULT_FIELDS = ('deposits', 'accrued', 'interest', 'matured', 'deferred', 'transactions', 'paid_out')
+
+_FIELDS = ('id', 'client_id', 'card_id', 'amount', 'interest_rate', 'start_date', 'end_date',
+           'accrued_interest', 'accrued_through', 'term_months', 'created_at')
+
+
+def due_deposits(accrual_date):
+    """Действующие депозиты, по которым к accrual_date есть что начислить или выплатить"""
+    return Deposit.objects.filter(is_active=True).filter(
+        Q(accrued_through__isnull=True) | Q(accrued_through__lt=accrual_date)
+    )
+
+
+def compute_accrual(amount, rate, start, end, accrued, accrual_date):
+    """
+    Векторный расчет по массивам порции (суммы — в копейках, ставка — в
+    сотых долях процента, даты — порядковые номера дней). Возвращает
+    (день, по который начислено; начислено итогом, копеек; признак окончания срока).
+    """
+    through = np.minimum(end, accrual_date)
+    days = np.maximum(through - start, 0)
+    # Округление половины вверх в целых числах Python: произведение может не уместиться
+    # в int64, а во float64 теряет точность уже после 2**53
+    scale = DAYS_IN_YEAR * 10_000
+    total = ((amount.astype(object) * rate * days * 2 + scale) // (2 * scale)).astype(np.int64)
+    # Проценты не уменьшаются, даже если ставку депозита понизили задним числом
+    return through, np.maximum(total, accrued), end <= accrual_date
+
+
+def accrue_chunk(deposit_ids, accrual_date):
+    """
+    Начисляет проценты и выплачивает депозиты с наступившим сроком одной
+    транзакцией БД. Возвращает {поле RESULT_FIELDS: значение}.
+    """
+    result = dict.fromkeys(RESULT_FIELDS, 0)
+    with db_transaction.atomic():
+        rows = list(
+            due_deposits(accrual_date).filter(id__in=deposit_ids)
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list(*_FIELDS)
+        )
+        if not rows:
+            return result
+        result['deposits'] = len(rows)
+        ids, client_ids, card_ids, amounts, rates, starts, ends, accrued, accrued_through, _, _ = zip(*rows)
+
+        start = np.array([day.toordinal() for day in starts], dtype=np.int64)
+        end = np.array([day.toordinal() for day in ends], dtype=np.int64)
+        previous = np.array(
+            [day.toordinal() if day else start[i] for i, day in enumerate(accrued_through)], dtype=np.int64
+        )
+        accrued_cents = cents(accrued)
+        through, total, matured = compute_accrual(
+            cents(amounts), cents(rates), start, end, accrued_cents, accrual_date.toordinal(),
+        )
+        delta = total - accrued_cents
+        advanced = np.flatnonzero(through > previous)
+        credited = np.flatnonzero(delta > 0)
+
+        upsert(Deposit, [
+            Deposit(**dict(zip(_FIELDS, rows[i]), accrued_interest=money(total[i]),
+                           accrued_through=date.fromordinal(int(through[i]))))
+            for i in advanced
+        ], ['accrued_interest', 'accrued_through'])
+        DepositAccrual.objects.bulk_create([
+            DepositAccrual(
+                deposit_id=ids[i],
+                period_start=date.fromordinal(int(previous[i]) + 1),
+                period_end=date.fromordinal(int(through[i])),
+                amount=money(delta[i]),
+                total=money(total[i]),
+            )
+            for i in credited
+        ])
+        result['accrued'] = len(credited)
+        result['interest'] = money(delta[credited].sum())
+
+        matured_rows = np.flatnonzero(matured)
+        if matured_rows.size:
+            _pay_out(matured_rows, ids, client_ids, card_ids, amounts, total, result)
+    return result
+
+
+def _pay_out(indices, ids, client_ids, card_ids, amounts, total, result):
+    """Выплата тела и процентов на карты депозитов (карты блокируются в порядке id)"""
+    result['matured'] = len(indices)
+    active = set(
+        BankCard.objects.select_for_update()
+        .filter(id__in=sorted({card_ids[i] for i in indices}), is_active=True)
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+    now = timezone.now()
+    paid = []
+    credits = defaultdict(int)
+    transactions = []
+    for i in indices:
+        card_id = card_ids[i]
+        if card_id not in active:
+            result['deferred'] += 1
+            continue
+        interest = money(total[i])
+        payouts = [(amounts[i], f'Возврат вклада по депозиту #{ids[i]}')]
+        if interest:
+            payouts.append((interest, f'Проценты по депозиту #{ids[i]}'))
+        for amount, description in payouts:
+            transactions.append(Transaction(
+                to_card_id=card_id,
+                to_client_id=client_ids[i],
+                amount=amount,
+                transaction_type='deposit',
+                description=description,
+                status='completed',
+                completed_at=now,
+            ))
+            credits[card_id] += amount
+        paid.append(ids[i])
+    if not paid:
+        return
+
+    BankCard.objects.filter(id__in=credits).update(balance=F('balance') + Case(
+        *[When(id=card_id, then=Value(amount)) for card_id, amount in credits.items()],
+        output_field=DecimalField(max_digits=15, decimal_places=2),
+    ))
+    Deposit.objects.filter(id__in=paid).update(is_active=False)
+    Transaction.objects.bulk_create(transactions)
+    record_postings(transactions)
+    record_transactions(transactions)
+    touched = sorted(credits)
+    db_transaction.on_commit(lambda: invalidate_cards(touched), robust=True)
+    result['transactions'] = len(transactions)
+    result['paid_out'] = sum(credits.values())
+
+
+def run_accrual(accrual_date, chunk_size=5000, progress=None):
+    """
+    Начисляет проценты по всем действующим депозитам к accrual_date порциями
+    по chunk_size. Возвращает итог {поле RESULT_FIELDS: значение};
+    progress(итог) вызывается после каждой порции.
+    """
+    return run_chunks(
+        due_deposits(accrual_date), lambda ids: accrue_chunk(ids, accrual_date), RESULT_FIELDS, chunk_size, progress,
+    )
@@ -0,0 +1,122 @@
+"""
+Счетчики услуг каталога по фасетам (ServiceFacet): категория × ценовой
+диапазон PRICE_BUCKETS × признак активности.
+
+Счетчики обновляются при записи услуги (сигналы dbo/signals.py, в
+транзакции вызывающего кода, если она есть) через UPDATE ... SET count =
+count + delta: создание услуги добавляет 1 в ее фасет, удаление вычитает,
+изменение категории, цены или активности переносит 1 из старого фасета в
+новый. Каталог читает все счетчики одним запросом (facet_counts).
+Массовые bulk_create / update сигналов не вызывают — после них, как и для
+проверки, счетчики пересчитывает команда rebuild_service_facets. Вычитание
+из счетчика меньше delta не выполняется и пишется в лог как расхождение.
+"""
+import logging
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+
+from .models import Service, ServiceFacet
+
+PRICE_BUCKETS = {
+    'free': Q(price=0),
+    'low': Q(price__gt=0, price__lte=1000),
+    'medium': Q(price__gt=1000, price__lte=5000),
+    'high': Q(price__gt=5000),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def price_bucket(price):
+    """Ценовой диапазон цены (границы — как в PRICE_BUCKETS); None — отрицательная цена"""
+    price = Decimal(price)
+    if price < 0:
+        return None
+    if price == 0:
+        return 'free'
+    if price <= 1000:
+        return 'low'
+    if price <= 5000:
+        return 'medium'
+    return 'high'
+
+
+def facet_key(service):
+    """Фасет услуги: (category_id, ценовой диапазон, is_active)"""
+    return service.category_id, price_bucket(service.price), bool(service.is_active)
+
+
+def apply_deltas(deltas):
+    """
+    Применяет приращения {фасет: delta} к счетчикам в порядке ключей, чтобы
+    параллельные записи не взаимоблокировались. Строка фасета создается
+    при первом положительном приращении.
+    """
+    for key in sorted(key for key, delta in deltas.items() if delta and key[1] is not None):
+        category_id, bucket, is_active = key
+        delta = deltas[key]
+        rows = ServiceFacet.objects.filter(category_id=category_id, price_bucket=bucket, is_active=is_active)
+        if delta < 0:
+            if not rows.filter(count__gte=-delta).update(count=F('count') + delta):
+                logger.warning('Счетчик фасета %s меньше %s, нужен rebuild_service_facets', key, -delta)
+            continue
+        if not rows.update(count=F('count') + delta):
+            ServiceFacet.objects.bulk_create(
+                [ServiceFacet(category_id=category_id, price_bucket=bucket, is_active=is_active)],
+                ignore_conflicts=True,
+            )
+            rows.update(count=F('count') + delta)
+
+
+def facet_counts():
+    """Все счетчики одним запросом: {(category_id, ценовой диапазон, is_active): count}"""
+    return {
+        (category_id, bucket, is_active): count
+        for category_id, bucket, is_active, count in ServiceFacet.objects.filter(count__gt=0).values_list(
+            'category_id', 'price_bucket', 'is_active', 'count'
+        )
+    }
+
+
+def compute_facets():
+    """Счетчики по таблице услуг одним сгруппированным запросом"""
+    bucket = Case(
+        *[When(condition, then=Value(name)) for name, condition in PRICE_BUCKETS.items()],
+        output_field=CharField(),
+    )
+    rows = (
+        Service.objects.annotate(bucket=bucket)
+        .filter(bucket__isnull=False)
+        .values('category_id', 'bucket', 'is_active')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    counts = defaultdict(int)
+    for row in rows:
+        counts[(row['category_id'], row['bucket'], row['is_active'])] += row['count']
+    return counts
+
+
+def rebuild_facets():
+    """Перезаписывает счетчики пересчетом по таблице услуг; возвращает число фасетов"""
+    counts = compute_facets()
+    with db_transaction.atomic():
+        ServiceFacet.objects.bulk_create(
+            [
+                ServiceFacet(category_id=category_id, price_bucket=bucket, is_active=is_active, count=count)
+                for (category_id, bucket, is_active), count in sorted(counts.items())
+            ],
+            update_conflicts=True,
+            unique_fields=['category', 'price_bucket', 'is_active'],
+            update_fields=['count'],
+        )
+        stale = [
+            facet_id
+            for facet_id, *key in ServiceFacet.objects.values_list('id', 'category_id', 'price_bucket', 'is_active')
+            if tuple(key) not in counts
+        ]
+        ServiceFacet.objects.filter(id__in=stale).update(count=0)
+    return len(counts)
@@ -0,0 +1,313 @@
+"""
+Групповая фиксация переводов (TRANSFER_BATCHING).
+
+Вместо отдельной транзакции БД на каждый запрос операции ставятся в очередь
+процесса; фоновый поток собирает их в пачку (окно TRANSFER_BATCH_WINDOW_MS,
+не более TRANSFER_BATCH_MAX_SIZE операций) и проводит одной транзакцией:
+строки всех затронутых карт блокируются в порядке id, проверки баланса,
+активности и дневного лимита выполняются по очереди поступления по
+заблокированным значениям, затем суммарные изменения балансов всех
+карт записываются одним UPDATE, счетчики дневных лимитов — одним upsert,
+все Transaction — одним bulk_create, журнал и статистика — одним вызовом
+на пачку. Отклоненная операция не мешает остальным: каждый ожидающий
+запрос получает свой результат или исключение (те же, что у
+post_transaction). Если транзакция пачки не удалась целиком, операции
+проводятся по одной через post_transaction; ошибка после фиксации пачки
+(например, в обработчике on_commit) повторной проводки не вызывает.
+
+Запрос ждет свою пачку не дольше TRANSFER_BATCH_TIMEOUT. Если поток пачек
+за это время не взял операцию (завис или упал), запрос отменяет ее (Future
+в ожидании отменяется, поток отмененные пропускает) и проводит перевод сам
+через post_transaction. Операцию, уже взятую в пачку, отменить нельзя:
+тогда запрос дожидается результата пачки, иначе перевод мог бы пройти
+дважды. Упавший поток перезапускается при следующей операции.
+
+Пачки набираются только при параллельных запросах в одном процессе, то есть
+при Gunicorn с потоками (--threads); в синхронных воркерах режим лишь
+добавляет задержку окна.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.db import close_old_connections, transaction as db_transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from .hot_accounts import fold
+from .idempotency import mark_committed
+from .ledger import record_postings
+from .limits import LIMITED_TYPES, spend_day
+from .models import BankCard, CardDailySpend, Transaction
+from .posting import (
+    DailyLimitExceeded, InsufficientFunds, PostingError, post_transaction, reserved_amounts, validate_operation,
+)
+from .settlement import submit_transfer
+from .statements import invalidate_cards
+from .stats import record_transactions
+
+logger = logging.getLogger(__name__)
+
+
+class _Operation:
+    __slots__ = ('transaction_type', 'amount', 'from_id', 'to_id', 'description', 'currency', 'future')
+
+    def __init__(self, transaction_type, amount, from_id, to_id, description, currency):
+        self.transaction_type = transaction_type
+        self.amount = amount
+        self.from_id = from_id
+        self.to_id = to_id
+        self.description = description
+        self.currency = currency
+        self.future = Future()
+
+    @property
+    def card_ids(self):
+        return [card_id for card_id in (self.from_id, self.to_id) if card_id is not None]
+
+
+def _reject(operation, locked, balances, reserved, spent, day_limits):
+    """Причина отказа (исключение) или None, если операцию можно провести"""
+    for card_id in operation.card_ids:
+        if card_id not in locked or not locked[card_id][0]:
+            return PostingError('Карта не найдена или заблокирована')
+    if operation.from_id is None:
+        return None
+    if balances[operation.from_id] - reserved.get(operation.from_id, 0) < operation.amount:
+        return InsufficientFunds('Недостаточно средств на счете')
+    if operation.transaction_type in LIMITED_TYPES:
+        limit = day_limits[operation.from_id]
+        if spent[operation.from_id] + operation.amount > limit:
+            return DailyLimitExceeded('Превышен дневной лимит по карте')
+    return None
+
+
+def apply_batch(operations):
+    """
+    Проводит пачку одной транзакцией БД. Возвращает список результатов по
+    порядку операций: (Transaction, {card_id: баланс после пачки}) или исключение.
+    """
+    card_ids = sorted({card_id for operation in operations for card_id in operation.card_ids})
+    day = spend_day()
+    with db_transaction.atomic():
+        rows = list(
+            BankCard.objects.select_for_update()
+            .filter(id__in=card_ids)
+            .order_by('id')
+            .values_list('id', 'is_active', 'client_id', 'balance', 'daily_limit', 'balance_shards')
+        )
+        locked = {row[0]: (row[1], row[2]) for row in rows}
+        balances = {row[0]: row[3] for row in rows}
+        day_limits = {row[0]: row[4] for row in rows}
+        # Строки горячих карт переносятся сразу: карты заблокированы, и дальше пачка
+        # работает с полными балансами (dbo/hot_accounts.py)
+        for card_id in [row[0] for row in rows if row[5]]:
+            balances[card_id] += fold(card_id)
+        reserved = reserved_amounts(card_ids)
+        spent = defaultdict(
+            lambda: 0,
+            CardDailySpend.objects.filter(card_id__in=locked, day=day).values_list('card_id', 'amount'),
+        )
+
+        now = timezone.now()
+        results = []
+        accepted = []
+        deltas = defaultdict(int)
+        spend = set()
+        for operation in operations:
+            error = _reject(operation, locked, balances, reserved, spent, day_limits)
+            if error is not None:
+                results.append(error)
+                continue
+            if operation.from_id is not None:
+                balances[operation.from_id] -= operation.amount
+                deltas[operation.from_id] -= operation.amount
+                if operation.transaction_type in LIMITED_TYPES:
+                    spent[operation.from_id] += operation.amount
+                    spend.add(operation.from_id)
+            if operation.to_id is not None:
+                balances[operation.to_id] += operation.amount
+                deltas[operation.to_id] += operation.amount
+            tx = Transaction(
+                from_card_id=operation.from_id,
+                to_card_id=operation.to_id,
+                from_client_id=locked[operation.from_id][1] if operation.from_id is not None else None,
+                to_client_id=locked[operation.to_id][1] if operation.to_id is not None else None,
+                amount=operation.amount,
+                currency=operation.currency,
+                transaction_type=operation.transaction_type,
+                description=operation.description,
+                status='completed',
+                completed_at=now,
+            )
+            accepted.append(tx)
+            results.append(tx)
+
+        changed = {card_id: delta for card_id, delta in deltas.items() if delta}
+        if changed:
+            # Суммарное изменение каждой карты — одним UPDATE на всю пачку
+            BankCard.objects.filter(id__in=changed).update(balance=F('balance') + Case(
+                *[When(id=card_id, then=Value(delta)) for card_id, delta in changed.items()],
+                output_field=DecimalField(max_digits=15, decimal_places=2),
+            ))
+        if spend:
+            # Счетчики известны под блокировкой карт: записываем итог одним upsert
+            CardDailySpend.objects.bulk_create(
+                [CardDailySpend(card_id=card_id, day=day, amount=spent[card_id]) for card_id in sorted(spend)],
+                update_conflicts=True,
+                unique_fields=['card', 'day'],
+                update_fields=['amount', 'updated_at'],
+            )
+        if accepted:
+            Transaction.objects.bulk_create(accepted)
+            record_postings(accepted)
+            record_transactions(accepted)
+            touched = sorted(deltas)
+            db_transaction.on_commit(lambda: invalidate_cards(touched), robust=True)
+
+    return [
+        result if isinstance(result, Exception)
+        else (result, {card_id: balances[card_id] for card_id in operation.card_ids})
+        for operation, result in zip(operations, results)
+    ]
+
+
+def _apply_one(operation):
+    from_card = BankCard(pk=operation.from_id) if operation.from_id is not None else None
+    to_card = BankCard(pk=operation.to_id) if operation.to_id is not None else None
+    try:
+        tx = post_transaction(
+            operation.transaction_type, operation.amount, from_card=from_card, to_card=to_card,
+            description=operation.description, currency=operation.currency,
+        )
+    except Exception as e:
+        return e
+    return tx, {card.pk: card.balance for card in (from_card, to_card) if card is not None}
+
+
+class TransferBatcher:
+    """Очередь операций процесса и фоновый поток, проводящий их пачками"""
+
+    def __init__(self, window, max_size):
+        self.window = window
+        self.max_size = max_size
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+
+    def submit(self, operation):
+        self._ensure_thread()
+        self._queue.put(operation)
+        return operation.future
+
+    def _ensure_thread(self):
+        # После fork поток родителя в дочернем процессе не существует
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='transfer-batcher', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_size:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Операции, отмененные по таймауту ожидания, запрос уже провел сам
+            batch = [operation for operation in self._collect() if operation.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            committed = []
+            try:
+                close_old_connections()
+                with db_transaction.atomic():
+                    # Первый обработчик фиксации: дальше пачка проведена, и повторять ее нельзя
+                    db_transaction.on_commit(lambda: committed.append(True))
+                    results = apply_batch(batch)
+            except Exception:
+                if committed:
+                    logger.exception('Ошибка после фиксации пачки переводов')
+                else:
+                    results = [_apply_one(operation) for operation in batch]
+            for operation, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    operation.future.set_exception(result)
+                else:
+                    operation.future.set_result(result)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = TransferBatcher(settings.TRANSFER_BATCH_WINDOW_MS / 1000, settings.TRANSFER_BATCH_MAX_SIZE)
+        return _batcher
+
+
+def post_batched(transaction_type, amount, from_card=None, to_card=None, description='', currency='RUB'):
+    """
+    То же, что post_transaction, но операция проводится в составе пачки:
+    вызов блокируется до фиксации пачки и возвращает Transaction или
+    выбрасывает InsufficientFunds / DailyLimitExceeded / PostingError.
+    """
+    amount = validate_operation(amount, from_card, to_card)
+    operation = _Operation(
+        transaction_type, amount,
+        from_card.pk if from_card is not None else None,
+        to_card.pk if to_card is not None else None,
+        description, currency,
+    )
+    future = get_batcher().submit(operation)
+    try:
+        tx, balances = future.result(timeout=settings.TRANSFER_BATCH_TIMEOUT)
+    except FutureTimeout:
+        if future.cancel():
+            return post_transaction(transaction_type, amount, from_card=from_card, to_card=to_card,
+                                    description=description, currency=currency)
+        # Операция уже в пачке: ее результат — единственный
+        tx, balances = future.result()
+    mark_committed()
+    for card in (from_card, to_card):
+        if card is not None:
+            card.balance = balances[card.pk]
+    return tx
+
+
+def post_transfer(transaction_type, amount, from_card=None, to_card=None, description='', currency='RUB'):
+    """
+    Проводка перевода: при TRANSFER_SETTLEMENT — запись в статусе pending до
+    расчета (dbo/settlement.py), при TRANSFER_BATCHING — пачкой, иначе
+    отдельной транзакцией. Внутри открытой транзакции вызывающего пачки не
+    используются: поток пачек работает через свое соединение и не видит
+    незафиксированных данных.
+    """
+    if settings.TRANSFER_SETTLEMENT:
+        post = submit_transfer
+    elif settings.TRANSFER_BATCHING and not db_transaction.get_connection().in_atomic_block:
+        post = post_batched
+    else:
+        post = post_transaction
+    return post(transaction_type, amount, from_card=from_card, to_card=to_card,
+                description=description, currency=currency)
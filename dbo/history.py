@@ -0,0 +1,61 @@
+"""
+История операций клиента.
+
+Выборки идут по денормализованным Transaction.from_client / to_client:
+каждая сторона читается своим индексом (client, -created_at, -id),
+а результаты сливаются — вместо OR через два JOIN по BankCard.
+
+Период задается полуоткрытым диапазоном по created_at (а не __date),
+чтобы PostgreSQL отсекал лишние помесячные секции (dbo/partitioning.py).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Transaction
+from .pagination import KeysetPaginator
+
+
+def client_history_branches(client):
+    """Условия исходящих и входящих операций клиента (ветки для KeysetPaginator)"""
+    return [Q(from_client=client), Q(to_client=client)]
+
+
+def client_transactions(client):
+    """Все операции клиента одним QuerySet (для агрегатов и экспорта)"""
+    return Transaction.objects.filter(Q(from_client=client) | Q(to_client=client))
+
+
+def client_history_paginator(client, per_page, queryset=None, **kwargs):
+    """KeysetPaginator по истории клиента; queryset — дополнительные фильтры и select_related"""
+    if queryset is None:
+        queryset = Transaction.objects.all()
+    return KeysetPaginator(queryset, per_page, branches=client_history_branches(client), **kwargs)
+
+
+def latest_client_transactions(client, limit, queryset=None):
+    """Последние limit операций клиента"""
+    return client_history_paginator(client, limit, queryset).get_page().object_list
+
+
+def period_filter(date_from=None, date_to=None):
+    """
+    Условие на created_at для периода из строк YYYY-MM-DD (обе границы
+    включительно, по текущему часовому поясу). Строки не в формате
+    YYYY-MM-DD игнорируются; несуществующая дата в этом формате
+    (2024-02-30) — ValueError. Конец периода 9999-12-31 не ограничивает
+    выборку сверху: следующий день вышел бы за пределы datetime.
+    """
+    condition = Q()
+    start = parse_date(date_from) if date_from else None
+    end = parse_date(date_to) if date_to else None
+    if start:
+        condition &= Q(created_at__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end:
+        try:
+            condition &= Q(created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+        except OverflowError:
+            pass
+    return condition
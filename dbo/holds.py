@@ -0,0 +1,354 @@
+"""
+Авторизация покупок по карте: удержания (холды) в памяти процесса.
+
+Авторизация не обращается к БД: HoldBook хранит для каждой карты снимок
+доступных средств (баланс минус резерв — dbo/posting.reserved_amounts) и
+остатка дневного лимита и уменьшает их под блокировкой процесса. Одобренное
+удержание получает hold_id сразу и попадает в очередь; фоновый поток раз в
+HOLD_FLUSH_INTERVAL_MS записывает очередь в CardHold одним bulk_create.
+Записанные удержания входят в резерв карты, поэтому их видят
+обычные списания и снимки других процессов.
+
+Снимок карты загружается при первой авторизации, а затем тот же поток
+после записи очереди перечитывает одним запросом снимки старше
+HOLD_SNAPSHOT_TTL секунд (так становятся видны пополнения и списания через
+другие каналы). Снимки читаются под блокировкой записи очереди, поэтому
+удержание не учитывается дважды и не теряется между снимком и очередью. Процессы не видят
+незаписанные удержания друг друга: при нескольких воркерах карта может быть
+переавторизована в пределах интервала записи и TTL снимка — тогда
+списание такого удержания отклоняется (InsufficientFunds), а удержание
+остается активным до отмены.
+
+Списание (capture_holds) и отмена (release_holds) выполняются пачками и
+превращают удержания в строки Transaction: списание — платеж (completed) с
+журналом, статистикой и счетчиком дневного лимита, отмена — операция в
+статусе cancelled без движения денег; строки CardHold при этом удаляются. Незаписанные удержания при остановке процесса теряются
+вместе с резервом; деньги по ним не списываются.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import close_old_connections, transaction as db_transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from django.utils import timezone
+
+from .hot_accounts import card_balances, fold
+from .ledger import record_postings
+from .limits import add_spend, spend_day, spent
+from .models import BankCard, CardHold, Transaction
+from .posting import DailyLimitExceeded, InsufficientFunds, PostingError, reserved_amounts
+from .statements import invalidate_cards
+from .stats import record_transactions
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+
+
+class _CardState:
+    __slots__ = ('user_id', 'is_active', 'available', 'limit_left', 'unflushed', 'loaded_at')
+
+
+def _load_states(card_ids):
+    """Снимки карт по БД: {card_id: _CardState} (без незаписанных удержаний)"""
+    rows = list(
+        BankCard.objects.filter(id__in=card_ids).values_list('id', 'client__user_id', 'is_active', 'daily_limit')
+    )
+    card_ids = [row[0] for row in rows]
+    balances = card_balances(card_ids)
+    reserved = reserved_amounts(card_ids)
+    held = dict(
+        CardHold.objects.filter(card_id__in=card_ids)
+        .values('card_id').annotate(total=Sum('amount')).values_list('card_id', 'total').order_by()
+    )
+    now = time.monotonic()
+    states = {}
+    for card_id, user_id, is_active, daily_limit in rows:
+        state = _CardState()
+        state.user_id = user_id
+        state.is_active = is_active
+        state.available = balances[card_id] - reserved.get(card_id, 0)
+        # Активные удержания еще не учтены в счетчике дневного лимита
+        state.limit_left = daily_limit - spent(card_id) - held.get(card_id, 0)
+        state.unflushed = Decimal('0')
+        state.loaded_at = now
+        states[card_id] = state
+    return states
+
+
+class HoldBook:
+    """Удержания процесса: снимки карт, очередь записи и фоновый поток записи"""
+
+    def __init__(self, flush_interval, snapshot_ttl):
+        self.flush_interval = flush_interval
+        self.snapshot_ttl = snapshot_ttl
+        self._cards = {}
+        self._queue = []
+        self._lock = threading.Lock()
+        # Запись очереди и чтение снимков не пересекаются
+        self._flush_lock = threading.Lock()
+        self._pid = None
+
+    def authorize(self, card_id, amount, merchant='', user_id=None):
+        """
+        Одобряет покупку и возвращает hold_id (uuid.UUID). При отказе
+        выбрасывает InsufficientFunds / DailyLimitExceeded / PostingError.
+        user_id — владелец карты (чужая карта считается не найденной).
+        """
+        try:
+            amount = Decimal(str(amount))
+            # NaN проходит quantize и падает только при сравнении
+            if not amount.is_finite():
+                raise InvalidOperation
+            amount = amount.quantize(CENT)
+        except InvalidOperation:
+            raise PostingError('Некорректная сумма операции')
+        if amount <= 0:
+            raise PostingError('Сумма операции должна быть положительной')
+        self._ensure_thread()
+        self._state(card_id)
+        with self._lock:
+            # Снимок берется заново под блокировкой: его могли перечитать
+            state = self._cards.get(card_id)
+            if state is None or not state.is_active or (user_id is not None and state.user_id != user_id):
+                raise PostingError('Карта не найдена или заблокирована')
+            if state.available < amount:
+                raise InsufficientFunds('Недостаточно средств на счете')
+            if state.limit_left < amount:
+                raise DailyLimitExceeded('Превышен дневной лимит по карте')
+            state.available -= amount
+            state.limit_left -= amount
+            state.unflushed += amount
+            hold_id = uuid.uuid4()
+            self._queue.append((hold_id, card_id, amount, merchant, timezone.now()))
+        return hold_id
+
+    def available(self, card_id):
+        """Доступные средства карты по снимку процесса"""
+        state = self._state(card_id)
+        return state.available if state is not None else None
+
+    def _state(self, card_id):
+        state = self._cards.get(card_id)
+        if state is None:
+            with self._flush_lock:
+                self._load([card_id])
+            state = self._cards.get(card_id)
+        return state
+
+    def load(self, card_ids):
+        """Загружает снимки карт (заранее, чтобы первая авторизация не ждала БД)"""
+        with self._flush_lock:
+            for start in range(0, len(card_ids), 1000):
+                self._load(card_ids[start:start + 1000])
+
+    def _load(self, card_ids):
+        # Вызывается под _flush_lock: очередь в это время не записывается
+        states = _load_states(card_ids)
+        with self._lock:
+            for card_id in card_ids:
+                loaded = states.get(card_id)
+                previous = self._cards.pop(card_id, None)
+                if loaded is None:
+                    continue
+                # Незаписанные удержания в снимок БД еще не вошли
+                if previous is not None and previous.unflushed:
+                    loaded.unflushed = previous.unflushed
+                    loaded.available -= previous.unflushed
+                    loaded.limit_left -= previous.unflushed
+                self._cards[card_id] = loaded
+
+    def refresh(self):
+        """Перечитывает снимки старше snapshot_ttl"""
+        deadline = time.monotonic() - self.snapshot_ttl
+        with self._lock:
+            stale = [card_id for card_id, state in self._cards.items() if state.loaded_at < deadline]
+        if stale:
+            self.load(stale)
+
+    def invalidate(self, card_ids):
+        """
+        Помечает снимки карт устаревшими (после списания или отмены удержаний):
+        поток записи перечитает их вместе с вернувшимся резервом
+        """
+        with self._lock:
+            for card_id in card_ids:
+                state = self._cards.get(card_id)
+                if state is not None:
+                    state.loaded_at = float('-inf')
+
+    def flush(self):
+        """Записывает очередь удержаний в CardHold; возвращает число записанных"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._queue = self._queue, []
+            if not batch:
+                return 0
+            try:
+                CardHold.objects.bulk_create([
+                    CardHold(hold_id=hold_id, card_id=card_id, amount=amount, merchant=merchant, created_at=created_at)
+                    for hold_id, card_id, amount, merchant, created_at in batch
+                ])
+            except Exception:
+                # Одобренные удержания не теряются: вернутся в очередь до следующей записи
+                with self._lock:
+                    self._queue[:0] = batch
+                raise
+            with self._lock:
+                for _, card_id, amount, _, _ in batch:
+                    state = self._cards.get(card_id)
+                    if state is not None:
+                        state.unflushed -= amount
+            return len(batch)
+
+    def _ensure_thread(self):
+        # После fork поток родителя в дочернем процессе не существует
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._cards = {}
+                self._queue = []
+                threading.Thread(target=self._run, name='hold-flusher', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                close_old_connections()
+                self.flush()
+                self.refresh()
+            except Exception:
+                logger.exception('Не удалось записать удержания по картам')
+
+
+_book = None
+_book_lock = threading.Lock()
+
+
+def get_hold_book():
+    global _book
+    with _book_lock:
+        if _book is None:
+            _book = HoldBook(settings.HOLD_FLUSH_INTERVAL_MS / 1000, settings.HOLD_SNAPSHOT_TTL)
+        return _book
+
+
+def authorize(card_id, amount, merchant='', user_id=None):
+    """Авторизация покупки по карте; см. HoldBook.authorize"""
+    return get_hold_book().authorize(card_id, amount, merchant=merchant, user_id=user_id)
+
+
+def _active_holds(hold_ids, user_id):
+    holds = CardHold.objects.select_for_update(of=('self',)).filter(hold_id__in=hold_ids)
+    if user_id is not None:
+        holds = holds.filter(card__client__user_id=user_id)
+    return list(holds.select_related('card').order_by('id'))
+
+
+def _hold_transaction(hold, amount, status, now):
+    if status == 'completed':
+        description = f'Покупка: {hold.merchant}' if hold.merchant else 'Покупка по карте'
+    else:
+        description = f'Отмена покупки: {hold.merchant}' if hold.merchant else 'Отмена покупки по карте'
+    return Transaction(
+        from_card_id=hold.card_id,
+        from_client_id=hold.card.client_id,
+        amount=amount,
+        transaction_type='payment',
+        description=description,
+        status=status,
+        completed_at=now if status == 'completed' else None,
+    )
+
+
+def capture_holds(hold_ids, amounts=None, user_id=None):
+    """
+    Списывает удержания одной транзакцией БД: платеж на сумму из amounts
+    {hold_id: сумма} (не больше удержания) или на всю сумму удержания.
+    Возвращает {hold_id: Transaction или исключение}; несуществующие и
+    чужие удержания в результат не попадают.
+    """
+    amounts = amounts or {}
+    book = get_hold_book()
+    book.flush()
+    results = {}
+    with db_transaction.atomic():
+        holds = _active_holds(hold_ids, user_id)
+        if not holds:
+            return results
+        card_ids = sorted({hold.card_id for hold in holds})
+        rows = list(
+            BankCard.objects.select_for_update().filter(id__in=card_ids).order_by('id')
+            .values_list('id', 'is_active', 'balance', 'balance_shards')
+        )
+        active = {card_id: is_active for card_id, is_active, _, _ in rows}
+        balances = {card_id: balance for card_id, _, balance, _ in rows}
+        for card_id in [row[0] for row in rows if row[3]]:
+            balances[card_id] += fold(card_id)
+        reserved = reserved_amounts(card_ids)
+        available = {card_id: balances[card_id] - reserved.get(card_id, 0) for card_id in balances}
+
+        now = timezone.now()
+        captured = []
+        debits = defaultdict(int)
+        for hold in holds:
+            amount = Decimal(str(amounts.get(hold.hold_id, hold.amount))).quantize(CENT)
+            if amount <= 0 or amount > hold.amount:
+                results[hold.hold_id] = PostingError('Сумма списания должна быть от 0 до суммы удержания')
+                continue
+            if not active.get(hold.card_id):
+                results[hold.hold_id] = PostingError('Карта не найдена или заблокирована')
+                continue
+            # Резерв самого удержания снимается вместе со списанием
+            if available[hold.card_id] + hold.amount < amount:
+                results[hold.hold_id] = InsufficientFunds('Недостаточно средств на счете')
+                continue
+            available[hold.card_id] += hold.amount - amount
+            debits[hold.card_id] += amount
+            results[hold.hold_id] = _hold_transaction(hold, amount, 'completed', now)
+            captured.append(hold)
+
+        if captured:
+            BankCard.objects.filter(id__in=debits).update(balance=F('balance') - Case(
+                *[When(id=card_id, then=Value(amount)) for card_id, amount in debits.items()],
+                output_field=DecimalField(max_digits=15, decimal_places=2),
+            ))
+            add_spend(debits, spend_day(now))
+            transactions = Transaction.objects.bulk_create([results[hold.hold_id] for hold in captured])
+            CardHold.objects.filter(id__in=[hold.id for hold in captured]).delete()
+            record_postings(transactions)
+            record_transactions(transactions)
+            db_transaction.on_commit(lambda: invalidate_cards(sorted(debits)), robust=True)
+        db_transaction.on_commit(lambda: book.invalidate(card_ids), robust=True)
+    return results
+
+
+def release_holds(hold_ids, user_id=None):
+    """
+    Отменяет удержания: резерв снимается, в историю пишется Transaction в
+    статусе cancelled. Возвращает список созданных Transaction.
+    """
+    book = get_hold_book()
+    book.flush()
+    with db_transaction.atomic():
+        holds = _active_holds(hold_ids, user_id)
+        if not holds:
+            return []
+        now = timezone.now()
+        transactions = Transaction.objects.bulk_create(
+            [_hold_transaction(hold, hold.amount, 'cancelled', now) for hold in holds]
+        )
+        CardHold.objects.filter(id__in=[hold.id for hold in holds]).delete()
+        record_transactions(transactions)
+        card_ids = sorted({hold.card_id for hold in holds})
+        db_transaction.on_commit(lambda: invalidate_cards(card_ids), robust=True)
+        db_transaction.on_commit(lambda: book.invalidate(card_ids), robust=True)
+    return transactions
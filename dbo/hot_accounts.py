@@ -0,0 +1,159 @@
+"""
+Горячие карты: зачисления без монопольной блокировки строки карты.
+
+На карту, куда зачисления идут тысячами в минуту (сбор комиссий, популярные
+получатели), каждая проводка брала блокировку строки BankCard и ждала
+предыдущую. У горячей карты (BankCard.balance_shards = N > 0) зачисление
+увеличивает одну из N строк CardBalanceShard, выбранную случайно, а строку
+карты монопольно не блокирует: параллельные зачисления расходятся по разным
+строкам. Туда же одним UPDATE пишется приращение статистики получателя —
+иначе горячей стала бы строка ClientTransactionStats. Чтения складывают
+строки с основными значениями (card_balances, stats.get_client_stats).
+
+Списание с горячей карты, как и раньше, блокирует строку карты; если
+balance не хватает, строки сначала переносятся (fold), поэтому balance не
+уходит в минус. Периодически строки переносит команда fold_balance_shards.
+
+Зачисление берет на строку горячей карты разделяемую блокировку (FOR SHARE,
+lock_shared): зачисления друг другу не мешают, а перенос и смена числа
+строк ждут начатые зачисления, поэтому balance_shards во время зачисления
+не меняется. Порядок блокировок: сначала строки карт, затем строки
+CardBalanceShard.
+"""
+import random
+from decimal import Decimal
+
+from django.db import connection, transaction as db_transaction
+from django.db.models import F, Sum
+
+from .models import BankCard, CardBalanceShard, ClientTransactionStats
+from .stats import PENDING_STATS_FIELDS, apply_deltas, compute_stats, store_stats
+
+ZERO = Decimal('0.00')
+DEFAULT_SHARDS = 16
+
+
+def lock_shared(card_id):
+    """
+    (is_active, client_id, balance_shards) карты под разделяемой блокировкой
+    (FOR SHARE) или None. Зачисления друг друга не ждут, а перенос и смена
+    числа строк (FOR UPDATE) ждут завершения начатых зачислений.
+    """
+    lock = ' FOR SHARE' if connection.features.has_select_for_update else ''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT is_active, client_id, balance_shards FROM {BankCard._meta.db_table} WHERE id = %s{lock}',
+            [card_id],
+        )
+        return cursor.fetchone()
+
+
+def credit(card_id, shards, amount, stats=None):
+    """
+    Зачисление на горячую карту (в транзакции проводки, после lock_shared).
+    stats — приращения статистики получателя {поле: значение} из PENDING_STATS_FIELDS.
+    """
+    changes = {'amount': F('amount') + amount}
+    for field, value in (stats or {}).items():
+        if value:
+            changes[field] = F(field) + value
+    CardBalanceShard.objects.filter(card_id=card_id, shard=random.randrange(shards)).update(**changes)
+
+
+def _take(card_ids):
+    """
+    Блокирует строки карт, обнуляет их и возвращает суммы
+    {card_id: {'amount': ..., поле статистики: ...}}.
+    """
+    fields = ['amount', *PENDING_STATS_FIELDS]
+    rows = list(
+        CardBalanceShard.objects.select_for_update().filter(card_id__in=card_ids).order_by('id')
+        .values('id', 'card_id', *fields)
+    )
+    totals = {}
+    for row in rows:
+        total = totals.setdefault(row['card_id'], dict.fromkeys(fields, 0))
+        for field in fields:
+            total[field] += row[field]
+    dirty = [row['id'] for row in rows if any(row[field] for field in fields)]
+    if dirty:
+        CardBalanceShard.objects.filter(id__in=dirty).update(**dict.fromkeys(fields, 0))
+    return totals
+
+
+def fold(card_id):
+    """
+    Переносит строки карты в balance и в статистику владельца; возвращает
+    перенесенную сумму. Строка карты блокируется первой, затем ее строки.
+    """
+    with db_transaction.atomic():
+        client_id = (
+            BankCard.objects.select_for_update().filter(id=card_id).values_list('client_id', flat=True).first()
+        )
+        total = _take([card_id]).get(card_id)
+        if client_id is None or total is None:
+            return ZERO
+        amount = total.pop('amount')
+        if amount:
+            BankCard.objects.filter(id=card_id).update(balance=F('balance') + amount)
+        if any(total.values()):
+            apply_deltas({client_id: total})
+    return amount
+
+
+def pending_totals(card_ids):
+    """{card_id: сумма неперенесенных зачислений} для карт из card_ids"""
+    return dict(
+        CardBalanceShard.objects.filter(card_id__in=card_ids).values('card_id').annotate(total=Sum('amount'))
+        .values_list('card_id', 'total')
+    )
+
+
+def card_balances(card_ids):
+    """{card_id: баланс} с учетом строк горячих карт"""
+    rows = list(BankCard.objects.filter(id__in=card_ids).values_list('id', 'balance', 'balance_shards'))
+    pending = pending_totals([card_id for card_id, _, shards in rows if shards])
+    return {card_id: balance + pending.get(card_id, ZERO) for card_id, balance, _ in rows}
+
+
+def card_balance(card):
+    """Баланс одной карты с учетом строк (для горячей карты — один дополнительный запрос)"""
+    if not card.balance_shards:
+        return card.balance
+    return card.balance + pending_totals([card.pk]).get(card.pk, ZERO)
+
+
+def rebuild_stats(client_ids):
+    """
+    Пересчитывает статистику клиентов по истории (overwrite) и обнуляет
+    приращения в строках их горячих карт. Строки блокируются до пересчета:
+    зачисление, успевшее увеличить строку, будет зафиксировано и попадет в
+    пересчет, а следующие зачисления подождут и лягут в обнуленные строки.
+    """
+    with db_transaction.atomic():
+        rows = CardBalanceShard.objects.filter(card__client_id__in=client_ids)
+        list(rows.select_for_update(of=('self',)).order_by('id').values_list('id'))
+        store_stats(compute_stats(client_ids), overwrite=True)
+        rows.update(**dict.fromkeys(PENDING_STATS_FIELDS, 0))
+
+
+def set_hot(card_id, shards=DEFAULT_SHARDS):
+    """Включает режим горячей карты с shards строками; shards=0 выключает его"""
+    with db_transaction.atomic():
+        client_id = (
+            BankCard.objects.select_for_update().filter(id=card_id).values_list('client_id', flat=True).first()
+        )
+        if client_id is None:
+            return
+        if shards:
+            if not ClientTransactionStats.objects.filter(pk=client_id).exists():
+                # Строка статистики должна существовать: иначе проводка построит ее
+                # по истории, часть которой уже учтена в строках карты
+                store_stats(compute_stats([client_id]))
+            CardBalanceShard.objects.bulk_create(
+                [CardBalanceShard(card_id=card_id, shard=shard) for shard in range(shards)], ignore_conflicts=True
+            )
+        BankCard.objects.filter(id=card_id).update(balance_shards=shards)
+        fold(card_id)
+        # Зачисления в строки с номером >= shards больше не попадут
+        CardBalanceShard.objects.filter(card_id=card_id, shard__gte=shards).delete()
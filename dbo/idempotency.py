@@ -0,0 +1,259 @@
+"""
+Ключи идемпотентности для операций, двигающих деньги.
+
+Клиент передает ключ в заголовке Idempotency-Key или в поле формы
+idempotency_key. Первый запрос с ключом занимает строку IdempotencyKey
+(уникальна по пользователю и ключу), выполняется и сохраняет ответ;
+повтор с тем же ключом получает сохраненный ответ, не вызывая view и не
+трогая балансы. Пока первый запрос не завершился, повтор получает 409.
+Завершенные ответы неизменны до истечения срока, поэтому перед таблицей
+стоит LRU в памяти процесса. Истекшие ключи удаляет порциями команда
+purge_idempotency_keys.
+
+Ошибка запроса освобождает ключ, только если деньги еще не двигались:
+проводки (dbo/posting.py, dbo/settlement.py, dbo/group_commit.py) после
+фиксации вызывают mark_committed, и тогда ключ сохраняет ответ с ошибкой —
+повтор получит его, а не проведет операцию второй раз. Отказы без
+проводки (ответ 4xx или редирект формы с сообщением об ошибке —
+недостаточно средств, превышен лимит) тоже не сохраняются: страница
+повторяет запрос с тем же ключом, и после пополнения карты он должен
+выполниться, а не получить прежний отказ.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import redirect
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FORM_FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 64
+# Заголовки, которые сохраняются вместе с ответом
+STORED_HEADERS = ('Content-Type', 'Location')
+
+_responses = OrderedDict()
+_responses_lock = threading.Lock()
+# Флаг текущего запроса: его проводка уже зафиксирована
+_local = threading.local()
+
+COMMITTED_ERROR = 'Операция проведена, но ответ не сформирован: проверьте историю операций'
+
+
+def mark_committed():
+    """Отмечает, что текущий запрос зафиксировал проводку (вызывать после фиксации)"""
+    _local.committed = True
+
+
+def request_key(request):
+    """Ключ идемпотентности из заголовка или поля формы (None, если не передан или пуст)"""
+    key = request.headers.get(HEADER)
+    if key is None and request.content_type in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+        key = request.POST.get(FORM_FIELD)
+    # Пустое поле формы (шаблон не передал ключ) — то же, что отсутствие ключа
+    if key is None or not key.strip():
+        return None
+    return key.strip()
+
+
+def is_valid_key(key):
+    return 0 < len(key) <= MAX_KEY_LENGTH and key.isascii() and key.isprintable()
+
+
+def request_fingerprint(request, endpoint):
+    """Отпечаток запроса: тот же ключ с другими параметрами — ошибка клиента"""
+    digest = hashlib.sha256(f'{endpoint}\n{request.path}\n'.encode())
+    if request.content_type in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+        # CSRF-токен в форме маскируется заново при каждом рендере
+        for name, values in sorted(request.POST.lists()):
+            if name != 'csrfmiddlewaretoken':
+                digest.update(f'{name}={values!r}\n'.encode())
+    else:
+        digest.update(request.body)
+    return digest.hexdigest()
+
+
+def _is_ajax(request):
+    return request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.content_type == 'application/json'
+
+
+def _error(request, status, message, redirect_to):
+    if redirect_to is None or _is_ajax(request):
+        return JsonResponse({'success': False, 'error': message}, status=status)
+    messages.error(request, message)
+    return redirect(redirect_to)
+
+
+def _cache_get(user_id, key):
+    with _responses_lock:
+        entry = _responses.get((user_id, key))
+        if entry is None:
+            return None
+        if entry.expires_at <= timezone.now():
+            del _responses[(user_id, key)]
+            return None
+        _responses.move_to_end((user_id, key))
+        return entry
+
+
+def _cache_put(entry):
+    with _responses_lock:
+        _responses[(entry.user_id, entry.key)] = entry
+        _responses.move_to_end((entry.user_id, entry.key))
+        while len(_responses) > settings.IDEMPOTENCY_CACHE_SIZE:
+            _responses.popitem(last=False)
+
+
+def clear_cache():
+    with _responses_lock:
+        _responses.clear()
+
+
+def _claim(user, key, endpoint, fingerprint):
+    """
+    Занимает ключ. Возвращает (запись, True), если запрос нужно выполнить,
+    или (существующая запись, False), если ключ уже использован.
+    """
+    now = timezone.now()
+    fields = {
+        'endpoint': endpoint,
+        'fingerprint': fingerprint,
+        'status_code': None,
+        'headers': {},
+        'content': '',
+        'expires_at': now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+    }
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, **fields), True
+    except IntegrityError:
+        pass
+    existing = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if existing is None:
+        # Строку удалила очистка между вставкой и чтением
+        return _claim(user, key, endpoint, fingerprint)
+    abandoned = existing.status_code is None and existing.created_at <= now - timedelta(
+        seconds=settings.IDEMPOTENCY_LOCK_TIMEOUT
+    )
+    if existing.expires_at <= now or abandoned:
+        # Перехватываем ключ условным UPDATE: из параллельных запросов успеет один
+        taken = IdempotencyKey.objects.filter(pk=existing.pk, created_at=existing.created_at).update(
+            created_at=now, **fields
+        )
+        if taken:
+            existing.created_at = now
+            for name, value in fields.items():
+                setattr(existing, name, value)
+            return existing, True
+        existing.status_code = None
+    return existing, False
+
+
+def _store(record, response):
+    record.status_code = response.status_code
+    record.headers = {name: response[name] for name in STORED_HEADERS if response.has_header(name)}
+    record.content = response.content.decode(response.charset or 'utf-8', errors='replace')
+    IdempotencyKey.objects.filter(pk=record.pk).update(
+        status_code=record.status_code, headers=record.headers, content=record.content
+    )
+    _cache_put(record)
+
+
+def _rejected(request, response):
+    """Отказ в операции: ответ 4xx или редирект формы с сообщением об ошибке"""
+    if 400 <= response.status_code < 500:
+        return True
+    if not 300 <= response.status_code < 400:
+        return False
+    # Сообщения, добавленные при обработке этого запроса (перебор хранилища пометил бы их прочитанными)
+    queued = getattr(getattr(request, '_messages', None), '_queued_messages', ())
+    return any(message.level >= messages.ERROR for message in queued)
+
+
+def _replay(record):
+    response = HttpResponse(record.content, status=record.status_code)
+    for name, value in record.headers.items():
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _replay_or_reject(request, record, fingerprint, redirect_to):
+    if record.fingerprint != fingerprint:
+        return _error(request, 422, 'Ключ идемпотентности уже использован для другого запроса', redirect_to)
+    return _replay(record)
+
+
+def idempotent(endpoint, redirect_to=None):
+    """
+    Декоратор POST-view: повтор запроса с тем же ключом возвращает сохраненный
+    ответ. Отказы (_rejected), ответы 5xx и исключения до фиксации проводки
+    освобождают ключ — запрос можно повторить.
+    redirect_to — куда вернуть обычную (не AJAX) форму при ошибке ключа.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'POST' or not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            key = request_key(request)
+            if key is None:
+                return view(request, *args, **kwargs)
+            if not is_valid_key(key):
+                return _error(request, 400, 'Некорректный ключ идемпотентности', redirect_to)
+
+            fingerprint = request_fingerprint(request, endpoint)
+            cached = _cache_get(request.user.pk, key)
+            if cached is not None:
+                return _replay_or_reject(request, cached, fingerprint, redirect_to)
+
+            record, claimed = _claim(request.user, key, endpoint, fingerprint)
+            if not claimed:
+                if record.status_code is None:
+                    return _error(request, 409, 'Запрос с этим ключом еще выполняется', redirect_to)
+                _cache_put(record)
+                return _replay_or_reject(request, record, fingerprint, redirect_to)
+
+            _local.committed = False
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                if _local.committed:
+                    _store(record, JsonResponse({'success': False, 'error': COMMITTED_ERROR}, status=500))
+                else:
+                    IdempotencyKey.objects.filter(pk=record.pk).delete()
+                raise
+            released = response.status_code >= 500 or _rejected(request, response)
+            if response.streaming or (released and not _local.committed):
+                IdempotencyKey.objects.filter(pk=record.pk).delete()
+            else:
+                _store(record, response)
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_expired(batch_size=1000, now=None, progress=None):
+    """Удаляет истекшие ключи порциями по batch_size; возвращает число удаленных"""
+    now = now or timezone.now()
+    removed = 0
+    while True:
+        ids = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return removed
+        deleted, _ = IdempotencyKey.objects.filter(id__in=ids).delete()
+        removed += deleted
+        if progress:
+            progress(f'Удалено ключей: {removed}')
@@ -0,0 +1,125 @@
+"""
+Переоценка инвестиционных позиций (ClientInvestment) по ценам паев.
+
+Цены (NAV) продуктов хранятся локально рядами ProductPrice — по строке на
+продукт и дату; их загружает команда import_product_prices. Стоимость
+позиции — amount * NAV на дату переоценки / NAV на дату покупки, где NAV на
+дату — последняя известная цена не позже нее (покупка до начала ряда —
+по первой цене ряда); доходность — current_value / amount - 1 в процентах.
+
+Команда revalue_investments загружает ряды всех продуктов один раз в
+отсортированные массивы NumPy с ключом (продукт, день) и проходит активные
+позиции порциями по id: обе цены каждой позиции находятся одним
+searchsorted на порцию, стоимость и доходность считаются сразу по всем
+позициям. Изменившиеся строки пишутся одним upsert на порцию, страница
+инвестиций читает готовые current_value и return_percent. Позиции
+продуктов без цен не меняются.
+"""
+from datetime import date
+
+import numpy as np
+from django.db import transaction as db_transaction
+
+from .batching import cents, money, run_chunks, upsert
+from .models import ClientInvestment, ProductPrice
+
+RESULT_FIELDS = ('positions', 'revalued', 'unpriced')
+
+_FIELDS = ('id', 'client_id', 'product_id', 'amount', 'current_value', 'purchase_date', 'status', 'created_at',
+           'return_percent', 'revalued_on')
+# Ключ ряда цен: product_id * _DAYS + порядковый номер дня
+_DAYS = 1_000_000
+
+
+class PriceSeries:
+    """Ряды цен всех продуктов на дату on_date (включительно) в массивах NumPy"""
+
+    def __init__(self, on_date):
+        rows = list(
+            ProductPrice.objects.filter(date__lte=on_date).order_by('product_id', 'date')
+            .values_list('product_id', 'date', 'price')
+        )
+        products, dates, prices = zip(*rows) if rows else ((), (), ())
+        self.products = np.array(products, dtype=np.int64)
+        self.days = np.array([day.toordinal() for day in dates], dtype=np.int64)
+        self.prices = np.array(prices, dtype=np.float64)
+        self.keys = self.products * _DAYS + self.days
+
+    def lookup(self, products, days):
+        """
+        (цена, номер дня цены) для пар (продукт, день): последняя цена не позже
+        дня, а если день раньше начала ряда — первая цена ряда. У продуктов
+        без цен цена — nan.
+        """
+        if not len(self.keys):
+            return np.full(len(products), np.nan), np.zeros(len(products), dtype=np.int64)
+        index = np.searchsorted(self.keys, products * _DAYS + days, side='right') - 1
+        first = np.searchsorted(self.keys, products * _DAYS, side='left')
+        # Нет цены не позже дня — берем первую цену ряда продукта
+        index = np.where((index < 0) | (self.products[np.maximum(index, 0)] != products), first, index)
+        index = np.minimum(index, len(self.keys) - 1)
+        found = self.products[index] == products
+        return np.where(found, self.prices[index], np.nan), np.where(found, self.days[index], 0)
+
+
+def revalue(amount, products, purchase_days, series, on_date):
+    """
+    Стоимость (копейки), доходность (сотые доли процента) и день цены для
+    массивов позиций; у позиций без цен признак priced ложен.
+    """
+    now, price_days = series.lookup(products, np.full(len(products), on_date.toordinal(), dtype=np.int64))
+    bought, _ = series.lookup(products, purchase_days)
+    priced = ~np.isnan(now) & ~np.isnan(bought) & (bought > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(priced, now / bought, 1.0)
+        value = np.floor(amount * ratio + 0.5).astype(np.int64)
+        returns = np.where(amount > 0, np.floor((value / amount - 1) * 10_000 + 0.5), 0).astype(np.int64)
+    return {'value': value, 'return': returns, 'price_day': price_days, 'priced': priced}
+
+
+def revalue_chunk(position_ids, series, on_date):
+    """Переоценивает активные позиции одной транзакцией БД; возвращает {поле RESULT_FIELDS: значение}"""
+    result = dict.fromkeys(RESULT_FIELDS, 0)
+    with db_transaction.atomic():
+        rows = list(
+            ClientInvestment.objects.filter(id__in=position_ids, status='active')
+            .select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list(*_FIELDS)
+        )
+        if not rows:
+            return result
+        columns = dict(zip(_FIELDS, zip(*rows)))
+        state = revalue(
+            cents(columns['amount']),
+            np.array(columns['product_id'], dtype=np.int64),
+            np.array([day.toordinal() for day in columns['purchase_date']], dtype=np.int64),
+            series,
+            on_date,
+        )
+        updated = []
+        for i in np.flatnonzero(state['priced']):
+            values = dict(zip(_FIELDS, rows[i]))
+            changes = {
+                'current_value': money(state['value'][i]),
+                'return_percent': money(state['return'][i]),
+                'revalued_on': date.fromordinal(int(state['price_day'][i])),
+            }
+            if any(values[field] != value for field, value in changes.items()):
+                updated.append(ClientInvestment(**{**values, **changes}))
+        upsert(ClientInvestment, updated, ['current_value', 'return_percent', 'revalued_on'])
+    result.update(positions=len(rows), revalued=len(updated), unpriced=int((~state['priced']).sum()))
+    return result
+
+
+def revalue_positions(on_date, chunk_size=50_000, progress=None):
+    """
+    Переоценивает все активные позиции на дату on_date порциями по chunk_size.
+    Возвращает итог {поле RESULT_FIELDS: значение}; progress(итог) вызывается
+    после каждой порции.
+    """
+    series = PriceSeries(on_date)
+    return run_chunks(
+        ClientInvestment.objects.filter(status='active'), lambda ids: revalue_chunk(ids, series, on_date),
+        RESULT_FIELDS, chunk_size, progress,
+    )
@@ -0,0 +1,136 @@
+"""
+Журнал проводок (Posting) и балансы карт на момент времени.
+
+Каждая проведенная Transaction дает две строки журнала: дебет стороны
+списания (amount < 0) и кредит стороны зачисления (amount > 0); у внешней
+стороны card пуст, так что сумма строк операции всегда равна нулю.
+Строки пишутся в транзакции проводки (dbo/posting.py) и не изменяются.
+
+Баланс на момент D — ближайшая контрольная точка BalanceCheckpoint плюс
+сумма проводок карты между точкой и D (индекс card, created_at). Точки
+создает команда create_balance_checkpoints под блокировкой строк карт:
+проводки по карте в этот момент невозможны, поэтому точка точно отражает
+все проводки с created_at < as_of.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Exists, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .hot_accounts import card_balances, fold
+from .models import BalanceCheckpoint, BankCard, Posting
+
+ZERO = Decimal('0.00')
+
+
+def journal_entries(tx, at=None):
+    """Строки дебета и кредита для проведенной операции"""
+    at = at or tx.created_at
+    return [
+        Posting(transaction_id=tx.id, card_id=tx.from_card_id, side='debit', amount=-tx.amount, created_at=at),
+        Posting(transaction_id=tx.id, card_id=tx.to_card_id, side='credit', amount=tx.amount, created_at=at),
+    ]
+
+
+def record_postings(transactions, at=None):
+    """
+    Записывает в журнал проводки операций (вызывается в транзакции проводки).
+    at — момент изменения балансов, если он позже создания операций
+    (расчет отложенных переводов, dbo/settlement.py).
+    """
+    Posting.objects.bulk_create([entry for tx in transactions for entry in journal_entries(tx, at)])
+
+
+def _posted_sum(card_id, start=None, end=None):
+    """Сумма проводок карты с created_at в [start, end)"""
+    queryset = Posting.objects.filter(card_id=card_id)
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=end)
+    return queryset.aggregate(total=Sum('amount'))['total'] or ZERO
+
+
+def balance_as_of(card_id, moment):
+    """
+    Баланс карты на момент moment (учтены проводки с created_at < moment):
+    одна контрольная точка и сумма проводок между ней и moment.
+    """
+    checkpoints = BalanceCheckpoint.objects.filter(card_id=card_id)
+    before = checkpoints.filter(as_of__lte=moment).order_by('-as_of').values_list('as_of', 'balance').first()
+    if before is not None:
+        as_of, balance = before
+        return balance + _posted_sum(card_id, as_of, moment)
+    after = checkpoints.filter(as_of__gt=moment).order_by('as_of').values_list('as_of', 'balance').first()
+    if after is not None:
+        as_of, balance = after
+        return balance - _posted_sum(card_id, moment, as_of)
+    # Точек еще нет: отсчитываем назад от текущего баланса
+    current = card_balances([card_id]).get(card_id)
+    if current is None:
+        return None
+    return current - _posted_sum(card_id, moment)
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def balance_series(card_id, day_from, day_to):
+    """Балансы карты на конец каждого дня day_from..day_to: [(day, balance)]"""
+    start = _day_start(day_from)
+    balance = balance_as_of(card_id, start)
+    if balance is None:
+        return []
+    daily = dict(
+        Posting.objects.filter(card_id=card_id, created_at__gte=start, created_at__lt=_day_start(day_to + timedelta(days=1)))
+        .annotate(day=TruncDate('created_at'))
+        .values('day')
+        .annotate(total=Sum('amount'))
+        .order_by()
+        .values_list('day', 'total')
+    )
+    series = []
+    day = day_from
+    while day <= day_to:
+        balance += daily.get(day, ZERO)
+        series.append((day, balance))
+        day += timedelta(days=1)
+    return series
+
+
+def cards_needing_checkpoint(card_ids):
+    """Карты из card_ids без контрольных точек или с проводками после последней точки"""
+    last = BalanceCheckpoint.objects.filter(card_id=OuterRef('pk')).order_by('-as_of').values('as_of')[:1]
+    return list(
+        BankCard.objects.filter(id__in=card_ids)
+        .annotate(last_as_of=Subquery(last))
+        .filter(
+            Q(last_as_of__isnull=True)
+            | Exists(Posting.objects.filter(card_id=OuterRef('pk'), created_at__gte=OuterRef('last_as_of')))
+        )
+        .values_list('id', flat=True)
+    )
+
+
+def create_checkpoints(card_ids):
+    """
+    Создает контрольные точки текущих балансов карт. Строки карт блокируются,
+    поэтому проводки по ним ждут и баланс совпадает с журналом на момент as_of;
+    строки горячих карт при этом переносятся в баланс.
+    """
+    with db_transaction.atomic():
+        rows = list(
+            BankCard.objects.select_for_update().filter(id__in=card_ids).order_by('id')
+            .values_list('id', 'balance', 'balance_shards')
+        )
+        balances = [(card_id, balance + fold(card_id) if shards else balance) for card_id, balance, shards in rows]
+        as_of = timezone.now()
+        BalanceCheckpoint.objects.bulk_create(
+            [BalanceCheckpoint(card_id=card_id, as_of=as_of, balance=balance) for card_id, balance in balances],
+            ignore_conflicts=True,
+        )
+    return len(balances)
@@ -0,0 +1,134 @@
+"""
+Дневные лимиты списаний по картам (BankCard.daily_limit).
+
+Сумма списаний за день хранится в CardDailySpend (карта, день) и
+увеличивается в транзакции проводки условным UPDATE ... WHERE amount <= limit - x,
+поэтому проверка лимита — одно обращение по уникальному ключу, а не SUM
+по транзакциям за день. Строка карты к этому моменту уже заблокирована
+(dbo/posting.py), так что параллельные списания по карте не обгоняют друг
+друга. Пересчет счетчиков по Transaction выполняет команда rebuild_daily_spend.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CardDailySpend, Transaction
+
+# Операции, которые учитываются в дневном лимите карты списания
+LIMITED_TYPES = ('transfer', 'payment', 'withdrawal')
+
+
+def spend_day(now=None):
+    """День учета списаний (по текущему часовому поясу)"""
+    return timezone.localdate(now)
+
+
+def consume(card_id, amount, limit, day):
+    """
+    Учитывает списание amount в счетчике карты за day. Возвращает False,
+    если списание превысило бы limit (счетчик при этом не меняется).
+    Вызывается внутри транзакции при заблокированной строке карты.
+    """
+    if amount > limit:
+        return False
+    updated = CardDailySpend.objects.filter(card_id=card_id, day=day, amount__lte=limit - amount).update(
+        amount=F('amount') + amount, updated_at=timezone.now()
+    )
+    if updated:
+        return True
+    if CardDailySpend.objects.filter(card_id=card_id, day=day).exists():
+        return False
+    CardDailySpend.objects.create(card_id=card_id, day=day, amount=amount)
+    return True
+
+
+def release(card_id, amount, day):
+    """Возвращает в лимит карты списание amount, учтенное за day (операция не состоялась)"""
+    CardDailySpend.objects.filter(card_id=card_id, day=day, amount__gte=amount).update(
+        amount=F('amount') - amount, updated_at=timezone.now()
+    )
+
+
+def add_spend(amounts, day):
+    """
+    Увеличивает счетчики {card_id: amount} за day без проверки лимита
+    (списание уже одобрено, например при авторизации покупки — dbo/holds.py).
+    Вызывается при заблокированных строках карт.
+    """
+    current = dict(CardDailySpend.objects.filter(card_id__in=amounts, day=day).values_list('card_id', 'amount'))
+    # Строки карт заблокированы: итог известен, записываем его одним upsert
+    CardDailySpend.objects.bulk_create(
+        [CardDailySpend(card_id=card_id, day=day, amount=current.get(card_id, 0) + amount)
+         for card_id, amount in sorted(amounts.items())],
+        update_conflicts=True,
+        unique_fields=['card', 'day'],
+        update_fields=['amount', 'updated_at'],
+    )
+
+
+def spent(card, day=None):
+    """Сумма учтенных списаний по карте за день"""
+    value = (
+        CardDailySpend.objects.filter(card=card, day=day or spend_day())
+        .values_list('amount', flat=True)
+        .first()
+    )
+    return value if value is not None else Decimal('0.00')
+
+
+def remaining_limit(card, day=None):
+    """Остаток дневного лимита карты"""
+    return max(card.daily_limit - spent(card, day), Decimal('0.00'))
+
+
+def _day_bounds(day_from, day_to):
+    start = timezone.make_aware(datetime.combine(day_from, time.min))
+    end = timezone.make_aware(datetime.combine(day_to + timedelta(days=1), time.min))
+    return start, end
+
+
+def compute_spend(day_from, day_to, card_ids=None):
+    """Суммы списаний по Transaction: {(card_id, day): amount} за дни day_from..day_to"""
+    start, end = _day_bounds(day_from, day_to)
+    queryset = Transaction.objects.filter(
+        from_card__isnull=False,
+        # Отложенные переводы учтены в счетчике при записи (dbo/settlement.py)
+        status__in=('completed', 'pending'),
+        transaction_type__in=LIMITED_TYPES,
+        created_at__gte=start,
+        created_at__lt=end,
+    )
+    if card_ids is not None:
+        queryset = queryset.filter(from_card_id__in=card_ids)
+    rows = (
+        queryset.annotate(day=TruncDate('created_at'))
+        .values('from_card_id', 'day')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+    return {(row['from_card_id'], row['day']): row['total'] for row in rows}
+
+
+def store_spend(spend, day_from, day_to, card_ids=None):
+    """
+    Перезаписывает счетчики за дни day_from..day_to значениями spend;
+    счетчики без списаний в этом диапазоне удаляются.
+    """
+    with db_transaction.atomic():
+        existing = CardDailySpend.objects.filter(day__gte=day_from, day__lte=day_to)
+        if card_ids is not None:
+            existing = existing.filter(card_id__in=card_ids)
+        stale = [pk for pk, card_id, day in existing.values_list('id', 'card_id', 'day') if (card_id, day) not in spend]
+        deleted, _ = CardDailySpend.objects.filter(id__in=stale).delete()
+        CardDailySpend.objects.bulk_create(
+            [CardDailySpend(card_id=card_id, day=day, amount=amount) for (card_id, day), amount in spend.items()],
+            update_conflicts=True,
+            unique_fields=['card', 'day'],
+            update_fields=['amount', 'updated_at'],
+            batch_size=1000,
+        )
+    return deleted
@@ -0,0 +1,160 @@
+"""
+Общие заготовки для команд нагрузочного тестирования (bench_*).
+
+Команды создают временного клиента с картами и удаляют его (каскадно
+вместе с картами и транзакциями) по завершении замера.
+"""
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.utils import timezone
+
+from dbo.ledger import record_postings
+from dbo.models import Client, BankCard, Posting, Transaction
+
+
+@contextmanager
+def bench_client(cards=10, balance=Decimal('1000000.00')):
+    """Создает временного клиента с cards картами и возвращает (client, [cards])"""
+    tag = uuid.uuid4().hex[:10]
+    user = User.objects.create(username=f'bench_{tag}', email=f'bench_{tag}@bench.local')
+    try:
+        client = Client.objects.create(
+            user=user,
+            client_id=f'BENCH{tag}',
+            full_name=f'Нагрузочный тест {tag}',
+            email=user.email,
+            phone=f'7{int(tag, 16) % 10**10:010d}',
+        )
+        expiry = date.today() + timedelta(days=365)
+        BankCard.objects.bulk_create([
+            BankCard(
+                client=client,
+                card_number=f'4000{tag[:6]}{i:05d}'[:19],
+                card_type='debit',
+                balance=balance,
+                expiry_date=expiry,
+            )
+            for i in range(cards)
+        ])
+        yield client, list(BankCard.objects.filter(client=client).order_by('id'))
+    finally:
+        _delete_postings([user])
+        user.delete()
+
+
+@contextmanager
+def bench_clients(count, cards=2, balance=Decimal('1000000.00')):
+    """
+    Создает count временных клиентов пачками и возвращает (clients, cards).
+    Транзакции этих клиентов удаляются одним DELETE до удаления пользователей.
+    """
+    tag = uuid.uuid4().hex[:8]
+    User.objects.bulk_create([
+        User(username=f'bench_{tag}_{i}', email=f'bench_{tag}_{i}@bench.local') for i in range(count)
+    ])
+    users = list(User.objects.filter(username__startswith=f'bench_{tag}_').order_by('id'))
+    try:
+        Client.objects.bulk_create([
+            Client(
+                user=user,
+                client_id=f'BENCH{tag}{i:06d}',
+                full_name=f'Нагрузочный тест {tag} #{i}',
+                email=user.email,
+                phone=f'8{tag[:2]}{i:07d}'[:20],
+            )
+            for i, user in enumerate(users)
+        ])
+        clients = list(Client.objects.filter(user__in=users).order_by('id'))
+        expiry = date.today() + timedelta(days=365)
+        BankCard.objects.bulk_create([
+            BankCard(
+                client=client,
+                card_number=f'5{tag[:4]}{i:06d}{j:02d}'[:19],
+                card_type='debit',
+                balance=balance,
+                expiry_date=expiry,
+            )
+            for i, client in enumerate(clients)
+            for j in range(cards)
+        ], batch_size=5000)
+        yield clients, list(BankCard.objects.filter(client__in=clients).order_by('id'))
+    finally:
+        _delete_postings(users)
+        Transaction.objects.filter(from_client__user__in=users).delete()
+        Transaction.objects.filter(to_client__user__in=users).delete()
+        User.objects.filter(id__in=[user.id for user in users]).delete()
+
+
+def _delete_postings(users):
+    """Журнал не удаляется каскадно вместе с транзакциями — чистим строки проводок явно"""
+    Posting.objects.filter(
+        Q(transaction__from_client__user__in=users) | Q(transaction__to_client__user__in=users)
+    ).delete()
+
+
+def seed_transactions(cards, total, batch_size=10000, description=None, progress=None, span=timedelta(days=365),
+                      journal=False):
+    """
+    Генерирует total завершенных переводов между случайными картами за период
+    span до текущего момента (bulk_create, без проводки и статистики).
+    description — функция без аргументов, возвращающая описание; progress —
+    функция для вывода прогресса; journal — записывать ли строки журнала проводок.
+    """
+    now = timezone.now()
+    created = 0
+    # auto_now_add перезаписал бы created_at текущим временем
+    created_field = Transaction._meta.get_field('created_at')
+    created_field.auto_now_add = False
+    try:
+        while created < total:
+            batch = []
+            for _ in range(min(batch_size, total - created)):
+                src, dst = random.sample(cards, 2)
+                batch.append(Transaction(
+                    from_card_id=src.id,
+                    to_card_id=dst.id,
+                    from_client_id=src.client_id,
+                    to_client_id=dst.client_id,
+                    amount=Decimal(random.randint(1, 10000)),
+                    transaction_type='transfer',
+                    status='completed',
+                    description=description() if description else 'bench',
+                    created_at=now - timedelta(seconds=random.randint(0, int(span.total_seconds()))),
+                ))
+            Transaction.objects.bulk_create(batch)
+            if journal:
+                record_postings(batch)
+            created += len(batch)
+            if progress and (created % (batch_size * 50) == 0 or created == total):
+                progress(f'Создано транзакций: {created}')
+    finally:
+        created_field.auto_now_add = True
+    return created
+
+
+def percentile(values, pct):
+    """Перцентиль pct (0-100) по списку значений"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Timer:
+    """Контекстный менеджер для замера времени выполнения блока"""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+        return False
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from dbo.deposits import run_accrual
+
+
+class Command(BaseCommand):
+    help = ('Начисление процентов по депозитам на дату и выплата депозитов с наступившим сроком; '
+            'повторный запуск с той же датой ничего не начисляет')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Дата расчета YYYY-MM-DD (по умолчанию сегодня)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Депозитов в одной транзакции')
+
+    def handle(self, *args, **options):
+        accrual_date = parse_date(options['date']) if options['date'] else timezone.localdate()
+        if accrual_date is None:
+            raise CommandError('Неверная дата: ожидается YYYY-MM-DD')
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size должен быть положительным')
+
+        started = time.monotonic()
+        total = run_accrual(
+            accrual_date, options['chunk_size'],
+            progress=lambda total: self.stdout.write(
+                f'Обработано депозитов: {total["deposits"]}, начислено по {total["accrued"]}'
+            ),
+        )
+        elapsed = time.monotonic() - started
+        rate = total['deposits'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Расчет на {accrual_date:%d.%m.%Y}: депозитов {total["deposits"]} за {elapsed:.1f} с ({rate:.0f}/с); '
+            f'начислено {total["interest"]} по {total["accrued"]} депозитам, выплачено {total["paid_out"]} '
+            f'по {total["matured"] - total["deferred"]} ({total["transactions"]} операций), '
+            f'отложено выплат {total["deferred"]}'
+        ))
@@ -0,0 +1,86 @@
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Case, DecimalField, F, Q, Sum, When
+from django.utils import timezone
+
+from dbo.ledger import balance_as_of, balance_series, create_checkpoints
+from dbo.models import BalanceCheckpoint, BankCard, Posting, Transaction
+
+from ._bench import bench_clients, percentile, seed_transactions, Timer
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест баланса на дату: пересчет по всем Transaction карты '
+            'против контрольной точки и суммы журнала проводок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=500_000, help='Сколько транзакций сгенерировать')
+        parser.add_argument('--clients', type=int, default=50, help='Количество клиентов')
+        parser.add_argument('--samples', type=int, default=300, help='Количество замеров на вариант')
+
+    def handle(self, *args, **options):
+        with bench_clients(options['clients']) as (clients, cards):
+            seed_transactions(cards, options['transactions'], progress=self.stdout.write, journal=True)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {Transaction._meta.db_table}')
+                    cursor.execute(f'ANALYZE {Posting._meta.db_table}')
+            card = cards[0]
+            self._monthly_checkpoints(card)
+            self.stdout.write(
+                f'Проводок по карте: {Posting.objects.filter(card=card).count()}, '
+                f'контрольных точек: {BalanceCheckpoint.objects.filter(card=card).count()}'
+            )
+
+            def replay(moment):
+                # Прежний способ: текущий баланс минус все операции карты после moment
+                signed = Case(
+                    When(from_card=card, then=-F('amount')),
+                    default=F('amount'),
+                    output_field=DecimalField(max_digits=15, decimal_places=2),
+                )
+                later = Transaction.objects.filter(
+                    Q(from_card=card) | Q(to_card=card), status='completed', created_at__gte=moment
+                ).aggregate(total=Sum(signed))['total'] or Decimal('0.00')
+                return BankCard.objects.get(id=card.id).balance - later
+
+            now = timezone.now()
+            moments = [now - timedelta(seconds=random.randint(0, 365 * 24 * 3600)) for _ in range(options['samples'])]
+            mismatches = sum(replay(moment) != balance_as_of(card.id, moment) for moment in moments[:20])
+            self.stdout.write(f'Расхождений на 20 датах: {mismatches}')
+
+            for title, run in (
+                ('Пересчет по Transaction', replay),
+                ('Контрольная точка + журнал', lambda moment: balance_as_of(card.id, moment)),
+            ):
+                timings = []
+                for moment in moments:
+                    with Timer() as timer:
+                        run(moment)
+                    timings.append(timer.elapsed * 1000)
+                self.stdout.write(
+                    f'{title}: p50 {percentile(timings, 50):.2f} мс, '
+                    f'p95 {percentile(timings, 95):.2f} мс, p99 {percentile(timings, 99):.2f} мс'
+                )
+
+            today = timezone.localdate()
+            with Timer() as timer:
+                balance_series(card.id, today - timedelta(days=89), today)
+            self.stdout.write(f'Балансы на конец дня за 90 дней: {timer.elapsed * 1000:.2f} мс')
+            self.stdout.write('Удаление тестовых данных...')
+
+    @staticmethod
+    def _monthly_checkpoints(card):
+        """Текущая точка и точки на начало каждого из последних 12 месяцев"""
+        create_checkpoints([card.id])
+        first = timezone.localdate().replace(day=1)
+        points = []
+        for _ in range(12):
+            moment = timezone.make_aware(datetime.combine(first, time.min))
+            points.append(BalanceCheckpoint(card=card, as_of=moment, balance=balance_as_of(card.id, moment)))
+            first = (first - timedelta(days=1)).replace(day=1)
+        BalanceCheckpoint.objects.bulk_create(points)
@@ -0,0 +1,104 @@
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.utils import timezone
+
+from dbo.billing import BILLING_PERIOD, due_subscriptions, periods_due, run_billing
+from dbo.models import BankCard, ClientService, Service, ServiceCategory
+from dbo.posting import post_transaction, PostingError
+
+from ._bench import bench_clients, Timer
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест ежемесячного списания: цикл по подпискам с проводкой по одной '
+            'против run_billing порциями')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=20_000, help='Клиентов')
+        parser.add_argument('--services', type=int, default=5, help='Подписок у клиента')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Подписок в порции run_billing')
+        parser.add_argument('--baseline', type=int, default=500, help='Подписок для цикла по одной')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        category = ServiceCategory.objects.create(name=f'bench {uuid.uuid4().hex[:8]}')
+        try:
+            services = Service.objects.bulk_create([
+                Service(name=f'Услуга {i}', description='bench', category=category, price=Decimal(100 * (i + 1)))
+                for i in range(options['services'])
+            ])
+            with bench_clients(options['clients'], cards=1) as (clients, cards):
+                # Каждый десятый клиент не сможет оплатить подписки
+                poor = {card.id for card in cards[::10]}
+                BankCard.objects.filter(id__in=poor).update(balance=Decimal('50.00'))
+                ClientService.objects.bulk_create([
+                    ClientService(
+                        client=client, service=service, monthly_fee=service.price,
+                        next_payment_date=today - timedelta(days=random.randint(0, 45)),
+                        auto_renewal=random.random() > 0.05,
+                    )
+                    for client in clients for service in services
+                ], batch_size=5000)
+                card_ids = [card.id for card in cards]
+                subscriptions = due_subscriptions(today).filter(client__in=clients)
+                total_before = self._total(card_ids)
+                self.stdout.write(f'Подписок к списанию: {subscriptions.count()}')
+
+                baseline = list(subscriptions.filter(auto_renewal=True).select_related('service')
+                                .order_by('id')[:options['baseline']])
+                with Timer() as timer:
+                    charged = self._per_row(baseline, today)
+                self.stdout.write(
+                    f'Цикл по одной подписке: {len(baseline) / timer.elapsed:.0f} подписок/с '
+                    f'(оплачено {charged} из {len(baseline)})'
+                )
+                baseline_spent = total_before - self._total(card_ids)
+
+                with Timer() as timer:
+                    total = run_billing(today, options['chunk_size'])
+                self.stdout.write(
+                    f'run_billing: {total["subscriptions"] / timer.elapsed:.0f} подписок/с, '
+                    f'{total["transactions"] / timer.elapsed:.0f} операций/с; оплачено {total["charged"]}, '
+                    f'приостановлено {total["suspended"]}, истекло {total["expired"]}'
+                )
+                repeat = run_billing(today, options['chunk_size'])
+                self.stdout.write(f'Повторный запуск: обработано подписок {repeat["subscriptions"]}')
+
+                spent = total_before - self._total(card_ids) - baseline_spent
+                if spent == total['amount'] and not repeat['subscriptions']:
+                    self.stdout.write(self.style.SUCCESS('Списано ровно начисленное, повтор ничего не списал'))
+                else:
+                    self.stdout.write(self.style.ERROR(f'Расхождение: списано {spent}, начислено {total["amount"]}'))
+        finally:
+            Service.objects.filter(category=category).delete()
+            category.delete()
+
+    @staticmethod
+    def _per_row(subscriptions, billing_date):
+        """Как без run_billing: проводка и сохранение подписки по одной"""
+        charged = 0
+        for sub in subscriptions:
+            card = BankCard.objects.filter(client_id=sub.client_id, is_active=True).order_by('id').first()
+            periods = periods_due(sub.next_payment_date, billing_date)
+            try:
+                for _ in range(periods):
+                    post_transaction('fee', sub.monthly_fee, from_card=card,
+                                     description=f'Абонентская плата за услугу "{sub.service.name}"')
+            except PostingError:
+                sub.status = 'suspended'
+                sub.is_active = False
+                sub.save(update_fields=['status', 'is_active'])
+                continue
+            sub.next_payment_date += BILLING_PERIOD * periods
+            sub.save(update_fields=['next_payment_date'])
+            charged += 1
+        return charged
+
+    @staticmethod
+    def _total(card_ids):
+        return BankCard.objects.filter(id__in=card_ids).aggregate(total=Sum('balance'))['total']
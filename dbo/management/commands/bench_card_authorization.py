@@ -0,0 +1,116 @@
+import random
+import threading
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+
+from dbo.holds import capture_holds, get_hold_book
+from dbo.models import BankCard, CardHold
+from dbo.posting import post_transaction, PostingError
+
+from ._bench import bench_clients, percentile, Timer
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест авторизации покупок: удержания в памяти процесса '
+            'против записи Transaction на каждую покупку (p50/p99 задержки)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=1000, help='Карт в тесте')
+        parser.add_argument('--workers', type=int, default=16, help='Параллельных терминалов')
+        parser.add_argument('--authorizations', type=int, default=100_000, help='Авторизаций в замере')
+        parser.add_argument('--baseline', type=int, default=1000, help='Покупок с проводкой Transaction для сравнения')
+
+    def handle(self, *args, **options):
+        with bench_clients(options['cards'], cards=1) as (clients, cards):
+            card_ids = [card.id for card in cards]
+            BankCard.objects.filter(id__in=card_ids).update(daily_limit=Decimal('99999999.99'))
+            total_before = self._total(card_ids)
+
+            elapsed, latencies, stats = self._run(
+                lambda card: post_transaction('payment', Decimal(random.randint(100, 5000)),
+                                              from_card=BankCard(pk=card.pk), description='bench'),
+                cards, options['workers'], options['baseline'],
+            )
+            self._report('Проводка Transaction на покупку', elapsed, latencies, stats)
+            spent_baseline = total_before - self._total(card_ids)
+
+            book = get_hold_book()
+            # Снимки карт загружаются до замера
+            book.load(card_ids)
+            elapsed, latencies, stats = self._run(
+                lambda card: book.authorize(card.pk, Decimal(random.randint(100, 5000)), merchant='bench'),
+                cards, options['workers'], options['authorizations'],
+            )
+            self._report('Удержание в памяти', elapsed, latencies, stats)
+
+            with Timer() as timer:
+                flushed = book.flush()
+            self.stdout.write(f'Запись удержаний: {flushed} за {timer.elapsed:.2f} с')
+            hold_ids = list(CardHold.objects.filter(card_id__in=card_ids).values_list('hold_id', flat=True))
+            held = CardHold.objects.filter(card_id__in=card_ids).aggregate(total=Sum('amount'))['total']
+            captured = 0
+            with Timer() as timer:
+                for start in range(0, len(hold_ids), 1000):
+                    results = capture_holds(hold_ids[start:start + 1000])
+                    captured += sum(not isinstance(result, Exception) for result in results.values())
+            self.stdout.write(
+                f'Списание удержаний: {captured} из {len(hold_ids)} за {timer.elapsed:.1f} с '
+                f'({captured / timer.elapsed:.0f}/с)'
+            )
+
+            total_after = self._total(card_ids)
+            self.stdout.write(f'Сумма балансов: {total_before} → {total_after}')
+            if captured == len(hold_ids) and total_before - total_after == spent_baseline + (held or 0):
+                self.stdout.write(self.style.SUCCESS('Деньги сохранены: списано ровно удержанное'))
+            else:
+                self.stdout.write(self.style.ERROR('Обнаружены расхождения'))
+
+    def _report(self, title, elapsed, latencies, stats):
+        self.stdout.write(
+            f'{title}: {stats["ok"] / elapsed:.0f} авторизаций/с, p50 {percentile(latencies, 50):.3f} мс, '
+            f'p99 {percentile(latencies, 99):.3f} мс, отказов: {stats["declined"]}, ошибок: {stats["errors"]}'
+        )
+
+    @staticmethod
+    def _run(purchase, cards, workers, total):
+        per_worker = max(1, total // workers)
+        latencies = []
+        stats = {'ok': 0, 'declined': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker():
+            local_latencies = []
+            local = {'ok': 0, 'declined': 0, 'errors': 0}
+            try:
+                for _ in range(per_worker):
+                    card = random.choice(cards)
+                    with Timer() as timer:
+                        try:
+                            purchase(card)
+                            local['ok'] += 1
+                        except PostingError:
+                            local['declined'] += 1
+                        except Exception:
+                            local['errors'] += 1
+                    local_latencies.append(timer.elapsed * 1000)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                for key, value in local.items():
+                    stats[key] += value
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        with Timer() as timer:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return timer.elapsed, latencies, stats
+
+    @staticmethod
+    def _total(card_ids):
+        return BankCard.objects.filter(id__in=card_ids).aggregate(total=Sum('balance'))['total']
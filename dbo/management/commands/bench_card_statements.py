@@ -0,0 +1,61 @@
+import json
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from dbo.models import Transaction
+from dbo.pagination import KeysetPaginator
+from dbo.posting import post_transaction
+from dbo.statements import STATEMENT_SIZE, latest_statements, serialize_statement
+
+from ._bench import bench_clients, percentile, seed_transactions, Timer
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест выписки по карте: OR-запрос при каждом обращении против кэшированного буфера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=1_000_000, help='Сколько транзакций сгенерировать')
+        parser.add_argument('--clients', type=int, default=200, help='Количество клиентов')
+        parser.add_argument('--samples', type=int, default=500, help='Количество замеров на вариант')
+
+    def handle(self, *args, **options):
+        with bench_clients(options['clients']) as (clients, cards):
+            seed_transactions(cards, options['transactions'], progress=self.stdout.write)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {Transaction._meta.db_table}')
+            card = cards[0]
+
+            def or_query():
+                txs = Transaction.objects.filter(Q(from_card=card) | Q(to_card=card))
+                page = KeysetPaginator(txs, STATEMENT_SIZE).get_page()
+                return json.dumps({'statements': [serialize_statement(tx) for tx in page]})
+
+            latest_statements(card.id)
+            for title, run in (('OR-запрос', or_query), ('Кэшированный буфер', lambda: latest_statements(card.id))):
+                timings = []
+                for _ in range(options['samples']):
+                    with Timer() as timer:
+                        run()
+                    timings.append(timer.elapsed * 1000)
+                self.stdout.write(
+                    f'{title}: p50 {percentile(timings, 50):.3f} мс, p95 {percentile(timings, 95):.3f} мс, '
+                    f'p99 {percentile(timings, 99):.3f} мс'
+                )
+
+            # Проводка сбрасывает буфер: первое обращение после нее перестраивает его
+            timings = []
+            for _ in range(min(options['samples'], 200)):
+                post_transaction('deposit', Decimal('1.00'), to_card=card)
+                with Timer() as timer:
+                    etag, payload = latest_statements(card.id)
+                timings.append(timer.elapsed * 1000)
+            fresh = json.loads(payload)['statements'][0]['amount'] == 1.0
+            self.stdout.write(
+                f'Перестроение после проводки: p50 {percentile(timings, 50):.3f} мс, '
+                f'p95 {percentile(timings, 95):.3f} мс (в буфере новая операция: {fresh})'
+            )
+            self.stdout.write('Удаление тестовых данных...')
@@ -0,0 +1,71 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from dbo.history import client_history_branches, latest_client_transactions
+from dbo.models import Transaction
+
+from ._bench import bench_clients, percentile, seed_transactions, Timer
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест истории клиента: «последние N операций» через OR по картам '
+            'и через индексы from_client/to_client (EXPLAIN и время запросов)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=10_000_000, help='Сколько транзакций сгенерировать')
+        parser.add_argument('--clients', type=int, default=2000, help='Количество клиентов')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Размер пачки bulk_create')
+        parser.add_argument('--limit', type=int, default=50, help='N в «последних N операциях»')
+        parser.add_argument('--samples', type=int, default=200, help='Количество замеров на вариант')
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        with bench_clients(options['clients']) as (clients, cards):
+            with Timer() as timer:
+                seed_transactions(cards, options['transactions'], options['batch_size'], progress=self.stdout.write)
+            self.stdout.write(f'Генерация: {timer.elapsed:.1f} с')
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {Transaction._meta.db_table}')
+
+            client = random.choice(clients)
+            old = self._old_query(client, limit)
+            self.stdout.write(self.style.MIGRATE_HEADING('До: OR по from_card__client / to_card__client'))
+            self.stdout.write(old.explain(**self._explain_options()))
+            self.stdout.write(self.style.MIGRATE_HEADING('После: ветки по from_client / to_client'))
+            for branch in client_history_branches(client):
+                query = Transaction.objects.filter(branch).order_by('-created_at', '-id')[:limit]
+                self.stdout.write(query.explain(**self._explain_options()))
+
+            sample = [random.choice(clients) for _ in range(options['samples'])]
+            for title, run in (
+                ('OR по картам', lambda c: list(self._old_query(c, limit))),
+                ('from_client/to_client', lambda c: latest_client_transactions(c, limit)),
+            ):
+                timings = []
+                for sample_client in sample:
+                    with Timer() as timer:
+                        run(sample_client)
+                    timings.append(timer.elapsed * 1000)
+                self.stdout.write(
+                    f'{title}: p50 {percentile(timings, 50):.2f} мс, '
+                    f'p95 {percentile(timings, 95):.2f} мс, p99 {percentile(timings, 99):.2f} мс'
+                )
+
+            self.stdout.write('Удаление тестовых данных...')
+
+    @staticmethod
+    def _old_query(client, limit):
+        return (
+            Transaction.objects.filter(Q(from_card__client=client) | Q(to_card__client=client))
+            .order_by('-created_at', '-id')[:limit]
+        )
+
+    @staticmethod
+    def _explain_options():
+        if connection.vendor == 'postgresql':
+            return {'analyze': True, 'buffers': True}
+        return {}
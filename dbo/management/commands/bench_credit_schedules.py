@@ -0,0 +1,119 @@
+import random
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from dbo.credits import update_credits
+from dbo.models import Credit
+
+from ._bench import bench_clients, Timer
+
+CENT = Decimal('0.01')
+
+
+def _add_months(day, months):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    following = day.replace(year=year + month // 12, month=month % 12 + 1, day=1)
+    return day.replace(year=year, month=month, day=min(day.day, (following - timedelta(days=1)).day))
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест пересчета кредитов: график на Decimal и save() по одному кредиту '
+            'против update_credits на массивах NumPy')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--credits', type=int, default=1_000_000, help='Кредитов')
+        parser.add_argument('--clients', type=int, default=10_000, help='Клиентов')
+        parser.add_argument('--chunk-size', type=int, default=50_000, help='Кредитов в порции update_credits')
+        parser.add_argument('--baseline', type=int, default=1000, help='Кредитов для цикла по одному')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        with bench_clients(options['clients'], cards=1) as (clients, _):
+            batch = []
+            for i in range(options['credits']):
+                term = random.choice([12, 24, 36, 60, 120, 240])
+                amount = Decimal(random.randint(50, 5000) * 1000)
+                start = today - timedelta(days=random.randint(0, term * 30))
+                rate = Decimal(random.choice(['9.90', '12.50', '17.00', '24.90']))
+                batch.append(Credit(
+                    client=clients[i % len(clients)], amount=amount, interest_rate=rate, term_months=term,
+                    monthly_payment=0, remaining_amount=amount, start_date=start, end_date=_add_months(start, term),
+                    # Примерно по графику с запасом; каждый пятый не платит совсем, каждый пятый — вполовину
+                    paid_amount=(
+                        (amount / term + amount * rate / 1200) * ((today - start).days // 30)
+                        * Decimal(random.choice(['0', '0.5', '1', '1', '1']))
+                    ).quantize(CENT),
+                ))
+                if len(batch) == 10_000:
+                    Credit.objects.bulk_create(batch)
+                    batch = []
+            Credit.objects.bulk_create(batch)
+            credits = Credit.objects.filter(client__in=clients)
+            self.stdout.write(f'Кредитов: {credits.count()}')
+
+            baseline = list(credits.order_by('id')[:options['baseline']])
+            with Timer() as timer:
+                for credit in baseline:
+                    self._per_row(credit, today)
+            self.stdout.write(f'График на Decimal по одному кредиту: {len(baseline) / timer.elapsed:.0f} кредитов/с')
+            expected = {credit.id: (credit.monthly_payment, credit.status) for credit in baseline}
+
+            with Timer() as timer:
+                total = update_credits(today, options['chunk_size'])
+            self.stdout.write(
+                f'update_credits: {total["credits"]} кредитов за {timer.elapsed:.1f} с '
+                f'({total["credits"] / timer.elapsed:.0f}/с); изменено {total["changed"]}, '
+                f'просрочено {total["overdue"]}, погашено {total["paid"]}'
+            )
+            with Timer() as timer:
+                repeat = update_credits(today, options['chunk_size'])
+            self.stdout.write(f'Повторный запуск: {timer.elapsed:.1f} с, изменено {repeat["changed"]}')
+
+            actual = {
+                credit_id: (payment, status)
+                for credit_id, payment, status in credits.filter(id__in=expected).values_list(
+                    'id', 'monthly_payment', 'status'
+                )
+            }
+            mismatched = [credit_id for credit_id, value in expected.items() if actual[credit_id] != value]
+            if not mismatched:
+                self.stdout.write(self.style.SUCCESS('Платежи и статусы совпадают с расчетом на Decimal'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Расхождение у {len(mismatched)} кредитов: {mismatched[:10]}'))
+            # Удаляем порциями: каскад от клиентов собрал бы все кредиты в памяти
+            ids = list(credits.values_list('id', flat=True))
+            for offset in range(0, len(ids), options['chunk_size']):
+                Credit.objects.filter(id__in=ids[offset:offset + options['chunk_size']]).delete()
+
+    @staticmethod
+    def _per_row(credit, on_date):
+        """Как без update_credits: график по месяцам на Decimal и сохранение кредита"""
+        monthly = credit.interest_rate / 1200
+        term = credit.term_months
+        if monthly:
+            payment = credit.amount * monthly / (1 - (1 + monthly) ** -term)
+        else:
+            payment = credit.amount / term
+        payment = payment.quantize(CENT, rounding=ROUND_HALF_UP)
+        balance, cumulative, due_total = credit.amount, Decimal(0), Decimal(0)
+        for month in range(1, term + 1):
+            if balance <= 0:
+                break
+            interest = (balance * monthly).quantize(CENT, rounding=ROUND_HALF_UP)
+            due = balance + interest if month == term else min(payment, balance + interest)
+            balance -= due - interest
+            cumulative += due
+            if _add_months(credit.start_date, month) <= on_date:
+                due_total = cumulative
+        credit.monthly_payment = payment
+        if credit.paid_amount >= cumulative:
+            credit.status = 'paid'
+        elif credit.paid_amount < due_total:
+            credit.status = 'overdue'
+        else:
+            credit.status = 'active'
+        credit.save(update_fields=['monthly_payment', 'status'])
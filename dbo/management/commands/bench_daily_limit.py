@@ -0,0 +1,62 @@
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.utils import timezone
+
+from dbo.limits import LIMITED_TYPES, compute_spend, spend_day, spent, store_spend
+from dbo.models import BankCard, Transaction
+from dbo.posting import post_transaction
+
+from ._bench import bench_clients, percentile, seed_transactions, Timer
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест проверки дневного лимита: SUM по транзакциям за день против счетчика CardDailySpend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=200_000, help='Транзакций в истории карты (за год)')
+        parser.add_argument('--samples', type=int, default=500, help='Количество замеров на вариант')
+
+    def handle(self, *args, **options):
+        with bench_clients(1, cards=2) as (clients, cards):
+            seed_transactions(cards, options['transactions'], progress=self.stdout.write)
+            card = cards[0]
+            today = spend_day()
+            store_spend(compute_spend(today, today, [card.id]), today, today, [card.id])
+            day_start = timezone.make_aware(datetime.combine(today, time.min))
+
+            def sum_query():
+                return Transaction.objects.filter(
+                    from_card=card, status='completed', transaction_type__in=LIMITED_TYPES,
+                    created_at__gte=day_start,
+                ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+
+            self.stdout.write(f'Списано сегодня: SUM {sum_query()}, счетчик {spent(card)}')
+
+            for title, check in (('SUM по транзакциям', sum_query), ('Счетчик CardDailySpend', lambda: spent(card))):
+                timings = []
+                for _ in range(options['samples']):
+                    with Timer() as timer:
+                        check()
+                    timings.append(timer.elapsed * 1000)
+                self.stdout.write(
+                    f'{title}: p50 {percentile(timings, 50):.3f} мс, p95 {percentile(timings, 95):.3f} мс, '
+                    f'p99 {percentile(timings, 99):.3f} мс'
+                )
+
+            # Сгенерированная история уже превышает лимит по умолчанию
+            BankCard.objects.filter(id=card.id).update(daily_limit=Decimal('99999999.99'))
+            timings = []
+            target = BankCard(pk=cards[1].pk)
+            for _ in range(min(options['samples'], 200)):
+                with Timer() as timer:
+                    post_transaction('transfer', Decimal('1.00'), from_card=BankCard(pk=card.pk), to_card=target)
+                timings.append(timer.elapsed * 1000)
+            self.stdout.write(
+                f'Проводка перевода с проверкой лимита: p50 {percentile(timings, 50):.2f} мс, '
+                f'p95 {percentile(timings, 95):.2f} мс'
+            )
+            self.stdout.write(f'После проводок: SUM {sum_query()}, счетчик {spent(card)}')
+            self.stdout.write('Удаление тестовых данных...')
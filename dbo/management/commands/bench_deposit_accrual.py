@@ -0,0 +1,109 @@
+import random
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from dbo.deposits import DAYS_IN_YEAR, run_accrual
+from dbo.models import BankCard, Deposit, DepositAccrual
+from dbo.posting import post_transaction
+
+from ._bench import bench_clients, Timer
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест начисления процентов по депозитам: цикл по депозитам на Decimal '
+            'с сохранением по одному против run_accrual на массивах NumPy')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=20_000, help='Клиентов')
+        parser.add_argument('--deposits', type=int, default=5, help='Депозитов у клиента')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Депозитов в порции run_accrual')
+        parser.add_argument('--baseline', type=int, default=2000, help='Депозитов для цикла по одному')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        with bench_clients(options['clients'], cards=1) as (clients, cards):
+            deposits = []
+            for client, card in zip(clients, cards):
+                for _ in range(options['deposits']):
+                    term = random.choice([3, 6, 12, 24])
+                    # Около 5% депозитов заканчиваются к дате расчета
+                    if random.random() < 0.05:
+                        start = today - timedelta(days=term * 30 + random.randint(0, 10))
+                    else:
+                        start = today - timedelta(days=random.randint(1, term * 30 - 1))
+                    deposits.append(Deposit(
+                        client=client, card=card, amount=Decimal(random.randint(10_000, 3_000_000)),
+                        interest_rate=Decimal(random.choice(['8.50', '12.00', '15.75', '18.20'])),
+                        term_months=term, start_date=start, end_date=start + timedelta(days=term * 30),
+                    ))
+            Deposit.objects.bulk_create(deposits, batch_size=5000)
+            queryset = Deposit.objects.filter(client__in=clients)
+            card_ids = [card.id for card in cards]
+            self.stdout.write(f'Депозитов: {queryset.count()}, к выплате: {queryset.filter(end_date__lte=today).count()}')
+
+            baseline = list(queryset.order_by('id')[:options['baseline']])
+            with Timer() as timer:
+                self._per_row(baseline, today)
+            self.stdout.write(f'Цикл по одному депозиту: {len(baseline) / timer.elapsed:.0f} депозитов/с')
+            expected = {deposit.id: deposit.accrued_interest for deposit in baseline}
+            # Возвращаем депозиты цикла в исходное состояние, чтобы сравнить результат run_accrual
+            queryset.filter(id__in=expected).update(accrued_interest=0, accrued_through=None, is_active=True)
+            DepositAccrual.objects.filter(deposit_id__in=expected).delete()
+
+            balance_before = self._total(card_ids)
+            with Timer() as timer:
+                total = run_accrual(today, options['chunk_size'])
+            self.stdout.write(
+                f'run_accrual: {total["deposits"] / timer.elapsed:.0f} депозитов/с; начислено {total["interest"]}, '
+                f'выплачено {total["paid_out"]} по {total["matured"]} депозитам ({total["transactions"]} операций)'
+            )
+            repeat = run_accrual(today, options['chunk_size'])
+            self.stdout.write(f'Повторный запуск: обработано депозитов {repeat["deposits"]}')
+
+            accrued = dict(queryset.filter(id__in=expected).values_list('id', 'accrued_interest'))
+            mismatched = sum(1 for deposit_id, value in expected.items() if accrued[deposit_id] != value)
+            ledger = round(DepositAccrual.objects.filter(deposit__in=queryset).aggregate(total=Sum('amount'))['total'] or 0, 2)
+            paid = self._total(card_ids) - balance_before
+            if not mismatched and not repeat['deposits'] and ledger == total['interest'] and paid == total['paid_out']:
+                self.stdout.write(self.style.SUCCESS(
+                    'Проценты совпадают с расчетом на Decimal, журнал сходится, повтор ничего не начислил'
+                ))
+            else:
+                self.stdout.write(self.style.ERROR(
+                    f'Расхождение: не совпало депозитов {mismatched}, журнал {ledger}, выплачено {paid}'
+                ))
+
+    @staticmethod
+    def _per_row(deposits, accrual_date):
+        """Как без run_accrual: расчет на Decimal, сохранение и выплата по одному депозиту"""
+        for deposit in deposits:
+            through = min(deposit.end_date, accrual_date)
+            days = max((through - deposit.start_date).days, 0)
+            total = (deposit.amount * deposit.interest_rate / 100 * days / DAYS_IN_YEAR).quantize(
+                Decimal('0.01'), rounding=ROUND_HALF_UP,
+            )
+            with db_transaction.atomic():
+                if total > deposit.accrued_interest:
+                    DepositAccrual.objects.create(
+                        deposit=deposit, period_start=deposit.start_date + timedelta(days=1), period_end=through,
+                        amount=total - deposit.accrued_interest, total=total,
+                    )
+                    deposit.accrued_interest = total
+                deposit.accrued_through = through
+                if deposit.end_date <= accrual_date:
+                    post_transaction('deposit', deposit.amount, to_card=deposit.card,
+                                     description=f'Возврат вклада по депозиту #{deposit.id}')
+                    if total:
+                        post_transaction('deposit', total, to_card=deposit.card,
+                                         description=f'Проценты по депозиту #{deposit.id}')
+                    deposit.is_active = False
+                deposit.save(update_fields=['accrued_interest', 'accrued_through', 'is_active'])
+
+    @staticmethod
+    def _total(card_ids):
+        return BankCard.objects.filter(id__in=card_ids).aggregate(total=Sum('balance'))['total']
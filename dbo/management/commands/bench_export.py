@@ -0,0 +1,37 @@
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from dbo.export import export_queryset, export_response
+
+from ._bench import bench_clients, seed_transactions, Timer
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест выгрузки истории: скорость и пиковая память при потоковой отдаче'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=500_000, help='Сколько транзакций сгенерировать')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', help='Формат выгрузки')
+
+    def handle(self, *args, **options):
+        # Один клиент с несколькими картами: все операции попадают в его историю
+        with bench_clients(1, cards=4) as (clients, cards):
+            seed_transactions(cards, options['transactions'], progress=self.stdout.write)
+            client = clients[0]
+
+            tracemalloc.start()
+            size = 0
+            lines = 0
+            with Timer() as timer:
+                response = export_response(export_queryset(client), client, options['format'], 'bench')
+                for chunk in response.streaming_content:
+                    size += len(chunk)
+                    lines += 1
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            self.stdout.write(f'Строк: {lines}, объем: {size / 2**20:.1f} МБ, время: {timer.elapsed:.2f} с')
+            self.stdout.write(f'Строк/сек: {lines / timer.elapsed:.0f}')
+            self.stdout.write(f'Пиковая память Python во время выгрузки: {peak / 2**20:.2f} МБ')
+            self.stdout.write('Удаление тестовых данных...')
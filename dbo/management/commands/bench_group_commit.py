@@ -0,0 +1,107 @@
+import random
+import threading
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+
+from dbo.group_commit import post_batched
+from dbo.models import BankCard, Transaction
+from dbo.posting import post_transaction, PostingError
+
+from ._bench import bench_client, percentile, Timer
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест групповой фиксации: переводы отдельными транзакциями '
+            'против пачек при 1/10/100 параллельных клиентах')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', default='1,10,100', help='Уровни параллельности через запятую')
+        parser.add_argument('--transfers', type=int, default=2000, help='Переводов на каждый замер')
+        parser.add_argument('--cards', type=int, default=200, help='Количество карт в тесте')
+        parser.add_argument('--balance', type=Decimal, default=Decimal('100000.00'), help='Начальный баланс карты')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['clients'].split(',')]
+        with bench_client(cards=options['cards'], balance=options['balance']) as (client, cards):
+            card_ids = [card.id for card in cards]
+            # Лимит не должен мешать замеру
+            BankCard.objects.filter(id__in=card_ids).update(daily_limit=Decimal('99999999.99'))
+            total_before = self._total(card_ids)
+
+            for workers in levels:
+                for title, post in (('Отдельные транзакции', post_transaction), ('Групповая фиксация', post_batched)):
+                    elapsed, latencies, stats = self._run(post, cards, workers, options['transfers'])
+                    self.stdout.write(
+                        f'{workers:>3} клиентов, {title}: {stats["ok"] / elapsed:.0f} переводов/с, '
+                        f'p50 {percentile(latencies, 50):.1f} мс, p99 {percentile(latencies, 99):.1f} мс, '
+                        f'отказов: {stats["rejected"]}, ошибок: {stats["errors"]}'
+                    )
+
+            total_after = self._total(card_ids)
+            drift = self._drift(card_ids, options['balance'])
+            self.stdout.write(f'Сумма балансов: {total_before} → {total_after}')
+            if total_before == total_after and drift == 0:
+                self.stdout.write(self.style.SUCCESS('Деньги сохранены: расхождений нет'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Обнаружены расхождения: карт с ошибкой баланса — {drift}'))
+
+    @staticmethod
+    def _run(post, cards, workers, transfers):
+        per_worker = max(1, transfers // workers)
+        latencies = []
+        stats = {'ok': 0, 'rejected': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker():
+            local_latencies = []
+            local = {'ok': 0, 'rejected': 0, 'errors': 0}
+            try:
+                for _ in range(per_worker):
+                    src, dst = random.sample(cards, 2)
+                    with Timer() as timer:
+                        try:
+                            post('transfer', Decimal(random.randint(1, 500)), from_card=BankCard(pk=src.pk),
+                                 to_card=BankCard(pk=dst.pk), description='bench')
+                            local['ok'] += 1
+                        except PostingError:
+                            local['rejected'] += 1
+                        except Exception:
+                            local['errors'] += 1
+                    local_latencies.append(timer.elapsed * 1000)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                for key, value in local.items():
+                    stats[key] += value
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        with Timer() as timer:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return timer.elapsed, latencies, stats
+
+    @staticmethod
+    def _total(card_ids):
+        return BankCard.objects.filter(id__in=card_ids).aggregate(total=Sum('balance'))['total']
+
+    @staticmethod
+    def _drift(card_ids, balance):
+        """Карт, у которых баланс не равен начальному плюс оборот по транзакциям"""
+        incoming = dict(
+            Transaction.objects.filter(to_card_id__in=card_ids).values('to_card').annotate(s=Sum('amount'))
+            .values_list('to_card', 's')
+        )
+        outgoing = dict(
+            Transaction.objects.filter(from_card_id__in=card_ids).values('from_card').annotate(s=Sum('amount'))
+            .values_list('from_card', 's')
+        )
+        return sum(
+            card_balance != balance + incoming.get(card_id, 0) - outgoing.get(card_id, 0) or card_balance < 0
+            for card_id, card_balance in BankCard.objects.filter(id__in=card_ids).values_list('id', 'balance')
+        )
@@ -0,0 +1,87 @@
+import threading
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Sum
+
+from dbo.hot_accounts import card_balances, fold, set_hot
+from dbo.models import BankCard, Transaction
+from dbo.posting import post_transaction
+
+from ._bench import bench_clients, percentile, Timer
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест горячей карты: параллельные зачисления на одну карту '
+            'с обычной блокировкой строки и со строками CardBalanceShard')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=32, help='Параллельных отправителей')
+        parser.add_argument('--transfers', type=int, default=3000, help='Зачислений на каждый замер')
+        parser.add_argument('--shards', type=int, default=16, help='Строк у горячей карты')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        with bench_clients(workers + 1, cards=1) as (clients, cards):
+            target, senders = cards[0], cards[1:]
+            BankCard.objects.filter(id__in=[card.id for card in senders]).update(daily_limit=Decimal('99999999.99'))
+            card_ids = [card.id for card in cards]
+            total_before = sum(card_balances(card_ids).values())
+
+            for title, shards in (('Обычная карта', 0), (f'Горячая карта, строк: {options["shards"]}', options['shards'])):
+                set_hot(target.id, shards)
+                elapsed, latencies, errors = self._run(target, senders, options['transfers'])
+                self.stdout.write(
+                    f'{title}: {(len(latencies) - errors) / elapsed:.0f} зачислений/с, '
+                    f'p50 {percentile(latencies, 50):.1f} мс, p99 {percentile(latencies, 99):.1f} мс, ошибок: {errors}'
+                )
+
+            with Timer() as timer:
+                folded = fold(target.id)
+            self.stdout.write(f'Перенос строк в баланс: {folded} за {timer.elapsed * 1000:.1f} мс')
+            set_hot(target.id, 0)
+
+            total_after = sum(card_balances(card_ids).values())
+            incoming = Transaction.objects.filter(to_card=target).aggregate(total=Sum('amount'))['total']
+            target_balance = BankCard.objects.get(id=target.id).balance
+            self.stdout.write(f'Сумма балансов: {total_before} → {total_after}')
+            if total_before == total_after and target_balance == target.balance + incoming:
+                self.stdout.write(self.style.SUCCESS('Деньги сохранены: расхождений нет'))
+            else:
+                self.stdout.write(self.style.ERROR('Обнаружены расхождения'))
+
+    @staticmethod
+    def _run(target, senders, transfers):
+        per_worker = max(1, transfers // len(senders))
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def worker(sender):
+            nonlocal errors
+            local_latencies = []
+            local_errors = 0
+            to_card = BankCard(pk=target.pk)
+            try:
+                for _ in range(per_worker):
+                    with Timer() as timer:
+                        try:
+                            post_transaction('transfer', Decimal('1.00'), from_card=BankCard(pk=sender.pk),
+                                             to_card=to_card, description='bench')
+                        except Exception:
+                            local_errors += 1
+                    local_latencies.append(timer.elapsed * 1000)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors += local_errors
+
+        threads = [threading.Thread(target=worker, args=(sender,)) for sender in senders]
+        with Timer() as timer:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return timer.elapsed, latencies, errors
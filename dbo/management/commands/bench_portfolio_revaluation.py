@@ -0,0 +1,114 @@
+import random
+import uuid
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from dbo.investments import revalue_positions
+from dbo.models import ClientInvestment, InvestmentProduct, ProductPrice
+
+from ._bench import bench_clients, Timer
+
+CENT = Decimal('0.01')
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест переоценки портфелей: две выборки цен и save() на позицию '
+            'против revalue_investments на массивах NumPy')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--positions', type=int, default=2_000_000, help='Позиций')
+        parser.add_argument('--clients', type=int, default=10_000, help='Клиентов')
+        parser.add_argument('--products', type=int, default=20, help='Продуктов')
+        parser.add_argument('--days', type=int, default=5 * 365, help='Длина рядов цен, дней')
+        parser.add_argument('--chunk-size', type=int, default=50_000, help='Позиций в порции')
+        parser.add_argument('--baseline', type=int, default=1000, help='Позиций для цикла по одной')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        tag = uuid.uuid4().hex[:8]
+        products = InvestmentProduct.objects.bulk_create([
+            InvestmentProduct(name=f'bench {tag} #{i}', description='bench', product_type='pif',
+                              min_amount=1000, risk_level='medium', expected_return=10)
+            for i in range(options['products'])
+        ])
+        try:
+            prices = []
+            for product in products:
+                # Случайное блуждание цены пая; выходные без цен
+                price = 100.0
+                for offset in range(options['days'], -1, -1):
+                    day = today - timedelta(days=offset)
+                    price *= 1 + random.gauss(0.0003, 0.01)
+                    if day.weekday() < 5:
+                        prices.append(ProductPrice(product=product, date=day, price=Decimal(f'{price:.6f}')))
+            ProductPrice.objects.bulk_create(prices, batch_size=10_000)
+            self.stdout.write(f'Цен: {len(prices)}')
+
+            with bench_clients(options['clients'], cards=1) as (clients, _):
+                batch = []
+                for i in range(options['positions']):
+                    batch.append(ClientInvestment(
+                        client=clients[i % len(clients)], product=random.choice(products),
+                        amount=Decimal(random.randint(10, 1000) * 1000),
+                        purchase_date=today - timedelta(days=random.randint(0, options['days'])),
+                    ))
+                    if len(batch) == 10_000:
+                        ClientInvestment.objects.bulk_create(batch)
+                        batch = []
+                ClientInvestment.objects.bulk_create(batch)
+                positions = ClientInvestment.objects.filter(product__in=products)
+                self.stdout.write(f'Позиций: {positions.count()}')
+
+                baseline = list(positions.order_by('id')[:options['baseline']])
+                with Timer() as timer:
+                    for position in baseline:
+                        self._per_row(position, today)
+                self.stdout.write(f'Цикл по одной позиции: {len(baseline) / timer.elapsed:.0f} позиций/с')
+                expected = {position.id: (position.current_value, position.return_percent) for position in baseline}
+
+                with Timer() as timer:
+                    total = revalue_positions(today, options['chunk_size'])
+                self.stdout.write(
+                    f'revalue_investments: {total["positions"]} позиций за {timer.elapsed:.1f} с '
+                    f'({total["positions"] / timer.elapsed:.0f}/с); изменено {total["revalued"]}'
+                )
+                with Timer() as timer:
+                    repeat = revalue_positions(today, options['chunk_size'])
+                self.stdout.write(f'Повторный запуск: {timer.elapsed:.1f} с, изменено {repeat["revalued"]}')
+
+                actual = {
+                    position_id: (value, returns) for position_id, value, returns in
+                    positions.filter(id__in=expected).values_list('id', 'current_value', 'return_percent')
+                }
+                # Decimal и float могут разойтись на копейку при округлении половины
+                mismatched = [
+                    position_id for position_id, (value, returns) in expected.items()
+                    if abs(actual[position_id][0] - value) > CENT or abs(actual[position_id][1] - returns) > CENT
+                ]
+                if not mismatched:
+                    self.stdout.write(self.style.SUCCESS('Стоимости совпадают с расчетом на Decimal'))
+                else:
+                    self.stdout.write(self.style.ERROR(f'Расхождение у {len(mismatched)} позиций: {mismatched[:10]}'))
+                # Удаляем порциями: каскад от клиентов собрал бы все позиции в памяти
+                ids = list(positions.values_list('id', flat=True))
+                for offset in range(0, len(ids), options['chunk_size']):
+                    ClientInvestment.objects.filter(id__in=ids[offset:offset + options['chunk_size']]).delete()
+        finally:
+            InvestmentProduct.objects.filter(id__in=[product.id for product in products]).delete()
+
+    @staticmethod
+    def _per_row(position, on_date):
+        """Как без revalue_investments: две выборки цены и сохранение на каждую позицию"""
+        prices = ProductPrice.objects.filter(product_id=position.product_id).order_by('-date')
+        now = prices.filter(date__lte=on_date).values_list('price', flat=True).first()
+        bought = prices.filter(date__lte=position.purchase_date).values_list('price', flat=True).first()
+        if bought is None:
+            bought = prices.order_by('date').values_list('price', flat=True).first()
+        position.current_value = (position.amount * now / bought).quantize(CENT, rounding=ROUND_HALF_UP)
+        position.return_percent = ((position.current_value / position.amount - 1) * 100).quantize(
+            CENT, rounding=ROUND_HALF_UP
+        )
+        position.save(update_fields=['current_value', 'return_percent'])
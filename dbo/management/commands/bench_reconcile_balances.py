@@ -0,0 +1,72 @@
+import io
+import json
+import random
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import F, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from dbo.models import BalanceCheckpoint, BankCard, Posting, Transaction
+
+from ._bench import bench_clients, seed_transactions, Timer
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест сверки балансов: время reconcile_balances на большом числе карт'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100_000, help='Количество клиентов')
+        parser.add_argument('--cards', type=int, default=2, help='Карт у клиента')
+        parser.add_argument('--transactions', type=int, default=1_000_000, help='Сколько транзакций сгенерировать')
+        parser.add_argument('--drift', type=int, default=100, help='Сколько карт испортить перед сверкой')
+        parser.add_argument('--workers', type=int, default=4, help='Процессов в пуле')
+
+    def handle(self, *args, **options):
+        with bench_clients(options['clients'], cards=options['cards']) as (clients, cards):
+            seed_transactions(cards, options['transactions'], progress=self.stdout.write, journal=True)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {Transaction._meta.db_table}')
+            self.stdout.write(f'Карт всего: {BankCard.objects.count()}')
+
+            # Сгенерированные операции не меняли балансы: приводим их к сумме операций одним UPDATE
+            with Timer() as timer:
+                self._settle(cards)
+            self.stdout.write(f'Балансы по операциям: {timer.elapsed:.1f} с')
+            # Нулевые контрольные точки до первой проводки: сверяется вся история журнала
+            first = Posting.objects.aggregate(first=Min('created_at'))['first']
+            BalanceCheckpoint.objects.bulk_create(
+                [BalanceCheckpoint(card_id=card.id, as_of=first, balance=Decimal('0.00')) for card in cards],
+                batch_size=10_000,
+            )
+
+            drifted = {card.id for card in random.sample(cards, min(options['drift'], len(cards)))}
+            BankCard.objects.filter(id__in=drifted).update(balance=F('balance') + Decimal('0.01'))
+            with Timer() as timer:
+                report = self._reconcile(options['workers'])
+            found = {json.loads(line)['card_id'] for line in report.splitlines()} & {card.id for card in cards}
+            self.stdout.write(
+                f'Сверка: {timer.elapsed:.1f} с, найдено испорченных карт: {len(found & drifted)} из {len(drifted)}, '
+                f'лишних: {len(found - drifted)}'
+            )
+            self.stdout.write('Удаление тестовых данных...')
+
+    @staticmethod
+    def _settle(cards):
+        completed = Transaction.objects.filter(status='completed')
+        incoming = completed.filter(to_card=OuterRef('pk')).values('to_card').annotate(total=Sum('amount')).values('total')
+        outgoing = completed.filter(from_card=OuterRef('pk')).values('from_card').annotate(total=Sum('amount')).values('total')
+        zero = Value(Decimal('0.00'))
+        # Карты тестовых клиентов создаются одной пачкой подряд
+        BankCard.objects.filter(id__gte=cards[0].id, id__lte=cards[-1].id).update(
+            balance=Coalesce(Subquery(incoming), zero) - Coalesce(Subquery(outgoing), zero)
+        )
+
+    @staticmethod
+    def _reconcile(workers, apply=None):
+        out = io.StringIO()
+        call_command('reconcile_balances', workers=workers, apply=apply, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
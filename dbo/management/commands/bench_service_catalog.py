@@ -0,0 +1,137 @@
+import random
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.shortcuts import render
+from django.test import RequestFactory
+
+from dbo.catalog import CATALOG_ORDERINGS, PRICE_BUCKETS, invalidate_catalog
+from dbo.facets import compute_facets, facet_counts, rebuild_facets
+from dbo.models import Service, ServiceCategory
+from dbo.views import banking_services
+
+from ._bench import percentile, Timer
+
+WORDS = ['перевод', 'карта', 'кэшбэк', 'страховка', 'кредит', 'вклад', 'бизнес', 'премиум', 'валюта', 'онлайн',
+         'подписка', 'консультация', 'уведомления', 'лимит', 'платеж', 'счет']
+
+
+def _same(counts, computed):
+    return counts == {key: count for key, count in computed.items() if count}
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест страницы каталога услуг: полная выборка категории на каждый запрос '
+            'против кэшированной выборки dbo/catalog.py')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', type=int, default=50_000, help='Услуг в каталоге')
+        parser.add_argument('--categories', type=int, default=10, help='Категорий')
+        parser.add_argument('--samples', type=int, default=200, help='Запросов страницы на вариант')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        categories = ServiceCategory.objects.bulk_create([
+            ServiceCategory(name=f'bench {tag} #{i}') for i in range(options['categories'])
+        ])
+        try:
+            batch = []
+            for i in range(options['services']):
+                words = random.sample(WORDS, 3)
+                batch.append(Service(
+                    name=f'{words[0].capitalize()} {words[1]} #{i}',
+                    description=f'Услуга: {" ".join(words)}',
+                    category=categories[i % len(categories)],
+                    price=Decimal(random.choice([0, 0, 99, 490, 1500, 4900, 9900])),
+                    rating=Decimal(random.randint(0, 500)) / 100,
+                    rating_count=random.randint(0, 1000),
+                ))
+                if len(batch) == 10_000:
+                    Service.objects.bulk_create(batch)
+                    batch = []
+            Service.objects.bulk_create(batch)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {Service._meta.db_table}')
+            # bulk_create не вызывает сигналов: счетчики фасетов пересчитываются явно
+            rebuild_facets()
+            invalidate_catalog()
+            self.stdout.write(f'Услуг: {options["services"]}, категорий: {len(categories)}')
+
+            for title, run in (('Счетчики: GROUP BY по услугам', compute_facets), ('Счетчики фасетов', facet_counts)):
+                timings = []
+                for _ in range(20):
+                    with Timer() as timer:
+                        run()
+                    timings.append(timer.elapsed * 1000)
+                self.stdout.write(f'{title}: p50 {percentile(timings, 50):.2f} мс')
+
+            factory = RequestFactory()
+            queries = [
+                {
+                    'category': random.choice(categories).name,
+                    'price': random.choice(['all', *PRICE_BUCKETS]),
+                    'sort': random.choice(list(CATALOG_ORDERINGS)),
+                    'q': random.choice(['', '', random.choice(WORDS)]),
+                }
+                for _ in range(20)
+            ]
+
+            def request(params):
+                req = factory.get('/banking-services/', params)
+                req.user = AnonymousUser()
+                return req
+
+            def full_category(params):
+                # Прежняя страница: все услуги категории и все категории с prefetch услуг
+                req = request(params)
+                list(ServiceCategory.objects.prefetch_related('service_set'))
+                services = list(
+                    Service.objects.filter(is_active=True, category__name=params['category'])
+                    .order_by('name').values('id', 'uuid', 'name', 'description', 'price', 'rating', 'rating_count')
+                )
+                return render(req, 'banking_services.html', {
+                    'categories': [], 'services_by_category': {params['category']: services},
+                    'connected_services': set(), 'total_services': len(services),
+                })
+
+            def uncached(params):
+                invalidate_catalog()
+                return banking_services(request(params))
+
+            def cached(params):
+                return banking_services(request(params))
+
+            variants = (
+                ('Полная выборка категории', full_category, max(options['samples'] // 10, 5)),
+                ('Каталог без кэша', uncached, options['samples']),
+                ('Каталог из кэша', cached, options['samples']),
+            )
+            for title, run, samples in variants:
+                if run is cached:
+                    for params in queries:
+                        cached(params)
+                timings = []
+                for i in range(samples):
+                    with Timer() as timer:
+                        run(queries[i % len(queries)])
+                    timings.append(timer.elapsed * 1000)
+                self.stdout.write(
+                    f'{title}: p50 {percentile(timings, 50):.2f} мс, p95 {percentile(timings, 95):.2f} мс, '
+                    f'p99 {percentile(timings, 99):.2f} мс'
+                )
+
+            # Новая услуга (как при одобрении заявки) видна в каталоге сразу
+            params = {'category': categories[0].name, 'q': f'новая-{tag}'}
+            banking_services(request(params))
+            Service.objects.create(name=f'Услуга новая-{tag}', description='bench', category=categories[0])
+            visible = f'новая-{tag}' in banking_services(request(params)).content.decode()
+            self.stdout.write(f'Новая услуга видна после сохранения: {visible}')
+            self.stdout.write(f'Счетчики фасетов совпадают с пересчетом: {_same(facet_counts(), compute_facets())}')
+            self.stdout.write('Удаление тестовых данных...')
+        finally:
+            ServiceCategory.objects.filter(id__in=[category.id for category in categories]).delete()
+            invalidate_catalog()
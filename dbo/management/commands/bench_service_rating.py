@@ -0,0 +1,115 @@
+import random
+import threading
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction as db_transaction
+from django.db.models import Count, Sum
+
+from dbo.models import Service, ServiceCategory, ServiceVote
+from dbo.ratings import average, flush_ratings, rate
+
+from ._bench import bench_clients, percentile, Timer
+
+
+def rate_locking(service_id, client_id, score):
+    """Прежний подход: оценка сразу пересчитывает рейтинг под блокировкой строки услуги"""
+    with db_transaction.atomic():
+        service = Service.objects.select_for_update().get(id=service_id)
+        vote = ServiceVote.objects.filter(service_id=service_id, client_id=client_id).first()
+        if vote is None:
+            ServiceVote.objects.create(service_id=service_id, client_id=client_id, score=score)
+            service.rating_count += 1
+            service.rating_total += score
+        elif vote.score != score:
+            service.rating_total += score - vote.score
+            vote.score = score
+            vote.save(update_fields=['score', 'voted_at'])
+        service.rating = average(service.rating_total, service.rating_count)
+        service.save(update_fields=['rating', 'rating_count', 'rating_total'])
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест оценок услуг: параллельные голоса за одну популярную услугу '
+            'с блокировкой строки услуги и с накоплением приращений (dbo/ratings.py)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16, help='Параллельных потоков')
+        parser.add_argument('--votes', type=int, default=4000, help='Голосов на каждый замер')
+        parser.add_argument('--clients', type=int, default=2000, help='Голосующих клиентов')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        category = ServiceCategory.objects.create(name=f'bench {tag}')
+        try:
+            with bench_clients(options['clients'], cards=0) as (clients, _):
+                client_ids = [client.id for client in clients]
+                variants = (
+                    ('Блокировка строки услуги', rate_locking),
+                    ('Накопление приращений', rate),
+                )
+                for title, vote in variants:
+                    service = Service.objects.create(name=f'Популярная {tag}', description='bench', category=category)
+                    elapsed, latencies, errors = self._run(vote, service.id, client_ids, options['workers'],
+                                                           options['votes'])
+                    self.stdout.write(
+                        f'{title}: {(len(latencies) - errors) / elapsed:.0f} голосов/с, '
+                        f'p50 {percentile(latencies, 50):.1f} мс, p99 {percentile(latencies, 99):.1f} мс, '
+                        f'ошибок: {errors}'
+                    )
+                    if vote is rate:
+                        with Timer() as timer:
+                            flushed = flush_ratings()
+                        self.stdout.write(f'Перенос приращений: {flushed} за {timer.elapsed * 1000:.1f} мс')
+                    self._check(service.id)
+            self.stdout.write('Удаление тестовых данных...')
+        finally:
+            category.delete()
+
+    def _check(self, service_id):
+        service = Service.objects.get(id=service_id)
+        votes = ServiceVote.objects.filter(service_id=service_id).aggregate(count=Count('id'), total=Sum('score'))
+        if (service.rating_count, service.rating_total) == (votes['count'], votes['total'] or 0) \
+                and service.rating == average(votes['total'] or 0, votes['count']):
+            self.stdout.write(self.style.SUCCESS(
+                f'Рейтинг {service.rating} по {service.rating_count} голосам совпадает с оценками'
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                f'Расхождение: {service.rating_count}/{service.rating_total}, по оценкам {votes["count"]}/{votes["total"]}'
+            ))
+
+    @staticmethod
+    def _run(vote, service_id, client_ids, workers, votes):
+        per_worker = max(1, votes // workers)
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def worker(own_clients):
+            nonlocal errors
+            local_latencies = []
+            local_errors = 0
+            try:
+                for _ in range(per_worker):
+                    client_id = random.choice(own_clients)
+                    with Timer() as timer:
+                        try:
+                            vote(service_id, client_id, random.randint(1, 5))
+                        except Exception:
+                            local_errors += 1
+                    local_latencies.append(timer.elapsed * 1000)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors += local_errors
+
+        # У каждого потока свои клиенты: голоса — и новые, и изменения прежних оценок
+        threads = [threading.Thread(target=worker, args=(client_ids[i::workers],)) for i in range(workers)]
+        with Timer() as timer:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return timer.elapsed, latencies, errors
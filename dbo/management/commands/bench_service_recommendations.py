@@ -0,0 +1,115 @@
+import uuid
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+
+from dbo.models import ClientService, Service, ServiceCategory
+from dbo.recommendations import CooccurrenceMatrix, build_recommendations, load_subscriptions, recommended_services
+
+from ._bench import bench_clients, percentile, Timer
+
+# Услуг в «пакете»: клиент чаще подключает услуги своего пакета
+BUNDLE = 10
+
+
+def live_recommendations(service_id, limit=6):
+    """Прежний подход: рекомендации живым запросом по подпискам клиентов услуги"""
+    clients = ClientService.objects.filter(service_id=service_id, status='active').values('client_id')
+    return list(
+        ClientService.objects.filter(client_id__in=clients, status='active').exclude(service_id=service_id)
+        .values('service_id').annotate(together=Count('id')).order_by('-together', 'service_id')[:limit]
+    )
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест рекомендаций услуг: построение по подпискам (матрица клиент × услуга в NumPy) '
+            'и чтение готовых рекомендаций против живого запроса')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscriptions', type=int, default=1_000_000, help='Подписок клиентов')
+        parser.add_argument('--clients', type=int, default=150_000, help='Клиентов')
+        parser.add_argument('--services', type=int, default=500, help='Услуг')
+        parser.add_argument('--samples', type=int, default=20, help='Запросов рекомендаций на вариант')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng()
+        tag = uuid.uuid4().hex[:8]
+        with bench_clients(options['clients'], cards=0) as (clients, _):
+            category = ServiceCategory.objects.create(name=f'bench {tag}')
+            try:
+                services = Service.objects.bulk_create([
+                    Service(name=f'Услуга {tag} #{i}', description='bench', category=category)
+                    for i in range(options['services'])
+                ])
+                service_ids = np.array([service.id for service in services], dtype=np.int64)
+                client_ids = np.array([client.id for client in clients], dtype=np.int64)
+                pairs = self._subscriptions(rng, client_ids, service_ids, options['subscriptions'])
+                with Timer() as timer:
+                    for start in range(0, len(pairs), 50_000):
+                        ClientService.objects.bulk_create([
+                            ClientService(client_id=client_id, service_id=service_id)
+                            for client_id, service_id in pairs[start:start + 50_000].tolist()
+                        ])
+                if connection.vendor == 'postgresql':
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'ANALYZE {ClientService._meta.db_table}')
+                self.stdout.write(f'Подписок: {len(pairs)} (загрузка {timer.elapsed:.0f} с), '
+                                  f'клиентов: {len(clients)}, услуг: {len(services)}')
+
+                with Timer() as timer:
+                    subscriptions = load_subscriptions()
+                load = timer.elapsed
+                with Timer() as timer:
+                    matrix = CooccurrenceMatrix(*subscriptions)
+                    matrix.cooccurrence()
+                self.stdout.write(f'Загрузка подписок: {load:.1f} с, матрица и пары: {timer.elapsed:.1f} с')
+                with Timer() as timer:
+                    result = build_recommendations()
+                self.stdout.write(
+                    f'build_recommendations: {timer.elapsed:.1f} с; пар услуг {result["pairs"]}, '
+                    f'рекомендаций {result["recommendations"]}'
+                )
+
+                popular = service_ids[:BUNDLE].tolist()
+                variants = (
+                    ('Живой запрос по подпискам', live_recommendations),
+                    ('Готовые рекомендации', recommended_services),
+                )
+                for title, run in variants:
+                    timings = []
+                    for i in range(options['samples']):
+                        with Timer() as timer:
+                            run(popular[i % len(popular)])
+                        timings.append(timer.elapsed * 1000)
+                    self.stdout.write(
+                        f'{title}: p50 {percentile(timings, 50):.1f} мс, p99 {percentile(timings, 99):.1f} мс'
+                    )
+
+                live = [row['service_id'] for row in live_recommendations(popular[0], 3)]
+                stored = [service.id for service in recommended_services(popular[0], 3)]
+                self.stdout.write(f'Совпадают с живым запросом (top-3): {live == stored}')
+                self.stdout.write('Удаление тестовых данных...')
+            finally:
+                category.delete()
+
+    @staticmethod
+    def _subscriptions(rng, client_ids, service_ids, count):
+        """
+        Пары (клиент, услуга) без повторов: у каждого клиента «свой» пакет из
+        BUNDLE услуг, из которого берется большая часть его подписок; пакеты
+        и остальные услуги популярны по закону Ципфа.
+        """
+        bundles = max(1, len(service_ids) // BUNDLE)
+        weights = 1 / np.arange(1, bundles + 1)
+        home = rng.choice(bundles, size=len(client_ids), p=weights / weights.sum())
+        draws = int(count * 1.3)
+        clients = rng.integers(0, len(client_ids), size=draws)
+        in_bundle = rng.random(draws) < 0.7
+        bundle_pick = home[clients] * BUNDLE + rng.integers(0, BUNDLE, size=draws)
+        global_pick = np.minimum(rng.zipf(1.3, size=draws) - 1, len(service_ids) - 1)
+        services = np.minimum(np.where(in_bundle, bundle_pick, global_pick), len(service_ids) - 1)
+        codes = np.unique(clients * len(service_ids) + services)
+        codes = rng.permutation(codes)[:count]
+        return np.stack([client_ids[codes // len(service_ids)], service_ids[codes % len(service_ids)]], axis=1)
@@ -0,0 +1,103 @@
+import random
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from dbo.catalog import catalog_queryset, invalidate_catalog
+from dbo.models import Service, ServiceCategory
+from dbo.service_search import autocomplete, reset_index, service_index
+
+from ._bench import percentile, Timer
+from .bench_service_catalog import WORDS
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест поиска по каталогу услуг: LIKE против полнотекстового поиска с рангом '
+            'и подсказки названий из индекса в памяти')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--services', type=int, default=100_000, help='Услуг в каталоге')
+        parser.add_argument('--categories', type=int, default=10, help='Категорий')
+        parser.add_argument('--samples', type=int, default=2000, help='Запросов подсказок')
+        parser.add_argument('--search-samples', type=int, default=50, help='Поисковых запросов на вариант')
+
+    def _report(self, title, timings):
+        self.stdout.write(
+            f'{title}: p50 {percentile(timings, 50):.3f} мс, p95 {percentile(timings, 95):.3f} мс, '
+            f'p99 {percentile(timings, 99):.3f} мс'
+        )
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        categories = ServiceCategory.objects.bulk_create([
+            ServiceCategory(name=f'bench {tag} #{i}') for i in range(options['categories'])
+        ])
+        try:
+            batch = []
+            for i in range(options['services']):
+                words = random.sample(WORDS, 3)
+                batch.append(Service(
+                    name=f'{words[0].capitalize()} {words[1]} {tag}{i}',
+                    description=f'Услуга: {" ".join(words)}',
+                    category=categories[i % len(categories)],
+                    price=Decimal(random.choice([0, 99, 490, 1500, 4900])),
+                ))
+                if len(batch) == 10_000:
+                    Service.objects.bulk_create(batch)
+                    batch = []
+            Service.objects.bulk_create(batch)
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {Service._meta.db_table}')
+            invalidate_catalog()
+            reset_index()
+            self.stdout.write(f'Услуг: {options["services"]}')
+
+            with Timer() as timer:
+                index = service_index()
+            self.stdout.write(f'Построение индекса подсказок: {timer.elapsed:.2f} с, услуг в индексе: {len(index.services)}')
+
+            prefixes = [word[:random.randint(1, len(word))] for word in random.choices(WORDS, k=500)]
+            prefixes += [f'{a} {b[:3]}' for a, b in (random.sample(WORDS, 2) for _ in range(100))]
+            timings = []
+            for i in range(options['samples']):
+                with Timer() as timer:
+                    autocomplete(prefixes[i % len(prefixes)])
+                timings.append(timer.elapsed * 1000)
+            self._report('Подсказки', timings)
+
+            queries = [random.sample(WORDS, random.randint(1, 2)) for _ in range(options['search_samples'])]
+            variants = (
+                ('LIKE по названию и описанию', lambda words: list(
+                    Service.objects.filter(is_active=True, *[
+                        Q(name__icontains=word) | Q(description__icontains=word) for word in words
+                    ]).order_by('name')[:60]
+                )),
+                ('Поиск с рангом', lambda words: list(catalog_queryset('', 'all', 'relevance', tuple(words))[:60])),
+            )
+            for title, run in variants:
+                timings = []
+                for words in queries:
+                    with Timer() as timer:
+                        run(words)
+                    timings.append(timer.elapsed * 1000)
+                self._report(title, timings)
+
+            # Изменения услуг попадают в индекс по строке, без перестроения
+            timings = []
+            for i in range(100):
+                service = Service.objects.create(name=f'Новинка{tag}x{i}', description='bench', category=categories[0])
+                with Timer() as timer:
+                    found = autocomplete(f'новинка{tag}x{i}')
+                timings.append(timer.elapsed * 1000)
+                if not found or found[0]['id'] != service.id:
+                    self.stdout.write(f'Новая услуга {service.id} не найдена в подсказках')
+            self._report('Подсказка сразу после сохранения услуги', timings)
+            self.stdout.write('Удаление тестовых данных...')
+        finally:
+            ServiceCategory.objects.filter(id__in=[category.id for category in categories]).delete()
+            invalidate_catalog()
+            reset_index()
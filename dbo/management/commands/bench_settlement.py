@@ -0,0 +1,72 @@
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+
+from dbo.models import BankCard
+from dbo.posting import post_transaction, PostingError
+from dbo.settlement import settle_pending, submit_transfer
+
+from ._bench import bench_clients, Timer
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест расчета с неттингом: переводы с проводкой по одному '
+            'против записи в pending и расчета пачками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50, help='Клиентов (как у dbo_user_bot)')
+        parser.add_argument('--transfers', type=int, default=5000, help='Переводов на каждый замер')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Операций в пачке расчета')
+
+    def handle(self, *args, **options):
+        with bench_clients(options['clients'], cards=2) as (clients, cards):
+            card_ids = [card.id for card in cards]
+            BankCard.objects.filter(id__in=card_ids).update(daily_limit=Decimal('99999999.99'))
+            total_before = self._total(card_ids)
+            # Суммы и пары карт как у переводов dbo_user_bot
+            plan = [
+                (random.choice(cards), random.choice(cards), Decimal(random.randint(500, 30000)))
+                for _ in range(options['transfers'])
+            ]
+            plan = [(src, dst, amount) for src, dst, amount in plan if src.id != dst.id]
+
+            posted, elapsed = self._run(post_transaction, plan)
+            self.stdout.write(
+                f'Проводка по одной: {posted / elapsed:.0f} переводов/с, '
+                f'обновлений строк карт: {2 * posted}'
+            )
+
+            submitted, submit_elapsed = self._run(submit_transfer, plan)
+            self.stdout.write(f'Запись в pending: {submitted / submit_elapsed:.0f} переводов/с')
+            total, batches, elapsed = settle_pending(options['batch_size'])
+            self.stdout.write(
+                f'Расчет: пачек {batches}, {total["settled"] / elapsed:.0f} операций/с '
+                f'({batches / elapsed:.1f} пачек/с), отклонено: {total["failed"]}, '
+                f'обновлений строк карт: {total["card_updates"]} вместо {total["card_legs"]}'
+            )
+
+            total_after = self._total(card_ids)
+            self.stdout.write(f'Сумма балансов: {total_before} → {total_after}')
+            if total_before == total_after and not BankCard.objects.filter(id__in=card_ids, balance__lt=0).exists():
+                self.stdout.write(self.style.SUCCESS('Деньги сохранены: расхождений нет'))
+            else:
+                self.stdout.write(self.style.ERROR('Обнаружены расхождения'))
+
+    @staticmethod
+    def _run(post, plan):
+        done = 0
+        with Timer() as timer:
+            for src, dst, amount in plan:
+                try:
+                    post('transfer', amount, from_card=BankCard(pk=src.pk), to_card=BankCard(pk=dst.pk),
+                         description='bench')
+                    done += 1
+                except PostingError:
+                    pass
+        return done, timer.elapsed
+
+    @staticmethod
+    def _total(card_ids):
+        return BankCard.objects.filter(id__in=card_ids).aggregate(total=Sum('balance'))['total']
@@ -0,0 +1,81 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from dbo.history import client_history_paginator
+from dbo.models import Transaction
+from dbo.search import search_transactions, SEARCH_ORDERING
+
+from ._bench import bench_clients, percentile, seed_transactions, Timer
+
+WORDS = [
+    'перевод', 'другу', 'родственнику', 'возврат', 'долга', 'оплата', 'услуг', 'интернета',
+    'мобильной', 'связи', 'ЖКХ', 'подписки', 'товаров', 'электроэнергии', 'пополнение',
+    'через', 'банкомат', 'зарплата', 'средств', 'карты', 'счета', 'снятие', 'наличных',
+    'отделении', 'комиссия', 'обслуживание', 'ежемесячная', 'ресторан', 'такси', 'аптека',
+    'Ёлка', 'подарок', 'аренда', 'квартиры', 'штраф', 'ГИБДД', 'страховка', 'отпуск',
+]
+
+QUERIES = ['перевод', 'оплата интернета', 'перев', 'ЁЛКА', 'комис обсл', 'аренда квартиры', 'штр']
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест поиска по описаниям операций: задержка первой страницы результатов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=1_000_000, help='Сколько транзакций сгенерировать')
+        parser.add_argument('--clients', type=int, default=200, help='Количество клиентов')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Размер пачки bulk_create')
+        parser.add_argument('--samples', type=int, default=100, help='Замеров на каждый запрос')
+
+    def handle(self, *args, **options):
+        with bench_clients(options['clients']) as (clients, cards):
+            with Timer() as timer:
+                seed_transactions(
+                    cards, options['transactions'], options['batch_size'],
+                    description=lambda: ' '.join(random.sample(WORDS, random.randint(2, 4))),
+                    progress=self.stdout.write,
+                )
+            self.stdout.write(f'Генерация: {timer.elapsed:.1f} с')
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(f'ANALYZE {Transaction._meta.db_table}')
+
+            client = random.choice(clients)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'План запроса «{QUERIES[0]}»'))
+            plan_query = search_transactions(Transaction.objects.filter(from_client=client), QUERIES[0], client)
+            self.stdout.write(plan_query.order_by(*SEARCH_ORDERING)[:50].explain())
+
+            # Первый запрос по клиенту строит запасной индекс — замеряется отдельно
+            with Timer() as timer:
+                search_transactions(Transaction.objects.all(), QUERIES[0], client).exists()
+            self.stdout.write(f'Первый поиск по клиенту (холодный): {timer.elapsed * 1000:.2f} мс')
+            for sample_client in clients:
+                search_transactions(Transaction.objects.all(), QUERIES[0], sample_client).exists()
+
+            for query in QUERIES:
+                timings = {'search': [], 'icontains': []}
+                for _ in range(options['samples']):
+                    sample_client = random.choice(clients)
+                    with Timer() as timer:
+                        paginator = client_history_paginator(
+                            sample_client, 50,
+                            search_transactions(Transaction.objects.all(), query, sample_client),
+                            ordering=SEARCH_ORDERING,
+                        )
+                        found = len(paginator.get_page())
+                    timings['search'].append(timer.elapsed * 1000)
+                    with Timer() as timer:
+                        list(client_history_paginator(
+                            sample_client, 50, Transaction.objects.filter(description__icontains=query),
+                        ).get_page())
+                    timings['icontains'].append(timer.elapsed * 1000)
+                self.stdout.write(
+                    f'«{query}» (найдено на странице: {found}): поиск p50 {percentile(timings["search"], 50):.2f} мс, '
+                    f'p95 {percentile(timings["search"], 95):.2f} мс; '
+                    f'icontains p50 {percentile(timings["icontains"], 50):.2f} мс, '
+                    f'p95 {percentile(timings["icontains"], 95):.2f} мс'
+                )
+
+            self.stdout.write('Удаление тестовых данных...')
@@ -0,0 +1,78 @@
+import random
+import threading
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, OperationalError
+from django.db.models import Sum
+
+from dbo.models import BankCard, Transaction
+from dbo.posting import post_transaction, InsufficientFunds, PostingError
+
+from ._bench import bench_client, Timer
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест проводки переводов: переводов/сек и проверка сохранности денег'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cards', type=int, default=20, help='Количество карт в тесте')
+        parser.add_argument('--workers', type=int, default=8, help='Количество параллельных потоков')
+        parser.add_argument('--transfers', type=int, default=2000, help='Всего переводов')
+        parser.add_argument('--balance', type=Decimal, default=Decimal('10000.00'), help='Начальный баланс карты')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        per_worker = max(1, options['transfers'] // workers)
+
+        with bench_client(cards=options['cards'], balance=options['balance']) as (client, cards):
+            card_ids = [card.id for card in cards]
+            total_before = BankCard.objects.filter(id__in=card_ids).aggregate(total=Sum('balance'))['total']
+            stats = {'ok': 0, 'insufficient': 0, 'errors': 0}
+            lock = threading.Lock()
+
+            def worker():
+                local = {'ok': 0, 'insufficient': 0, 'errors': 0}
+                try:
+                    for _ in range(per_worker):
+                        src, dst = random.sample(cards, 2)
+                        amount = Decimal(random.randint(1, 500))
+                        try:
+                            post_transaction('transfer', amount, from_card=BankCard(pk=src.pk),
+                                             to_card=BankCard(pk=dst.pk), description='bench')
+                            local['ok'] += 1
+                        except InsufficientFunds:
+                            local['insufficient'] += 1
+                        except (PostingError, OperationalError):
+                            local['errors'] += 1
+                finally:
+                    connection.close()
+                with lock:
+                    for key, value in local.items():
+                        stats[key] += value
+
+            threads = [threading.Thread(target=worker) for _ in range(workers)]
+            with Timer() as timer:
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            total_after = BankCard.objects.filter(id__in=card_ids).aggregate(total=Sum('balance'))['total']
+
+            # Баланс каждой карты должен совпадать с начальным балансом плюс оборот по транзакциям
+            drift = 0
+            for card in BankCard.objects.filter(id__in=card_ids):
+                incoming = Transaction.objects.filter(to_card=card).aggregate(s=Sum('amount'))['s'] or 0
+                outgoing = Transaction.objects.filter(from_card=card).aggregate(s=Sum('amount'))['s'] or 0
+                if card.balance != options['balance'] + incoming - outgoing or card.balance < 0:
+                    drift += 1
+
+            self.stdout.write(f'Потоков: {workers}, попыток: {per_worker * workers}, время: {timer.elapsed:.2f} с')
+            self.stdout.write(f'Успешно: {stats["ok"]}, недостаточно средств: {stats["insufficient"]}, ошибок: {stats["errors"]}')
+            self.stdout.write(f'Переводов/сек: {stats["ok"] / timer.elapsed:.1f}')
+            self.stdout.write(f'Сумма балансов: {total_before} → {total_after}')
+            if total_before == total_after and drift == 0:
+                self.stdout.write(self.style.SUCCESS('Деньги сохранены: расхождений нет'))
+            else:
+                self.stdout.write(self.style.ERROR(f'Обнаружены расхождения: карт с ошибкой баланса — {drift}'))
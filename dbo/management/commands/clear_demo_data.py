@@ -2,7 +2,7 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
 from dbo.models import (
     Operator, Client, ServiceCategory, Service, ServiceRequest, News,
-    ClientService, BankCard, Transaction,
+    ClientService, BankCard, Transaction, Posting,
     Deposit, Credit, InvestmentProduct, ClientInvestment
 )
 
@@ -50,6 +50,7 @@ class Command(BaseCommand):
         InvestmentProduct.objects.all().delete()
         Credit.objects.all().delete()
         Deposit.objects.all().delete()
+        Posting.objects.all().delete()
         Transaction.objects.all().delete()
         BankCard.objects.all().delete()
         
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from dbo.ledger import cards_needing_checkpoint, create_checkpoints
+from dbo.models import BankCard
+
+
+class Command(BaseCommand):
+    help = 'Создает контрольные точки балансов карт (BalanceCheckpoint) для запросов баланса на дату'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Карт в одной порции (блокируются вместе)')
+        parser.add_argument('--all', action='store_true',
+                            help='Создать точки для всех карт, а не только для карт с проводками после последней точки')
+
+    def handle(self, *args, **options):
+        last_id = 0
+        processed = 0
+        created = 0
+        while True:
+            chunk = list(
+                BankCard.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:options['chunk_size']]
+            )
+            if not chunk:
+                break
+            targets = chunk if options['all'] else cards_needing_checkpoint(chunk)
+            if targets:
+                created += create_checkpoints(targets)
+            processed += len(chunk)
+            last_id = chunk[-1]
+            self.stdout.write(f'Обработано карт: {processed}')
+
+        self.stdout.write(self.style.SUCCESS(f'Создано контрольных точек: {created} (проверено карт: {processed})'))
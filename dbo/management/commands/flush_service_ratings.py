@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dbo.ratings import FLUSH_BATCH, flush_ratings
+
+
+class Command(BaseCommand):
+    help = ('Переносит накопленные оценки услуг (ServiceRatingDelta) в рейтинг и число голосов '
+            'услуг (запускать периодически)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Повторять каждые N секунд (без параметра — один проход)')
+        parser.add_argument('--batch-size', type=int, default=FLUSH_BATCH, help='Приращений в одной транзакции')
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = flush_ratings(options['batch_size'])
+            self.stdout.write(f'Перенесено приращений: {flushed}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dbo.hot_accounts import fold
+from dbo.models import BankCard
+
+
+class Command(BaseCommand):
+    help = ('Переносит зачисления горячих карт из строк CardBalanceShard в баланс '
+            'и статистику владельца (запускать периодически)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Повторять каждые N секунд (без параметра — один проход)')
+
+    def handle(self, *args, **options):
+        while True:
+            cards = list(BankCard.objects.filter(balance_shards__gt=0).order_by('id').values_list('id', flat=True))
+            total = sum(fold(card_id) for card_id in cards)
+            self.stdout.write(f'Горячих карт: {len(cards)}, перенесено: {total}')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,46 @@
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from dbo.models import InvestmentProduct, ProductPrice
+
+
+class Command(BaseCommand):
+    help = ('Загрузка цен паев (NAV) инвестиционных продуктов из CSV со столбцами product_id, date, price; '
+            'существующие цены на ту же дату перезаписываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к CSV-файлу')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Строк в одном upsert')
+
+    def handle(self, *args, **options):
+        products = set(InvestmentProduct.objects.values_list('id', flat=True))
+        loaded = 0
+        batch = []
+        with open(options['path'], newline='', encoding='utf-8') as source:
+            for line, row in enumerate(csv.DictReader(source), start=2):
+                try:
+                    product_id = int(row['product_id'])
+                    day = parse_date(row['date'])
+                    price = Decimal(row['price'])
+                except (KeyError, ValueError, InvalidOperation):
+                    raise CommandError(f'Строка {line}: ожидаются product_id, date (YYYY-MM-DD), price')
+                if day is None or price <= 0:
+                    raise CommandError(f'Строка {line}: неверная дата или цена')
+                if product_id not in products:
+                    raise CommandError(f'Строка {line}: продукт {product_id} не найден')
+                batch.append(ProductPrice(product_id=product_id, date=day, price=price))
+                if len(batch) >= options['batch_size']:
+                    loaded += self._store(batch)
+                    batch = []
+        loaded += self._store(batch)
+        self.stdout.write(self.style.SUCCESS(f'Загружено цен: {loaded}'))
+
+    @staticmethod
+    def _store(batch):
+        ProductPrice.objects.bulk_create(
+            batch, update_conflicts=True, unique_fields=['product', 'date'], update_fields=['price'],
+        )
+        return len(batch)
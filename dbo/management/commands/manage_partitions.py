@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from dbo.partitioning import (
+    add_months, detach_partition, ensure_partitions, is_partitioned,
+    is_supported, list_partitions, month_start, partitions_before,
+)
+
+
+class Command(BaseCommand):
+    help = ('Обслуживание помесячных секций dbo_transaction: создает секции наперед '
+            'и отсоединяет (или удаляет) старые. Запускать по cron раз в сутки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=3, help='На сколько месяцев вперед создавать секции')
+        parser.add_argument('--retain-months', type=int, default=0,
+                            help='Хранить секции за столько месяцев; более старые отсоединяются (0 — не трогать)')
+        parser.add_argument('--drop', action='store_true', help='Удалять отсоединенные секции, а не оставлять таблицами')
+        parser.add_argument('--list', action='store_true', help='Только показать секции')
+
+    def handle(self, *args, **options):
+        if not is_supported(connection):
+            self.stdout.write(self.style.WARNING('Секционирование поддерживается только в PostgreSQL'))
+            return
+
+        with connection.cursor() as cursor:
+            if not is_partitioned(cursor):
+                self.stdout.write(self.style.ERROR('Таблица dbo_transaction не секционирована (см. миграцию 0010)'))
+                return
+
+            if not options['list']:
+                now = timezone.now()
+                with transaction.atomic():
+                    created = ensure_partitions(cursor, now, options['months_ahead'])
+                for name in created:
+                    self.stdout.write(f'Создана секция {name}')
+
+                if options['retain_months'] > 0:
+                    boundary = add_months(month_start(now), -options['retain_months'])
+                    for name in partitions_before(cursor, boundary):
+                        with transaction.atomic():
+                            detach_partition(cursor, name, drop=options['drop'])
+                        action = 'Удалена' if options['drop'] else 'Отсоединена'
+                        self.stdout.write(f'{action} секция {name}')
+
+            for name, start, end in list_partitions(cursor):
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [name])
+                rows = cursor.fetchone()[0]
+                period = f'{start:%Y-%m-%d} — {end:%Y-%m-%d}' if start else 'по умолчанию'
+                self.stdout.write(f'{name}: {period}, ~{max(rows, 0)} строк')
+
+        self.stdout.write(self.style.SUCCESS('Готово'))
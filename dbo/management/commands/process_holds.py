@@ -0,0 +1,48 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from dbo.holds import capture_holds, get_hold_book, release_holds
+from dbo.models import CardHold
+
+
+class Command(BaseCommand):
+    help = ('Обработка удержаний по картам: списание удержаний старше --capture-after секунд '
+            '(клиринг), отмена старше --expire-after-days дней')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--capture-after', type=float,
+                            help='Списать активные удержания старше N секунд')
+        parser.add_argument('--expire-after-days', type=float, default=7,
+                            help='Отменить активные удержания старше N дней')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Удержаний в одной транзакции')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size должен быть положительным')
+        get_hold_book().flush()
+        now = timezone.now()
+        released = self._process(now - timedelta(days=options['expire_after_days']), options['batch_size'],
+                                 lambda hold_ids: len(release_holds(hold_ids)))
+        self.stdout.write(f'Отменено просроченных удержаний: {released}')
+        if options['capture_after'] is not None:
+            captured = self._process(
+                now - timedelta(seconds=options['capture_after']), options['batch_size'],
+                lambda hold_ids: sum(not isinstance(result, Exception) for result in capture_holds(hold_ids).values()),
+            )
+            self.stdout.write(f'Списано удержаний: {captured}')
+
+    @staticmethod
+    def _process(before, batch_size, action):
+        done = 0
+        last_id = 0
+        while True:
+            rows = list(
+                CardHold.objects.filter(created_at__lt=before, id__gt=last_id)
+                .order_by('id').values_list('id', 'hold_id')[:batch_size]
+            )
+            if not rows:
+                return done
+            last_id = rows[-1][0]
+            done += action([hold_id for _, hold_id in rows])
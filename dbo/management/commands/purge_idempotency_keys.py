@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from dbo.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Удаляет истекшие ключи идемпотентности (IdempotencyKey) порциями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Ключей в одном DELETE')
+
+    def handle(self, *args, **options):
+        removed = purge_expired(options['batch_size'], progress=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS(f'Удалено истекших ключей: {removed}'))
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dbo.limits import compute_spend, spend_day, store_spend
+from dbo.models import BankCard, CardDailySpend
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает дневные счетчики списаний по картам (CardDailySpend) по транзакциям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1, help='За сколько последних дней пересчитать (1 — только сегодня)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Карт в одной порции')
+        parser.add_argument('--card', type=int, action='append', help='Пересчитать только указанные карты (id)')
+        parser.add_argument('--prune-days', type=int, default=30,
+                            help='Удалить счетчики старше стольких дней (0 — не удалять)')
+
+    def handle(self, *args, **options):
+        day_to = spend_day()
+        day_from = day_to - timedelta(days=max(options['days'], 1) - 1)
+        cards = BankCard.objects.order_by('id')
+        if options['card']:
+            cards = cards.filter(id__in=options['card'])
+
+        last_id = 0
+        processed = 0
+        removed = 0
+        while True:
+            chunk = list(cards.filter(id__gt=last_id).values_list('id', flat=True)[:options['chunk_size']])
+            if not chunk:
+                break
+            with transaction.atomic():
+                # Блокируем карты порции: проводки по ним ждут, пока счетчики не перезаписаны
+                list(BankCard.objects.select_for_update().filter(id__in=chunk).order_by('id').values_list('id'))
+                removed += store_spend(compute_spend(day_from, day_to, chunk), day_from, day_to, chunk)
+            processed += len(chunk)
+            last_id = chunk[-1]
+            self.stdout.write(f'Обработано карт: {processed}')
+
+        if options['prune_days'] > 0:
+            pruned, _ = CardDailySpend.objects.filter(day__lt=day_to - timedelta(days=options['prune_days'])).delete()
+            self.stdout.write(f'Удалено устаревших счетчиков: {pruned}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики за {day_from:%d.%m.%Y}–{day_to:%d.%m.%Y} пересчитаны для {processed} карт '
+            f'(удалено лишних: {removed})'
+        ))
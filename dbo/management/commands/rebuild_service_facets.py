@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from dbo.catalog import invalidate_catalog
+from dbo.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики фасетов каталога услуг (ServiceFacet) по таблице услуг'
+
+    def handle(self, *args, **options):
+        facets = rebuild_facets()
+        invalidate_catalog()
+        self.stdout.write(self.style.SUCCESS(f'Счетчики фасетов пересчитаны: {facets}'))
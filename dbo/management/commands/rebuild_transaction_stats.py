@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from dbo.hot_accounts import rebuild_stats
+from dbo.models import Client
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику операций клиентов (ClientTransactionStats) порциями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Клиентов в одной порции')
+        parser.add_argument('--client', type=int, action='append', help='Пересчитать только указанных клиентов (id)')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        clients = Client.objects.order_by('id')
+        if options['client']:
+            clients = clients.filter(id__in=options['client'])
+
+        last_id = 0
+        processed = 0
+        while True:
+            chunk = list(clients.filter(id__gt=last_id).values_list('id', flat=True)[:chunk_size])
+            if not chunk:
+                break
+            rebuild_stats(chunk)
+            processed += len(chunk)
+            last_id = chunk[-1]
+            self.stdout.write(f'Обработано клиентов: {processed}')
+
+        self.stdout.write(self.style.SUCCESS(f'Статистика пересчитана для {processed} клиентов'))
@@ -0,0 +1,99 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Max, Min
+
+from dbo.models import BankCard
+from dbo.reconciliation import APPLY_MODES, chunk_ranges, reconcile_chunk
+
+
+def _init_worker():
+    # Нужно при запуске процессов через spawn/forkserver; при fork настройки уже загружены
+    django.setup()
+
+
+def _run_chunk(start, end, apply):
+    try:
+        return start, *reconcile_chunk(start, end, apply)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Сверяет балансы карт с журналом проводок порциями по диапазонам id в пуле процессов; '
+            'расхождения пишет в JSONL, при --apply исправляет')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Диапазон id карт в одной порции')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Процессов в пуле')
+        parser.add_argument('--output', help='Файл отчета JSONL (по умолчанию — stdout); при продолжении дописывается')
+        parser.add_argument('--checkpoint', help='Файл прогресса: при повторном запуске готовые порции пропускаются')
+        parser.add_argument('--apply', choices=APPLY_MODES,
+                            help='adjust — принять текущий баланс (новая контрольная точка), reset — привести баланс к журналу')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        bounds = BankCard.objects.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            self.stdout.write('Карт нет')
+            return
+        ranges = chunk_ranges(bounds['low'], bounds['high'], chunk_size)
+
+        done = self._load_checkpoint(options['checkpoint'], chunk_size)
+        pending = [(start, end) for start, end in ranges if start not in done]
+        self.stderr.write(f'Порций: {len(ranges)}, уже сверено: {len(ranges) - len(pending)}')
+
+        report = open(options['output'], 'a', encoding='utf-8') if options['output'] else None
+        write = (lambda line: report.write(line + '\n')) if report else self.stdout.write
+        checked = 0
+        found = 0
+        unchecked = 0
+        # Соединения родителя закрываются до fork: каждый процесс открывает свое
+        connections.close_all()
+        try:
+            with ProcessPoolExecutor(max_workers=max(options['workers'], 1), initializer=_init_worker) as pool:
+                futures = [pool.submit(_run_chunk, start, end, options['apply']) for start, end in pending]
+                for future in as_completed(futures):
+                    start, cards, mismatches, without_checkpoint = future.result()
+                    for mismatch in mismatches:
+                        write(json.dumps(mismatch, ensure_ascii=False))
+                    if report:
+                        report.flush()
+                    checked += cards
+                    unchecked += without_checkpoint
+                    found += len(mismatches)
+                    done.add(start)
+                    self._save_checkpoint(options['checkpoint'], chunk_size, done)
+                    self.stderr.write(f'Порций: {len(done)}/{len(ranges)}, карт: {checked}, расхождений: {found}')
+        finally:
+            if report:
+                report.close()
+
+        action = {'adjust': 'созданы контрольные точки', 'reset': 'балансы исправлены'}.get(options['apply'], 'только отчет')
+        self.stderr.write(self.style.SUCCESS(f'Сверено карт: {checked}, расхождений: {found} ({action})'))
+        if unchecked:
+            self.stderr.write(f'Без контрольной точки (не сверялись): {unchecked} — запустите create_balance_checkpoints')
+
+    @staticmethod
+    def _load_checkpoint(path, chunk_size):
+        if not path or not os.path.exists(path):
+            return set()
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('chunk_size') != chunk_size:
+            raise CommandError(f'Файл прогресса записан с --chunk-size {state.get("chunk_size")}')
+        return set(state['done'])
+
+    @staticmethod
+    def _save_checkpoint(path, chunk_size, done):
+        if not path:
+            return
+        # Запись через временный файл: прерванный запуск не оставит поврежденный прогресс
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'chunk_size': chunk_size, 'done': sorted(done)}, f)
+        os.replace(tmp, path)
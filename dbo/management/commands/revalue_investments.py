@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from dbo.investments import revalue_positions
+
+
+class Command(BaseCommand):
+    help = ('Переоценка активных инвестиционных позиций по ценам паев (ProductPrice): '
+            'стоимость и доходность порциями, одним upsert на порцию')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Дата переоценки YYYY-MM-DD (по умолчанию сегодня)')
+        parser.add_argument('--chunk-size', type=int, default=50_000, help='Позиций в одной транзакции')
+
+    def handle(self, *args, **options):
+        on_date = parse_date(options['date']) if options['date'] else timezone.localdate()
+        if on_date is None:
+            raise CommandError('Неверная дата: ожидается YYYY-MM-DD')
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size должен быть положительным')
+
+        started = time.monotonic()
+        total = revalue_positions(
+            on_date, options['chunk_size'],
+            progress=lambda total: self.stdout.write(f'Обработано позиций: {total["positions"]}'),
+        )
+        elapsed = time.monotonic() - started
+        rate = total['positions'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Переоценка на {on_date:%d.%m.%Y}: позиций {total["positions"]} за {elapsed:.1f} с ({rate:.0f}/с); '
+            f'изменено {total["revalued"]}, без цен {total["unpriced"]}'
+        ))
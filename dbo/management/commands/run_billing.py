@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from dbo.billing import run_billing
+
+
+class Command(BaseCommand):
+    help = ('Списание ежемесячной платы за подключенные услуги (ClientService) порциями; '
+            'повторный запуск с той же датой ничего не списывает')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Дата списания YYYY-MM-DD (по умолчанию сегодня)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Подписок в одной транзакции')
+
+    def handle(self, *args, **options):
+        billing_date = parse_date(options['date']) if options['date'] else timezone.localdate()
+        if billing_date is None:
+            raise CommandError('Неверная дата: ожидается YYYY-MM-DD')
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size должен быть положительным')
+
+        started = time.monotonic()
+        total = run_billing(
+            billing_date, options['chunk_size'],
+            progress=lambda total: self.stdout.write(
+                f'Обработано подписок: {total["subscriptions"]}, списано: {total["charged"]}'
+            ),
+        )
+        elapsed = time.monotonic() - started
+        rate = total['subscriptions'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Списание на {billing_date:%d.%m.%Y}: подписок {total["subscriptions"]} за {elapsed:.1f} с '
+            f'({rate:.0f}/с); оплачено {total["charged"]} на сумму {total["amount"]} '
+            f'({total["transactions"]} операций), приостановлено {total["suspended"]}, истекло {total["expired"]}'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dbo.hot_accounts import DEFAULT_SHARDS, set_hot
+from dbo.models import BankCard
+
+
+class Command(BaseCommand):
+    help = 'Включает или выключает режим горячей карты (зачисления по строкам CardBalanceShard)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('card_id', type=int, help='id карты')
+        parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS,
+                            help='Число строк для зачислений; 0 выключает режим')
+
+    def handle(self, *args, **options):
+        if options['shards'] < 0:
+            raise CommandError('--shards не может быть отрицательным')
+        if not BankCard.objects.filter(id=options['card_id']).exists():
+            raise CommandError(f'Карта {options["card_id"]} не найдена')
+        set_hot(options['card_id'], options['shards'])
+        state = f'включен, строк: {options["shards"]}' if options['shards'] else 'выключен'
+        self.stdout.write(self.style.SUCCESS(f'Режим горячей карты {options["card_id"]} {state}'))
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from dbo.settlement import settle_pending
+
+
+class Command(BaseCommand):
+    help = ('Расчет отложенных переводов (status=pending): чистая позиция каждой карты '
+            'применяется одним обновлением на пачку')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Операций в пачке (по умолчанию SETTLEMENT_BATCH_SIZE)')
+        parser.add_argument('--interval', type=float,
+                            help='Повторять каждые N секунд (без параметра — один проход)')
+
+    def handle(self, *args, **options):
+        while True:
+            total, batches, elapsed = settle_pending(
+                options['batch_size'],
+                progress=lambda batch, result: self.stdout.write(
+                    f'Пачка {batch}: проведено {result["settled"]}, отклонено {result["failed"]}, '
+                    f'обновлено карт {result["card_updates"]}'
+                ),
+            )
+            if batches:
+                rate = total['settled'] / elapsed if elapsed else 0
+                self.stdout.write(self.style.SUCCESS(
+                    f'Пачек: {batches}, операций: {total["settled"]} ({rate:.0f}/с, '
+                    f'{batches / elapsed:.1f} пачек/с), отклонено: {total["failed"]}; '
+                    f'обновлений строк карт: {total["card_updates"]} вместо {total["card_legs"]}'
+                ))
+            else:
+                self.stdout.write('Нет операций для расчета')
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from dbo.credits import update_credits
+
+
+class Command(BaseCommand):
+    help = ('Ночной пересчет кредитов: график по аннуитету, статус (просрочен/погашен), '
+            'ежемесячный платеж и остаток долга — порциями, одним upsert на порцию')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Дата расчета YYYY-MM-DD (по умолчанию сегодня)')
+        parser.add_argument('--chunk-size', type=int, default=50_000, help='Кредитов в одной транзакции')
+
+    def handle(self, *args, **options):
+        on_date = parse_date(options['date']) if options['date'] else timezone.localdate()
+        if on_date is None:
+            raise CommandError('Неверная дата: ожидается YYYY-MM-DD')
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size должен быть положительным')
+
+        started = time.monotonic()
+        total = update_credits(
+            on_date, options['chunk_size'],
+            progress=lambda total: self.stdout.write(f'Обработано кредитов: {total["credits"]}'),
+        )
+        elapsed = time.monotonic() - started
+        rate = total['credits'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчет на {on_date:%d.%m.%Y}: кредитов {total["credits"]} за {elapsed:.1f} с ({rate:.0f}/с); '
+            f'изменено {total["changed"]}, просрочено {total["overdue"]}, погашено {total["paid"]}'
+        ))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0004_dbolog_delete_attacklog_client_is_privileged_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientTransactionStats',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='transaction_stats', serialize=False, to='dbo.client')),
+                ('total_count', models.PositiveIntegerField(default=0)),
+                ('transfer_count', models.PositiveIntegerField(default=0)),
+                ('payment_count', models.PositiveIntegerField(default=0)),
+                ('deposit_count', models.PositiveIntegerField(default=0)),
+                ('withdrawal_count', models.PositiveIntegerField(default=0)),
+                ('fee_count', models.PositiveIntegerField(default=0)),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('pending_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('cancelled_count', models.PositiveIntegerField(default=0)),
+                ('total_income', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('total_expense', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='bankcard',
+            name='card_type',
+            field=models.CharField(choices=[('debit', 'Дебетовая'), ('credit', 'Кредитная')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='dbolog',
+            name='event_type',
+            field=models.CharField(choices=[('login', 'Вход в систему'), ('logout', 'Выход из системы'), ('client_created', 'Создание клиента'), ('other', 'Прочее')], max_length=50, verbose_name='Тип события'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0005_client_transaction_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dbolog',
+            index=models.Index(fields=['operator', '-created_at', '-id'], name='dbo_dbolog_operato_a28caa_idx'),
+        ),
+    ]
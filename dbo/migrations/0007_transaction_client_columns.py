@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0006_dbolog_operator_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='from_client',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_transactions', to='dbo.client'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='to_client',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='incoming_transactions', to='dbo.client'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 10000
+
+
+def backfill_transaction_clients(apps, schema_editor):
+    """Заполняет from_client/to_client порциями по диапазонам id (каждая порция — отдельный коммит)"""
+    Transaction = apps.get_model('dbo', 'Transaction')
+    BankCard = apps.get_model('dbo', 'BankCard')
+
+    bounds = Transaction.objects.aggregate(low=models.Min('id'), high=models.Max('id'))
+    if bounds['low'] is None:
+        return
+
+    for start in range(bounds['low'], bounds['high'] + 1, BATCH_SIZE):
+        chunk = Transaction.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE)
+        chunk.filter(from_card__isnull=False, from_client__isnull=True).update(
+            from_client_id=Subquery(BankCard.objects.filter(id=OuterRef('from_card_id')).values('client_id')[:1])
+        )
+        chunk.filter(to_card__isnull=False, to_client__isnull=True).update(
+            to_client_id=Subquery(BankCard.objects.filter(id=OuterRef('to_card_id')).values('client_id')[:1])
+        )
+
+
+class Migration(migrations.Migration):
+    # Без общей транзакции: на больших таблицах порции фиксируются по мере выполнения
+    atomic = False
+
+    dependencies = [
+        ('dbo', '0007_transaction_client_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_transaction_clients, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['from_client', '-created_at', '-id'], name='dbo_transac_from_cl_86f908_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['to_client', '-created_at', '-id'], name='dbo_transac_to_clie_7e2f84_idx'),
+        ),
+    ]
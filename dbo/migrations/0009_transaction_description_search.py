@@ -0,0 +1,46 @@
+from django.db import migrations
+
+# Выражение должно совпадать с SearchVector('description', config='russian')
+# из dbo/search.py, иначе планировщик не использует индекс
+FTS_INDEX = 'dbo_transaction_description_fts'
+TRGM_INDEX = 'dbo_transaction_description_trgm'
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {FTS_INDEX} ON dbo_transaction "
+            f"USING gin (to_tsvector('russian'::regconfig, COALESCE(description, ''::text)))"
+        )
+        # pg_trgm есть не во всех сборках PostgreSQL — без него работает только полнотекстовый поиск
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {TRGM_INDEX} ON dbo_transaction '
+            f'USING gin (description gin_trgm_ops)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {TRGM_INDEX}')
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {FTS_INDEX}')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('dbo', '0008_backfill_transaction_clients'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes, atomic=False),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations
+from django.utils import timezone
+
+from dbo.partitioning import is_supported, partition_table, unpartition_table
+
+
+def partition_transactions(apps, schema_editor):
+    if not is_supported(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        partition_table(cursor, timezone.now())
+
+
+def unpartition_transactions(apps, schema_editor):
+    if not is_supported(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        unpartition_table(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0009_transaction_description_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_transactions, unpartition_transactions),
+    ]
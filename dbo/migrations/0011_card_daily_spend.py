@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0010_partition_transaction'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardDailySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_spend', to='dbo.bankcard')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('card', 'day'), name='dbo_carddailyspend_card_day_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0012_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='dbo.bankcard')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('card', 'as_of'), name='dbo_balancecheckpoint_card_as_of_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Posting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('side', models.CharField(choices=[('debit', 'Дебет'), ('credit', 'Кредит')], max_length=6)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('created_at', models.DateTimeField()),
+                ('card', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='dbo.bankcard')),
+                ('transaction', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='postings', to='dbo.transaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['card', 'created_at'], name='dbo_posting_card_id_e85d2a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0013_postings_journal'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankcard',
+            name='balance_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CardBalanceShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('total_count', models.PositiveIntegerField(default=0)),
+                ('transfer_count', models.PositiveIntegerField(default=0)),
+                ('payment_count', models.PositiveIntegerField(default=0)),
+                ('deposit_count', models.PositiveIntegerField(default=0)),
+                ('withdrawal_count', models.PositiveIntegerField(default=0)),
+                ('fee_count', models.PositiveIntegerField(default=0)),
+                ('completed_count', models.PositiveIntegerField(default=0)),
+                ('total_income', models.DecimalField(decimal_places=2, default=0, max_digits=17)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_shard_rows', to='dbo.bankcard')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('card', 'shard'), name='dbo_cardbalanceshard_card_shard_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0015_transaction_pending_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CardHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hold_id', models.UUIDField(unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('merchant', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holds', to='dbo.bankcard')),
+            ],
+        ),
+    ]
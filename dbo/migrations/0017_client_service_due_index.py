@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0016_card_holds'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clientservice',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['next_payment_date', 'id'], name='dbo_clientservice_due_idx'),
+        ),
+    ]
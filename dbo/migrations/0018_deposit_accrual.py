@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0017_client_service_due_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepositAccrual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('period_end', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='deposit',
+            name='accrued_interest',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='deposit',
+            name='accrued_through',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='deposit',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['id'], name='dbo_deposit_active_idx'),
+        ),
+        migrations.AddField(
+            model_name='depositaccrual',
+            name='deposit',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accruals', to='dbo.deposit'),
+        ),
+        migrations.AddConstraint(
+            model_name='depositaccrual',
+            constraint=models.UniqueConstraint(fields=('deposit', 'period_end'), name='dbo_deposit_accrual_uniq'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0018_deposit_accrual'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='paid_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddIndex(
+            model_name='credit',
+            index=models.Index(condition=models.Q(('status', 'paid'), _negated=True), fields=['id'], name='dbo_credit_open_idx'),
+        ),
+        migrations.AddField(
+            model_name='creditpayment',
+            name='credit',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='dbo.credit'),
+        ),
+        migrations.AddField(
+            model_name='creditpayment',
+            name='transaction',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='dbo.transaction'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0019_credit_payment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('price', models.DecimalField(decimal_places=6, max_digits=15)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='clientinvestment',
+            name='return_percent',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=9),
+        ),
+        migrations.AddField(
+            model_name='clientinvestment',
+            name='revalued_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='clientinvestment',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['id'], name='dbo_investment_active_idx'),
+        ),
+        migrations.AddField(
+            model_name='productprice',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='dbo.investmentproduct'),
+        ),
+        migrations.AddConstraint(
+            model_name='productprice',
+            constraint=models.UniqueConstraint(fields=('product', 'date'), name='dbo_product_price_uniq'),
+        ),
+    ]
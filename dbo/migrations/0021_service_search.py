@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:04
+
+from django.db import migrations, models
+
+# Выражение должно совпадать с вектором из dbo/service_search.py, иначе
+# планировщик не использует индекс
+FTS_INDEX = 'dbo_service_fts'
+TRGM_INDEX = 'dbo_service_name_trgm'
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {FTS_INDEX} ON dbo_service USING gin (("
+            f"setweight(to_tsvector('russian'::regconfig, COALESCE(name, ''::text)), 'A') || "
+            f"setweight(to_tsvector('russian'::regconfig, COALESCE(description, ''::text)), 'B')))"
+        )
+        # pg_trgm есть не во всех сборках PostgreSQL — без него работает только полнотекстовый поиск
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {TRGM_INDEX} ON dbo_service USING gin (name gin_trgm_ops)')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {TRGM_INDEX}')
+        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {FTS_INDEX}')
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('dbo', '0020_product_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes, atomic=False),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:08
+
+import django.db.models.deletion
+from collections import Counter
+
+from django.db import migrations, models
+
+from dbo.facets import price_bucket
+
+
+def fill_facets(apps, schema_editor):
+    """Начальные счетчики фасетов по существующим услугам"""
+    Service = apps.get_model('dbo', 'Service')
+    ServiceFacet = apps.get_model('dbo', 'ServiceFacet')
+    counts = Counter(
+        (category_id, price_bucket(price), is_active)
+        for category_id, price, is_active in Service.objects.values_list('category_id', 'price', 'is_active').iterator()
+    )
+    ServiceFacet.objects.bulk_create([
+        ServiceFacet(category_id=category_id, price_bucket=bucket, is_active=is_active, count=count)
+        for (category_id, bucket, is_active), count in counts.items() if bucket is not None
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0021_service_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_bucket', models.CharField(max_length=10)),
+                ('is_active', models.BooleanField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='dbo.servicecategory')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'price_bucket', 'is_active'), name='dbo_service_facet_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+    ]
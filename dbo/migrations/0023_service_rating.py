@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Round
+
+
+def fill_rating_total(apps, schema_editor):
+    """Сумма оценок существующих услуг по их среднему и числу голосов"""
+    Service = apps.get_model('dbo', 'Service')
+    Service.objects.update(rating_total=Round(F('rating') * F('rating_count')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0022_service_facet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='rating_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ServiceRatingDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('votes', models.SmallIntegerField()),
+                ('score', models.SmallIntegerField()),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='dbo.service')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ServiceVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveSmallIntegerField()),
+                ('voted_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='service_votes', to='dbo.client')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='dbo.service')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('service', 'client'), name='dbo_service_vote_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_rating_total, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbo', '0023_service_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServiceRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('clients', models.PositiveIntegerField()),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommended_by', to='dbo.service')),
+                ('service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='dbo.service')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('service', 'rank'), name='dbo_service_recommendation_uniq')],
+            },
+        ),
+    ]
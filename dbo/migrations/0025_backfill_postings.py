@@ -0,0 +1,53 @@
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 10000
+
+
+def backfill_postings(apps, schema_editor):
+    """
+    Строки журнала для проведенных операций, у которых их еще нет (операции
+    до появления журнала в 0013), порциями по диапазонам id. Каждая порция —
+    своя транзакция; повторный запуск после сбоя пропускает операции, у
+    которых строки уже есть.
+    """
+    Transaction = apps.get_model('dbo', 'Transaction')
+    Posting = apps.get_model('dbo', 'Posting')
+    alias = schema_editor.connection.alias
+
+    completed = Transaction.objects.using(alias).filter(status='completed')
+    bounds = completed.aggregate(low=models.Min('id'), high=models.Max('id'))
+    if bounds['low'] is None:
+        return
+
+    for start in range(bounds['low'], bounds['high'] + 1, BATCH_SIZE):
+        end = start + BATCH_SIZE
+        with transaction.atomic(using=alias):
+            posted = Posting.objects.using(alias).filter(transaction_id__gte=start, transaction_id__lt=end)
+            rows = (
+                completed.filter(id__gte=start, id__lt=end)
+                .exclude(id__in=posted.values('transaction_id'))
+                .values_list('id', 'from_card_id', 'to_card_id', 'amount', 'created_at')
+            )
+            Posting.objects.using(alias).bulk_create([
+                entry
+                for tx_id, from_card_id, to_card_id, amount, created_at in rows
+                for entry in (
+                    Posting(transaction_id=tx_id, card_id=from_card_id, side='debit', amount=-amount,
+                            created_at=created_at),
+                    Posting(transaction_id=tx_id, card_id=to_card_id, side='credit', amount=amount,
+                            created_at=created_at),
+                )
+            ])
+
+
+class Migration(migrations.Migration):
+    # Без общей транзакции: на больших таблицах порции фиксируются по мере выполнения
+    atomic = False
+
+    dependencies = [
+        ('dbo', '0024_service_recommendation'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_postings, migrations.RunPython.noop),
+    ]
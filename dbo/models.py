@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 import uuid
 
@@ -50,11 +50,62 @@ class Service(models.Model):
     is_active = models.BooleanField(default=True)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)  # Средняя оценка 0-5
     rating_count = models.PositiveIntegerField(default=0)  # Количество голосов
+    rating_total = models.PositiveIntegerField(default=0)  # Сумма оценок (rating = rating_total / rating_count)
     created_at = models.DateTimeField(auto_now_add=True)
+    # По нему индекс подсказок процесса подтягивает изменения других процессов (dbo/service_search.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def save(self, *args, **kwargs):
+        # Сигнал pre_save читает прежнюю строку под блокировкой (счетчики фасетов, dbo/signals.py):
+        # блокировка должна держаться до конца записи
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
+class ServiceFacet(models.Model):
+    """Число услуг категории в ценовом диапазоне по активности (обновляется при записи услуг, см. dbo/facets.py)"""
+    category = models.ForeignKey(ServiceCategory, on_delete=models.CASCADE, related_name='facets')
+    price_bucket = models.CharField(max_length=10)  # free / low / medium / high
+    is_active = models.BooleanField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'price_bucket', 'is_active'], name='dbo_service_facet_uniq'),
+        ]
+
+class ServiceVote(models.Model):
+    """Оценка услуги клиентом (в рейтинг услуги попадает через ServiceRatingDelta, см. dbo/ratings.py)"""
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='votes')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='service_votes')
+    score = models.PositiveSmallIntegerField()  # 1-5
+    voted_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'client'], name='dbo_service_vote_uniq'),
+        ]
+
+class ServiceRatingDelta(models.Model):
+    """Приращение рейтинга услуги, еще не перенесенное в Service (см. dbo/ratings.py)"""
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='+')
+    votes = models.SmallIntegerField()  # 1 — новая оценка, 0 — измененная
+    score = models.SmallIntegerField()  # Изменение суммы оценок
+
+class ServiceRecommendation(models.Model):
+    """Услуга, которую часто подключают вместе с service (строит build_service_recommendations, см. dbo/recommendations.py)"""
+    service = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Service, on_delete=models.CASCADE, related_name='recommended_by')
+    rank = models.PositiveSmallIntegerField()  # 0 — больше всего общих клиентов
+    clients = models.PositiveIntegerField()  # Клиентов, подключивших обе услуги
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['service', 'rank'], name='dbo_service_recommendation_uniq'),
+        ]
+
 class ServiceRequest(models.Model):
     """Заявки на создание новых услуг"""
     STATUS_CHOICES = [
@@ -98,6 +149,11 @@ class ClientService(models.Model):
 
     class Meta:
         unique_together = ['client', 'service']
+        indexes = [
+            # Выборка подписок к списанию порциями по (next_payment_date, id), см. dbo/billing.py
+            models.Index(fields=['next_payment_date', 'id'], condition=models.Q(status='active'),
+                         name='dbo_clientservice_due_idx'),
+        ]
 
     def __str__(self):
         return f"{self.client.full_name} - {self.service.name} ({self.get_status_display()})"
@@ -115,6 +171,8 @@ class BankCard(models.Model):
     expiry_date = models.DateField()
     is_active = models.BooleanField(default=True)
     daily_limit = models.DecimalField(max_digits=10, decimal_places=2, default=100000)
+    # «Горячая» карта: зачисления раскладываются по balance_shards строкам CardBalanceShard (0 — выключено)
+    balance_shards = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -124,6 +182,9 @@ class Transaction(models.Model):
     """Банковская транзакция"""
     from_card = models.ForeignKey(BankCard, on_delete=models.CASCADE, related_name='outgoing_transactions', null=True, blank=True)
     to_card = models.ForeignKey(BankCard, on_delete=models.CASCADE, related_name='incoming_transactions', null=True, blank=True)
+    # Денормализованные владельцы карт: история клиента читается без JOIN через BankCard
+    from_client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='outgoing_transactions', null=True, blank=True, db_index=False)
+    to_client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='incoming_transactions', null=True, blank=True, db_index=False)
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     currency = models.CharField(max_length=3, default='RUB')
     transaction_type = models.CharField(max_length=20, choices=[
@@ -145,10 +206,163 @@ class Transaction(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # «Последние N операций клиента» — диапазонное сканирование по каждому индексу
+            models.Index(fields=['from_client', '-created_at', '-id']),
+            models.Index(fields=['to_client', '-created_at', '-id']),
+            # Отложенные переводы (dbo/settlement.py): резерв средств карты и выборка для расчета
+            models.Index(fields=['from_card'], condition=models.Q(status='pending'), name='dbo_transaction_pending_idx'),
+        ]
+    
+    def save(self, *args, **kwargs):
+        if self.from_card_id and not self.from_client_id:
+            self.from_client_id = self.from_card.client_id
+        if self.to_card_id and not self.to_client_id:
+            self.to_client_id = self.to_card.client_id
+        super().save(*args, **kwargs)
     
     def __str__(self):
         return f"{self.transaction_type} - {self.amount} {self.currency}"
 
+class ClientTransactionStats(models.Model):
+    """Статистика операций клиента (обновляется при проводке, см. dbo/stats.py)"""
+    client = models.OneToOneField(Client, on_delete=models.CASCADE, primary_key=True, related_name='transaction_stats')
+    total_count = models.PositiveIntegerField(default=0)
+    transfer_count = models.PositiveIntegerField(default=0)
+    payment_count = models.PositiveIntegerField(default=0)
+    deposit_count = models.PositiveIntegerField(default=0)
+    withdrawal_count = models.PositiveIntegerField(default=0)
+    fee_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    cancelled_count = models.PositiveIntegerField(default=0)
+    total_income = models.DecimalField(max_digits=17, decimal_places=2, default=0)  # Входящие от других клиентов
+    total_expense = models.DecimalField(max_digits=17, decimal_places=2, default=0)  # Исходящие другим клиентам
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Статистика {self.client_id}: {self.total_count} операций"
+
+class CardDailySpend(models.Model):
+    """Сумма списаний по карте за день (учитывается при проводке, см. dbo/limits.py)"""
+    card = models.ForeignKey(BankCard, on_delete=models.CASCADE, related_name='daily_spend')
+    day = models.DateField()
+    amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['card', 'day'], name='dbo_carddailyspend_card_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.card_id} {self.day}: {self.amount}"
+
+class CardBalanceShard(models.Model):
+    """
+    Часть зачислений на горячую карту, еще не перенесенная в BankCard.balance
+    и в статистику владельца (см. dbo/hot_accounts.py). Баланс карты —
+    balance плюс сумма ее строк; поля статистики — приращения ClientTransactionStats.
+    """
+    card = models.ForeignKey(BankCard, on_delete=models.CASCADE, related_name='balance_shard_rows')
+    shard = models.PositiveSmallIntegerField()
+    amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    total_count = models.PositiveIntegerField(default=0)
+    transfer_count = models.PositiveIntegerField(default=0)
+    payment_count = models.PositiveIntegerField(default=0)
+    deposit_count = models.PositiveIntegerField(default=0)
+    withdrawal_count = models.PositiveIntegerField(default=0)
+    fee_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+    total_income = models.DecimalField(max_digits=17, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['card', 'shard'], name='dbo_cardbalanceshard_card_shard_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.card_id} #{self.shard}: {self.amount}"
+
+class Posting(models.Model):
+    """
+    Проводка журнала: изменение баланса одной стороны Transaction (см. dbo/ledger.py).
+    На каждую операцию — строка дебета и строка кредита с противоположными
+    суммами; card пуст у внешней стороны (пополнение извне, платеж, снятие).
+    Журнал только дописывается.
+    """
+    # Без внешнего ключа в БД: у секционированной dbo_transaction первичный ключ (id, created_at)
+    transaction = models.ForeignKey(Transaction, on_delete=models.DO_NOTHING, db_constraint=False, related_name='postings')
+    card = models.ForeignKey(BankCard, on_delete=models.CASCADE, null=True, blank=True, related_name='postings', db_index=False)
+    side = models.CharField(max_length=6, choices=[
+        ('debit', 'Дебет'),
+        ('credit', 'Кредит'),
+    ])
+    # Изменение баланса карты: отрицательное для дебета, положительное для кредита
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['card', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.side} {self.card_id}: {self.amount}"
+
+class CardHold(models.Model):
+    """
+    Активное удержание (холд) суммы на карте после авторизации покупки
+    (см. dbo/holds.py). Резервирует средства карты; при списании или отмене
+    строка удаляется, а в историю пишется Transaction.
+    """
+    # Выдается при авторизации в памяти процесса, до записи строки
+    hold_id = models.UUIDField(unique=True)
+    card = models.ForeignKey(BankCard, on_delete=models.CASCADE, related_name='holds')
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    merchant = models.CharField(max_length=100, blank=True)
+    # Момент авторизации
+    created_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.card_id}: {self.amount} ({self.merchant})"
+
+class BalanceCheckpoint(models.Model):
+    """Баланс карты на момент as_of (учтены проводки с created_at < as_of)"""
+    card = models.ForeignKey(BankCard, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    as_of = models.DateTimeField()
+    balance = models.DecimalField(max_digits=15, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['card', 'as_of'], name='dbo_balancecheckpoint_card_as_of_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.card_id} {self.as_of}: {self.balance}"
+
+class IdempotencyKey(models.Model):
+    """Ключ идемпотентности запроса и сохраненный ответ (см. dbo/idempotency.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=64)
+    endpoint = models.CharField(max_length=50)
+    fingerprint = models.CharField(max_length=64)
+    # Пока status_code пуст, запрос с этим ключом еще выполняется
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    headers = models.JSONField(default=dict, blank=True)
+    content = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='dbo_idempotencykey_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.key} ({self.endpoint})"
+
 class Deposit(models.Model):
     """Депозит"""
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='deposits')
@@ -160,10 +374,37 @@ class Deposit(models.Model):
     end_date = models.DateField()
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+    # Начисленные проценты и день, по который они начислены (см. dbo/deposits.py)
+    accrued_interest = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    accrued_through = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Ключ порций начисления: только действующие депозиты
+            models.Index(fields=['id'], name='dbo_deposit_active_idx', condition=models.Q(is_active=True)),
+        ]
+
     def __str__(self):
         return f"Депозит {self.client.full_name} - {self.amount} руб."
 
+class DepositAccrual(models.Model):
+    """Начисление процентов по депозиту за дни period_start..period_end (см. dbo/deposits.py)"""
+    deposit = models.ForeignKey(Deposit, on_delete=models.CASCADE, related_name='accruals')
+    period_start = models.DateField()
+    period_end = models.DateField()
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    # Начислено по депозиту нарастающим итогом
+    total = models.DecimalField(max_digits=15, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['deposit', 'period_end'], name='dbo_deposit_accrual_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Депозит {self.deposit_id}: {self.amount} по {self.period_end}"
+
 class Credit(models.Model):
     """Кредит"""
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='credits')
@@ -180,7 +421,27 @@ class Credit(models.Model):
     start_date = models.DateField()
     end_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
-    
+    # Сумма внесенных платежей (см. dbo/credits.py)
+    paid_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            # Ключ порций ночного пересчета: только непогашенные кредиты
+            models.Index(fields=['id'], name='dbo_credit_open_idx', condition=~models.Q(status='paid')),
+        ]
+
+class CreditPayment(models.Model):
+    """Платеж по кредиту с карты клиента (см. dbo/credits.py)"""
+    credit = models.ForeignKey(Credit, on_delete=models.CASCADE, related_name='payments')
+    # Без внешнего ключа в БД, как у Posting: у секционированной dbo_transaction первичный ключ (id, created_at)
+    transaction = models.ForeignKey(Transaction, on_delete=models.DO_NOTHING, db_constraint=False, null=True,
+                                    blank=True, related_name='+')
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Кредит {self.credit_id}: {self.amount}"
+
 class InvestmentProduct(models.Model):
     """Инвестиционные продукты"""
     name = models.CharField(max_length=200)
@@ -204,6 +465,20 @@ class InvestmentProduct(models.Model):
     def __str__(self):
         return self.name
 
+class ProductPrice(models.Model):
+    """Цена пая (NAV) инвестиционного продукта на дату (см. dbo/investments.py)"""
+    product = models.ForeignKey(InvestmentProduct, on_delete=models.CASCADE, related_name='prices')
+    date = models.DateField()
+    price = models.DecimalField(max_digits=15, decimal_places=6)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='dbo_product_price_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.date}: {self.price}"
+
 class ClientInvestment(models.Model):
     """Инвестиции клиентов"""
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='investments')
@@ -217,6 +492,15 @@ class ClientInvestment(models.Model):
         ('closed', 'Закрытая'),
     ], default='active')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Результат переоценки (dbo/investments.py): доходность позиции в % и дата цены
+    return_percent = models.DecimalField(max_digits=9, decimal_places=2, default=0)
+    revalued_on = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Ключ порций переоценки: только активные позиции
+            models.Index(fields=['id'], name='dbo_investment_active_idx', condition=models.Q(status='active')),
+        ]
 
     def __str__(self):
         return f"{self.client.full_name} - {self.product.name}"
@@ -283,6 +567,7 @@ class DBOLog(models.Model):
             models.Index(fields=['event_type']),
             models.Index(fields=['user']),
             models.Index(fields=['client']),
+            models.Index(fields=['operator', '-created_at', '-id']),  # Keyset-пагинация журнала оператора
         ]
     
     def __str__(self):
@@ -0,0 +1,212 @@
+"""
+Keyset (cursor) пагинация.
+
+В отличие от django.core.paginator.Paginator не делает OFFSET и COUNT(*):
+следующая страница выбирается условием (created_at, id) < (последняя строка),
+поэтому глубокие страницы стоят столько же, сколько первая. Курсоры
+непрозрачны для клиента (base64 от JSON) и передаются в GET-параметре cursor.
+"""
+import base64
+import binascii
+import json
+import logging
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+LAST_PAGE = 'last'
+
+
+def estimate_count(queryset):
+    """
+    Оценка количества строк по плану запроса (PostgreSQL). Для других СУБД
+    или при ошибке возвращает None — точный COUNT(*) не выполняется.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    try:
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    except Exception as e:
+        logger.debug(f"Не удалось оценить количество строк: {e}")
+        return None
+
+
+class KeysetPage:
+    """Страница keyset-пагинатора (интерфейс близок к django Page)"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor, paginator):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def estimated_total(self):
+        return self.paginator.estimated_total
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по уникальному набору полей (по умолчанию ('-created_at', '-id')).
+
+    Args:
+        queryset: Отфильтрованный QuerySet (собственная сортировка игнорируется)
+        per_page: Размер страницы
+        ordering: Поля сортировки; последнее поле должно быть уникальным
+        estimate_total: Считать ли оценку общего количества (см. estimate_count)
+        branches: Список Q-условий, объединяемых через ИЛИ. Каждая ветка
+            выбирается отдельным запросом (своим индексом) с тем же LIMIT,
+            результаты сливаются в Python — аналог UNION двух диапазонных
+            сканирований вместо OR, который СУБД не может обслужить одним индексом.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id'), estimate_total=False, branches=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self.descending = [field.startswith('-') for field in self.ordering]
+        self.branches = list(branches or [])
+        if self.branches and len(set(self.descending)) > 1:
+            raise ValueError('Для веток поддерживается только однонаправленная сортировка')
+        self._estimate_total = estimate_total
+        self._estimated_total = None
+
+    @property
+    def estimated_total(self):
+        if self._estimate_total and self._estimated_total is None:
+            queryset = self.queryset
+            if self.branches:
+                condition = Q()
+                for branch in self.branches:
+                    condition |= branch
+                queryset = queryset.filter(condition)
+            self._estimated_total = estimate_count(queryset)
+        return self._estimated_total
+
+    # Курсоры
+
+    def encode_cursor(self, obj, direction):
+        values = [getattr(obj, field) for field in self.fields]
+        payload = json.dumps([direction, [self._dump(value) for value in values]], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (direction, values) или None для некорректного курсора"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if direction not in ('next', 'prev') or len(raw_values) != len(self.fields):
+                return None
+            values = [self._load(field, value) for field, value in zip(self.fields, raw_values)]
+            # Поля сортировки не бывают NULL, а сравнение с None — ошибка запроса
+            if any(value is None for value in values):
+                return None
+            return direction, values
+        except (ValueError, TypeError, binascii.Error, ValidationError):
+            # ValidationError — значение поля не разбирается (to_python)
+            return None
+
+    @staticmethod
+    def _dump(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        if isinstance(value, (int, float, str)) or value is None:
+            return value
+        return str(value)
+
+    def _load(self, field, value):
+        try:
+            model_field = self.queryset.model._meta.get_field(field)
+        except Exception:
+            # Аннотация (например, ранг поиска)
+            return value
+        return model_field.to_python(value)
+
+    # Выборка
+
+    def _after(self, values, reverse=False):
+        """Условие «строго после values» в порядке сортировки (или до — при reverse)"""
+        condition = Q()
+        for i, field in enumerate(self.fields):
+            descending = self.descending[i] != reverse
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f'{field}__{lookup}': values[i]})
+            for prev_field, prev_value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{prev_field: prev_value})
+            condition |= step
+        return condition
+
+    def _order(self, reverse=False):
+        return [
+            (field if descending == reverse else f'-{field}')
+            for field, descending in zip(self.fields, self.descending)
+        ]
+
+    def _fetch(self, condition=None, reverse=False, limit=None):
+        queryset = self.queryset if condition is None else self.queryset.filter(condition)
+        order = self._order(reverse)
+        if not self.branches:
+            return list(queryset.order_by(*order)[:limit])
+
+        rows = {}
+        for branch in self.branches:
+            for obj in queryset.filter(branch).order_by(*order)[:limit]:
+                rows[obj.pk] = obj
+        merged = sorted(
+            rows.values(),
+            key=lambda obj: tuple(getattr(obj, field) for field in self.fields),
+            reverse=self.descending[0] != reverse,
+        )
+        return merged[:limit]
+
+    def get_page(self, cursor=None):
+        """Возвращает KeysetPage для курсора (None или некорректный — первая страница)"""
+        limit = self.per_page + 1
+
+        if cursor == LAST_PAGE:
+            rows = self._fetch(reverse=True, limit=limit)
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return self._page(rows, has_next=False, has_previous=has_more)
+
+        decoded = self.decode_cursor(cursor) if cursor else None
+        if decoded is None:
+            rows = self._fetch(limit=limit)
+            return self._page(rows[:self.per_page], has_next=len(rows) > self.per_page, has_previous=False)
+
+        direction, values = decoded
+        if direction == 'next':
+            rows = self._fetch(self._after(values), limit=limit)
+            return self._page(rows[:self.per_page], has_next=len(rows) > self.per_page, has_previous=True)
+
+        rows = self._fetch(self._after(values, reverse=True), reverse=True, limit=limit)
+        has_more = len(rows) > self.per_page
+        return self._page(rows[:self.per_page][::-1], has_next=True, has_previous=has_more)
+
+    def _page(self, rows, has_next, has_previous):
+        next_cursor = self.encode_cursor(rows[-1], 'next') if rows and has_next else None
+        previous_cursor = self.encode_cursor(rows[0], 'prev') if rows and has_previous else None
+        return KeysetPage(rows, next_cursor, previous_cursor, self)
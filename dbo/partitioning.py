@@ -0,0 +1,223 @@
+"""
+Помесячное секционирование dbo_transaction по created_at (только PostgreSQL).
+
+Таблица секционируется миграцией 0010: первичный ключ становится
+(id, created_at) — ключ секционирования обязан в него входить, — id
+выдается обычной последовательностью (identity на секционированных
+таблицах появилось только в PostgreSQL 17). Секции называются
+dbo_transaction_pYYYY_MM, границы — начало месяца в UTC. Строки вне
+созданных секций попадают в секцию по умолчанию dbo_transaction_default;
+при создании секции они переносятся в нее.
+
+Будущие секции создает и старые отсоединяет команда manage_partitions.
+В SQLite таблица остается обычной, функции модуля ничего не делают.
+"""
+import re
+from datetime import datetime, timezone as dt_timezone
+
+TABLE = 'dbo_transaction'
+PARTITION_KEY = 'created_at'
+DEFAULT_SUFFIX = 'default'
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def is_supported(connection):
+    return connection.vendor == 'postgresql'
+
+
+def month_start(value):
+    """Начало месяца (UTC) для даты или datetime"""
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(start, months):
+    index = start.year * 12 + start.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(start, table=TABLE):
+    return f'{table}_p{start:%Y_%m}'
+
+
+def default_partition_name(table=TABLE):
+    return f'{table}_{DEFAULT_SUFFIX}'
+
+
+def _literal(value):
+    return f"'{value.isoformat()}'"
+
+
+def is_partitioned(cursor, table=TABLE):
+    cursor.execute(
+        'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+        'WHERE c.relname = %s AND pg_table_is_visible(c.oid)',
+        [table],
+    )
+    return cursor.fetchone() is not None
+
+
+def list_partitions(cursor, table=TABLE):
+    """Возвращает [(имя, начало, конец)] по возрастанию; секция по умолчанию — с границами None"""
+    cursor.execute(
+        'SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent '
+        'WHERE p.relname = %s AND pg_table_is_visible(p.oid)',
+        [table],
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = _BOUND_RE.search(bound or '')
+        if match:
+            start, end = (datetime.fromisoformat(value).astimezone(dt_timezone.utc) for value in match.groups())
+            partitions.append((name, start, end))
+        else:
+            partitions.append((name, None, None))
+    partitions.sort(key=lambda item: (item[1] is None, item[1]))
+    return partitions
+
+
+def create_partition(cursor, start, table=TABLE):
+    """
+    Создает секцию на месяц, начинающийся с start. Строки этого месяца,
+    попавшие в секцию по умолчанию, переносятся в новую секцию.
+    Возвращает False, если секция уже существует.
+    """
+    start = month_start(start)
+    end = add_months(start, 1)
+    name = partition_name(start, table)
+    if any(existing == name for existing, _, _ in list_partitions(cursor, table)):
+        return False
+
+    default = default_partition_name(table)
+    cursor.execute('SELECT to_regclass(%s)', [default])
+    has_default = cursor.fetchone()[0] is not None
+    in_range = f'{PARTITION_KEY} >= {_literal(start)} AND {PARTITION_KEY} < {_literal(end)}'
+    if has_default:
+        cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})')
+        has_default = cursor.fetchone()[0]
+
+    if not has_default:
+        cursor.execute(
+            f'CREATE TABLE {name} PARTITION OF {table} '
+            f'FOR VALUES FROM ({_literal(start)}) TO ({_literal(end)})'
+        )
+        return True
+
+    # Секцию с пересекающимися строками в секции по умолчанию нельзя создать
+    # напрямую: создаем отдельную таблицу, переносим строки и присоединяем
+    cursor.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {default} WHERE {in_range} RETURNING *) '
+        f'INSERT INTO {name} SELECT * FROM moved'
+    )
+    cursor.execute(
+        f'ALTER TABLE {table} ATTACH PARTITION {name} '
+        f'FOR VALUES FROM ({_literal(start)}) TO ({_literal(end)})'
+    )
+    return True
+
+
+def ensure_partitions(cursor, now, months_ahead, table=TABLE):
+    """Создает секции от текущего месяца на months_ahead месяцев вперед; возвращает имена созданных"""
+    created = []
+    current = month_start(now)
+    for offset in range(months_ahead + 1):
+        start = add_months(current, offset)
+        if create_partition(cursor, start, table):
+            created.append(partition_name(start, table))
+    return created
+
+
+def detach_partition(cursor, name, drop=False, table=TABLE):
+    """Отсоединяет секцию (остается отдельной таблицей) или удаляет ее при drop=True"""
+    cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {name}')
+    if drop:
+        cursor.execute(f'DROP TABLE {name}')
+
+
+def partitions_before(cursor, boundary, table=TABLE):
+    """Секции, целиком лежащие до boundary"""
+    return [
+        name for name, _, end in list_partitions(cursor, table)
+        if end is not None and end <= boundary
+    ]
+
+
+def _table_ddl(cursor, table):
+    """Определения индексов (кроме первичного ключа) и внешних ключей таблицы"""
+    cursor.execute(
+        'SELECT indexdef FROM pg_indexes i WHERE i.tablename = %s AND i.schemaname = current_schema() '
+        'AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = '
+        '(quote_ident(i.schemaname) || \'.\' || quote_ident(i.indexname))::regclass AND c.contype = \'p\')',
+        [table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    return indexes, foreign_keys
+
+
+def _rebuild(cursor, table, partitioned, now, months_ahead):
+    """Пересоздает таблицу (секционированной или обычной) с сохранением данных, индексов и ключей"""
+    indexes, foreign_keys = _table_ddl(cursor, table)
+    old = f'{table}_old'
+    sequence = f'{table}_id_seq'
+
+    cursor.execute(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+    cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+    max_id = cursor.fetchone()[0]
+    cursor.execute(f'ALTER TABLE {table} RENAME TO {old}')
+    cursor.execute(f'ALTER TABLE {old} RENAME CONSTRAINT {table}_pkey TO {old}_pkey')
+    for name, _ in foreign_keys:
+        cursor.execute(f'ALTER TABLE {old} DROP CONSTRAINT {name}')
+    cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [old, 'id'])
+    old_sequence = cursor.fetchone()[0]
+    if old_sequence:
+        cursor.execute(f'ALTER SEQUENCE {old_sequence} RENAME TO {old}_id_seq')
+
+    if partitioned:
+        cursor.execute(
+            f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE ({PARTITION_KEY})'
+        )
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id, {PARTITION_KEY})')
+    else:
+        cursor.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS)')
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY (id)')
+    cursor.execute(f'CREATE SEQUENCE {sequence} OWNED BY {table}.id')
+    cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+    cursor.execute('SELECT setval(%s, %s)', [sequence, max(max_id, 1)])
+
+    if partitioned:
+        cursor.execute(f'CREATE TABLE {default_partition_name(table)} PARTITION OF {table} DEFAULT')
+        cursor.execute(f'SELECT MIN({PARTITION_KEY}) FROM {old}')
+        oldest = cursor.fetchone()[0]
+        start = month_start(oldest or now)
+        while start <= add_months(month_start(now), months_ahead):
+            create_partition(cursor, start, table)
+            start = add_months(start, 1)
+
+    cursor.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+    cursor.execute(f'DROP TABLE {old}')
+
+    for indexdef in indexes:
+        cursor.execute(indexdef)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} {definition}')
+    cursor.execute(f'ANALYZE {table}')
+
+
+def partition_table(cursor, now, months_ahead=3, table=TABLE):
+    """Преобразует обычную таблицу в секционированную по месяцам (если еще не)"""
+    if not is_partitioned(cursor, table):
+        _rebuild(cursor, table, True, now, months_ahead)
+
+
+def unpartition_table(cursor, table=TABLE):
+    """Обратное преобразование: секционированная таблица → обычная"""
+    if is_partitioned(cursor, table):
+        _rebuild(cursor, table, False, None, 0)
@@ -0,0 +1,188 @@
+"""
+Проводка денежных операций по картам.
+
+Все изменения балансов выполняются в одной транзакции БД: строки карт
+блокируются в порядке возрастания id (параллельные встречные переводы
+не устраивают взаимоблокировок), списание делается условным
+UPDATE ... SET balance = balance - x WHERE balance >= x, зачисление —
+UPDATE ... SET balance = balance + x, и в той же транзакции создается
+запись Transaction со строками журнала проводок (dbo/ledger.py),
+учитывается дневной лимит карты (dbo/limits.py) и обновляется статистика
+клиентов (dbo/stats.py). Зачисление на горячую карту идет в одну из ее
+строк CardBalanceShard (dbo/hot_accounts.py). Списание не трогает средства,
+зарезервированные отложенными переводами (dbo/settlement.py) и удержаниями
+авторизаций (dbo/holds.py). После
+фиксации сбрасываются кэшированные выписки карт (dbo/statements.py).
+Значения баланса в Python не читаются и не перезаписываются целиком,
+поэтому параллельные воркеры не теряют обновлений.
+"""
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .hot_accounts import card_balances, credit, fold, lock_shared
+from .idempotency import mark_committed
+from .ledger import record_postings
+from .limits import LIMITED_TYPES, consume, spend_day
+from .models import BankCard, CardHold, Transaction
+from .statements import invalidate_cards
+from .stats import apply_deltas, transaction_deltas
+
+
+class PostingError(Exception):
+    """Операция не может быть проведена"""
+
+
+class InsufficientFunds(PostingError):
+    """Недостаточно средств на карте списания"""
+
+
+class DailyLimitExceeded(PostingError):
+    """Списание превышает дневной лимит карты"""
+
+
+def validate_operation(amount, from_card, to_card):
+    """Проверки операции, не требующие БД; возвращает сумму как Decimal"""
+    amount = Decimal(str(amount))
+    if amount <= 0:
+        raise PostingError('Сумма операции должна быть положительной')
+    if from_card is None and to_card is None:
+        raise PostingError('Не указана карта списания или зачисления')
+    if from_card is not None and to_card is not None and from_card.pk == to_card.pk:
+        raise PostingError('Карта списания и карта зачисления совпадают')
+    return amount
+
+
+def lock_cards(card_ids, shared_id=None):
+    """
+    Блокирует карты в детерминированном порядке (по id), карту shared_id —
+    разделяемой блокировкой. Возвращает {card_id: (is_active, client_id,
+    daily_limit, balance_shards)}; у shared_id daily_limit не читается.
+    """
+    fields = ('id', 'is_active', 'client_id', 'daily_limit', 'balance_shards')
+    if shared_id is None:
+        rows = BankCard.objects.select_for_update().filter(id__in=card_ids).order_by('id').values_list(*fields)
+        return {card_id: rest for card_id, *rest in rows}
+    locked = {}
+    for card_id in card_ids:
+        if card_id == shared_id:
+            row = lock_shared(card_id)
+            if row is not None:
+                is_active, client_id, shards = row
+                locked[card_id] = (is_active, client_id, None, shards)
+        else:
+            row = BankCard.objects.select_for_update().filter(id=card_id).values_list(*fields).first()
+            if row is not None:
+                locked[card_id] = row[1:]
+    return locked
+
+
+def reserved_amounts(card_ids):
+    """
+    {card_id: зарезервированная сумма} — исходящие переводы в статусе pending
+    до расчета (dbo/settlement.py) и активные удержания авторизаций
+    (dbo/holds.py); эти средства недоступны для списаний
+    """
+    reserved = dict(
+        Transaction.objects.filter(from_card_id__in=card_ids, status='pending')
+        .values('from_card_id').annotate(total=Sum('amount')).values_list('from_card_id', 'total')
+        .order_by()
+    )
+    held = (
+        CardHold.objects.filter(card_id__in=card_ids)
+        .values('card_id').annotate(total=Sum('amount')).values_list('card_id', 'total')
+        .order_by()
+    )
+    for card_id, total in held:
+        reserved[card_id] = reserved.get(card_id, 0) + total
+    return reserved
+
+
+def debit(card_id, amount):
+    """Условное списание: False, если на balance карты без резерва не хватает средств"""
+    reserved = reserved_amounts([card_id]).get(card_id, 0)
+    return bool(
+        BankCard.objects.filter(id=card_id, balance__gte=amount + reserved).update(balance=F('balance') - amount)
+    )
+
+
+def post_transaction(transaction_type, amount, from_card=None, to_card=None,
+                     description='', currency='RUB'):
+    """
+    Проводит операцию и возвращает созданную Transaction (status='completed').
+
+    Args:
+        transaction_type: Тип операции (из Transaction.transaction_type)
+        amount: Сумма операции (> 0)
+        from_card: Карта списания (None для пополнений)
+        to_card: Карта зачисления (None для платежей, снятий и комиссий)
+        description: Описание операции
+        currency: Валюта
+
+    При нехватке средств выбрасывает InsufficientFunds, при превышении
+    дневного лимита карты списания — DailyLimitExceeded, при прочих
+    ошибках валидации — PostingError; во всех случаях ничего не меняется.
+    После успешной проводки поле balance у переданных объектов карт
+    обновляется значением из БД.
+    """
+    amount = validate_operation(amount, from_card, to_card)
+
+    cards = [card for card in (from_card, to_card) if card is not None]
+    card_ids = sorted(card.pk for card in cards)
+
+    with db_transaction.atomic():
+        # Горячая карта зачисления блокируется разделяемой блокировкой (dbo/hot_accounts.py);
+        # если режим переключат до блокировки, зачисление просто пойдет в balance
+        hot = to_card is not None and BankCard.objects.filter(id=to_card.pk, balance_shards__gt=0).exists()
+        locked = lock_cards(card_ids, shared_id=to_card.pk if hot else None)
+        hot_shards = locked[to_card.pk][3] if hot and to_card.pk in locked else 0
+        for card_id in card_ids:
+            if card_id not in locked or not locked[card_id][0]:
+                raise PostingError('Карта не найдена или заблокирована')
+
+        if from_card is not None:
+            debited = debit(from_card.pk, amount)
+            if not debited and locked[from_card.pk][3]:
+                # У горячей карты часть средств еще в строках CardBalanceShard
+                fold(from_card.pk)
+                debited = debit(from_card.pk, amount)
+            if not debited:
+                raise InsufficientFunds('Недостаточно средств на счете')
+            if transaction_type in LIMITED_TYPES and not consume(
+                from_card.pk, amount, locked[from_card.pk][2], spend_day()
+            ):
+                raise DailyLimitExceeded('Превышен дневной лимит по карте')
+
+        if to_card is not None and not hot_shards:
+            BankCard.objects.filter(id=to_card.pk).update(balance=F('balance') + amount)
+
+        tx = Transaction.objects.create(
+            from_card=from_card,
+            to_card=to_card,
+            from_client_id=locked[from_card.pk][1] if from_card is not None else None,
+            to_client_id=locked[to_card.pk][1] if to_card is not None else None,
+            amount=amount,
+            currency=currency,
+            transaction_type=transaction_type,
+            description=description,
+            status='completed',
+            completed_at=timezone.now(),
+        )
+        record_postings([tx])
+        deltas = transaction_deltas([tx])
+        if hot_shards:
+            # Зачисление и статистика получателя — одним UPDATE строки горячей карты;
+            # перевод между своими картами учитывается в статистике как обычно
+            recipient = deltas.pop(tx.to_client_id) if tx.from_client_id != tx.to_client_id else None
+            credit(to_card.pk, hot_shards, amount, recipient)
+        apply_deltas(deltas)
+        db_transaction.on_commit(lambda: invalidate_cards(card_ids), robust=True)
+        db_transaction.on_commit(mark_committed)
+
+        balances = card_balances(card_ids)
+
+    for card in cards:
+        card.balance = balances[card.pk]
+    return tx
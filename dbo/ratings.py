@@ -0,0 +1,108 @@
+"""
+Оценки услуг клиентами.
+
+Оценка (1-5) хранится строкой ServiceVote — одна на клиента и услугу, ее
+можно изменить. Строку услуги голосование не трогает: иначе все голоса за
+популярную услугу выстраивались бы в очередь за блокировкой одной строки
+Service. Вместо этого рядом с голосом вставляется строка ServiceRatingDelta
+с приращением числа голосов и суммы оценок: новая оценка — (1, оценка),
+изменение — (0, новая - старая). Параллельные голоса вставляют разные
+строки и друг друга не ждут.
+
+Периодически приращения переносит команда flush_service_ratings
+(flush_ratings): пачка строк складывается по услугам, и новые
+rating_count / rating_total / rating = rating_total / rating_count
+записываются одним UPDATE на пачку, после чего строки пачки удаляются.
+До переноса каталог и страница услуги показывают прежний рейтинг.
+"""
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import IntegrityError, transaction as db_transaction
+
+from .catalog import invalidate_catalog
+from .models import Service, ServiceRatingDelta, ServiceVote
+
+SCORES = range(1, 6)
+FLUSH_BATCH = 10_000
+
+
+class RatingError(Exception):
+    """Оценка не принята"""
+
+
+def average(total, count):
+    """Средняя оценка с точностью поля Service.rating"""
+    if not count:
+        return Decimal('0.00')
+    return (Decimal(total) / count).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def rate(service_id, client_id, score):
+    """
+    Сохраняет оценку клиента и приращение рейтинга услуги; возвращает
+    прежнюю оценку клиента (None — первая). Повторная та же оценка ничего
+    не меняет.
+    """
+    if not isinstance(score, int) or isinstance(score, bool) or score not in SCORES:
+        raise RatingError('Оценка должна быть целым числом от 1 до 5')
+    with db_transaction.atomic():
+        votes = ServiceVote.objects.filter(service_id=service_id, client_id=client_id)
+        previous = votes.select_for_update().values_list('score', flat=True).first()
+        if previous is None:
+            try:
+                with db_transaction.atomic():
+                    ServiceVote.objects.create(service_id=service_id, client_id=client_id, score=score)
+            except IntegrityError:
+                # Первая оценка того же клиента пришла параллельно и уже сохранена
+                previous = votes.select_for_update().values_list('score', flat=True).first()
+                if previous is None:
+                    raise
+        if previous is None:
+            ServiceRatingDelta.objects.create(service_id=service_id, votes=1, score=score)
+        elif previous != score:
+            votes.update(score=score)
+            ServiceRatingDelta.objects.create(service_id=service_id, votes=0, score=score - previous)
+    return previous
+
+
+def _flush_batch(batch_size):
+    """Переносит одну пачку приращений; возвращает число перенесенных строк"""
+    with db_transaction.atomic():
+        rows = list(
+            ServiceRatingDelta.objects.select_for_update(skip_locked=True).order_by('id')
+            .values_list('id', 'service_id', 'votes', 'score')[:batch_size]
+        )
+        if not rows:
+            return 0
+        totals = defaultdict(lambda: [0, 0])
+        for _, service_id, votes, score in rows:
+            totals[service_id][0] += votes
+            totals[service_id][1] += score
+        services = list(Service.objects.select_for_update().filter(id__in=totals).order_by('id'))
+        for service in services:
+            votes, score = totals[service.id]
+            service.rating_count += votes
+            service.rating_total += score
+            service.rating = average(service.rating_total, service.rating_count)
+        Service.objects.bulk_create(
+            services,
+            update_conflicts=True,
+            unique_fields=['id'],
+            update_fields=['rating', 'rating_count', 'rating_total'],
+        )
+        # По списку id, а не по «id <= последнего»: строка с меньшим id, зафиксированная
+        # позже чтения, останется до следующего прохода
+        ServiceRatingDelta.objects.filter(id__in=[row[0] for row in rows]).delete()
+        db_transaction.on_commit(invalidate_catalog)
+    return len(rows)
+
+
+def flush_ratings(batch_size=FLUSH_BATCH):
+    """Переносит все накопленные приращения в рейтинг услуг; возвращает число строк"""
+    flushed = 0
+    while True:
+        count = _flush_batch(batch_size)
+        flushed += count
+        if count < batch_size:
+            return flushed
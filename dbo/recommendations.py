@@ -0,0 +1,159 @@
+"""
+Рекомендации услуг: «клиенты, подключившие эту услугу, подключают также».
+
+Живой запрос по ClientService (клиенты услуги → их остальные услуги →
+GROUP BY) на популярной услуге перебирает сотни тысяч подписок на каждый
+показ страницы. Поэтому рекомендации строит команда
+build_service_recommendations: активные подписки загружаются двумя
+массивами NumPy и укладываются в разреженную матрицу клиент × услуга
+(строки CSR — клиенты, отсортированные услуги клиента лежат подряд). Пары
+услуг одного клиента перебираются векторно, порциями по клиентам; число
+клиентов пары (элемент A^T·A) — счетчик одинаковых кодов пары. Для каждой
+услуги остаются TOP_K услуг с наибольшим числом общих клиентов (не меньше
+MIN_CLIENTS) — таблица ServiceRecommendation перезаписывается целиком.
+Клиенты с числом услуг больше MAX_CLIENT_SERVICES (служебные, тестовые)
+пропускаются: их пары — квадрат числа услуг, а о сходстве услуг они
+почти ничего не говорят.
+
+Страница услуги и каталог читают готовые строки одним запросом
+(recommended_services, recommended_for_client); до следующего построения
+рекомендации не меняются, скрытые и отключенные услуги отсекаются при чтении.
+"""
+from itertools import chain
+
+import numpy as np
+from django.db import transaction as db_transaction
+from django.db.models import Sum
+
+from .models import ClientService, ServiceRecommendation
+from .service_search import visible_services
+
+TOP_K = 10
+MIN_CLIENTS = 2
+MAX_CLIENT_SERVICES = 200
+# Пар услуг в одной порции перебора
+PAIR_CHUNK = 2_000_000
+
+RESULT_FIELDS = ('subscriptions', 'clients', 'services', 'pairs', 'recommendations')
+
+
+def load_subscriptions():
+    """Активные подписки: массивы client_id и service_id (int64)"""
+    rows = (
+        ClientService.objects.filter(status='active', service__is_active=True)
+        .values_list('client_id', 'service_id').iterator(chunk_size=50_000)
+    )
+    flat = np.fromiter(chain.from_iterable(rows), dtype=np.int64).reshape(-1, 2)
+    return flat[:, 0], flat[:, 1]
+
+
+class CooccurrenceMatrix:
+    """Разреженная матрица клиент × услуга (CSR) по массивам подписок"""
+
+    def __init__(self, client_ids, service_ids):
+        self.clients, rows = np.unique(client_ids, return_inverse=True)
+        self.services, columns = np.unique(service_ids, return_inverse=True)
+        order = np.lexsort((columns, rows))
+        self.rows = rows[order]
+        self.columns = columns[order]
+        self.indptr = np.searchsorted(self.rows, np.arange(len(self.clients) + 1))
+
+    def cooccurrence(self, max_client_services=MAX_CLIENT_SERVICES, chunk=PAIR_CHUNK):
+        """
+        Ненулевые элементы A^T·A вне диагонали: (услуга, услуга, число общих
+        клиентов) — три массива; индексы услуг — позиции в self.services.
+        """
+        sizes = np.diff(self.indptr)
+        # Клиенты с одной услугой пар не дают
+        eligible = np.nonzero((sizes >= 2) & (sizes <= max_client_services))[0]
+        cumulative = np.cumsum(sizes[eligible].astype(np.int64) ** 2)
+        codes, counts = [], []
+        start = 0
+        while start < len(eligible):
+            done = cumulative[start - 1] if start else 0
+            end = max(start + 1, int(np.searchsorted(cumulative, done + chunk, side='right')))
+            unique, count = np.unique(self._pairs(eligible[start:end], sizes), return_counts=True)
+            codes.append(unique)
+            counts.append(count)
+            start = end
+        if not codes:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty, empty
+        unique, inverse = np.unique(np.concatenate(codes), return_inverse=True)
+        total = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+        return unique // len(self.services), unique % len(self.services), total
+
+    def _pairs(self, clients, sizes):
+        """Коды пар (услуга * число услуг + услуга) всех подписок клиентов clients"""
+        starts, lengths = self.indptr[clients], sizes[clients]
+        # Позиции CSR подписок клиентов, для каждой — начало и длина строки ее клиента
+        positions = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        row_starts, row_lengths = np.repeat(starts, lengths), np.repeat(lengths, lengths)
+        # Каждая подписка — в паре со всеми подписками того же клиента
+        left = np.repeat(positions, row_lengths)
+        right = np.repeat(row_starts, row_lengths) + np.arange(len(left)) - np.repeat(
+            np.cumsum(row_lengths) - row_lengths, row_lengths
+        )
+        other = left != right
+        return self.columns[left[other]] * len(self.services) + self.columns[right[other]]
+
+
+def top_k(first, second, counts, k=TOP_K, min_clients=MIN_CLIENTS):
+    """Для каждой услуги first — до k пар с наибольшим числом клиентов; (first, second, counts, rank)"""
+    keep = counts >= min_clients
+    first, second, counts = first[keep], second[keep], counts[keep]
+    order = np.lexsort((second, -counts, first))
+    first, second, counts = first[order], second[order], counts[order]
+    rank = np.arange(len(first)) - np.searchsorted(first, first, side='left')
+    top = rank < k
+    return first[top], second[top], counts[top], rank[top]
+
+
+def build_recommendations(k=TOP_K, min_clients=MIN_CLIENTS):
+    """Перестраивает таблицу ServiceRecommendation; возвращает {поле RESULT_FIELDS: значение}"""
+    client_ids, service_ids = load_subscriptions()
+    matrix = CooccurrenceMatrix(client_ids, service_ids)
+    first, second, counts = matrix.cooccurrence()
+    pairs = len(counts)
+    first, second, counts, rank = top_k(first, second, counts, k, min_clients)
+    services = matrix.services
+    with db_transaction.atomic():
+        ServiceRecommendation.objects.all().delete()
+        ServiceRecommendation.objects.bulk_create(
+            [
+                ServiceRecommendation(service_id=service_id, recommended_id=recommended_id, rank=position,
+                                      clients=together)
+                for service_id, recommended_id, position, together in zip(
+                    services[first].tolist(), services[second].tolist(), rank.tolist(), counts.tolist()
+                )
+            ],
+            batch_size=5000,
+        )
+    return {
+        'subscriptions': len(client_ids),
+        'clients': len(matrix.clients),
+        'services': len(services),
+        'pairs': pairs,
+        'recommendations': len(first),
+    }
+
+
+def recommended_services(service_id, limit=6):
+    """Услуги, которые чаще всего подключают вместе с service_id"""
+    return list(
+        visible_services().filter(recommended_by__service_id=service_id)
+        .select_related('category').order_by('recommended_by__rank')[:limit]
+    )
+
+
+def recommended_for_client(client_id, limit=6):
+    """
+    Услуги, которые подключают вместе с услугами клиента (число общих
+    клиентов складывается по его услугам); подключенные исключаются.
+    """
+    connected = ClientService.objects.filter(client_id=client_id, status='active').values('service_id')
+    return list(
+        visible_services().filter(recommended_by__service_id__in=connected).exclude(id__in=connected)
+        .annotate(together=Sum('recommended_by__clients')).select_related('category')
+        .order_by('-together', 'id')[:limit]
+    )
@@ -0,0 +1,115 @@
+"""
+Сверка BankCard.balance с журналом проводок (dbo/ledger.py).
+
+Ожидаемый баланс карты — последняя контрольная точка BalanceCheckpoint
+плюс сумма проводок Posting после нее; так учитывается и начальный баланс
+карты (взнос при открытии, начальные данные), который проводкой не
+записывается. Карты без контрольной точки не сверяются и только
+подсчитываются — точки создает create_balance_checkpoints. У горячей карты
+с ожидаемым сравнивается balance вместе со строками CardBalanceShard
+(dbo/hot_accounts.py). Карты сверяются порциями по диапазонам id: на
+порцию один запрос балансов, один — последних точек и один
+сгруппированный запрос проводок после них (индекс card, created_at).
+Порция читается без блокировок, поэтому расхождение перепроверяется под
+блокировкой строки карты: параллельная проводка меняет баланс и пишет
+журнал в одной транзакции и ложного расхождения не дает. Без apply сверка
+ничего не записывает.
+
+Исправления (apply):
+    adjust — принять текущий баланс: новая контрольная точка карты
+             (операции и история клиента не меняются);
+    reset  — привести баланс к журналу.
+"""
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import OuterRef, Subquery, Sum
+
+from .hot_accounts import fold, pending_totals
+from .ledger import create_checkpoints
+from .models import BalanceCheckpoint, BankCard, Posting
+
+ZERO = Decimal('0.00')
+APPLY_MODES = ('adjust', 'reset')
+
+
+def chunk_ranges(low, high, chunk_size):
+    """Диапазоны id [start, end) с шагом chunk_size, покрывающие low..high"""
+    return [(start, min(start + chunk_size, high + 1)) for start in range(low, high + 1, chunk_size)]
+
+
+def expected_balances(start, end):
+    """
+    {card_id: баланс по журналу} для карт с id в [start, end), у которых есть
+    контрольная точка: баланс последней точки плюс проводки с created_at >= as_of.
+    """
+    last = BalanceCheckpoint.objects.filter(card_id=OuterRef('pk')).order_by('-as_of')
+    checkpoints = {
+        card_id: balance
+        for card_id, balance in BankCard.objects.filter(id__gte=start, id__lt=end)
+        .annotate(checkpoint=Subquery(last.values('balance')[:1]))
+        .filter(checkpoint__isnull=False)
+        .values_list('id', 'checkpoint')
+    }
+    if not checkpoints:
+        return {}
+    since = BalanceCheckpoint.objects.filter(card_id=OuterRef('card_id')).order_by('-as_of').values('as_of')[:1]
+    posted = dict(
+        Posting.objects.filter(card_id__gte=start, card_id__lt=end, created_at__gte=Subquery(since))
+        .values('card_id').annotate(total=Sum('amount')).order_by()
+        .values_list('card_id', 'total')
+    )
+    return {card_id: (balance + posted.get(card_id, ZERO)).quantize(ZERO) for card_id, balance in checkpoints.items()}
+
+
+def card_expected_balance(card_id):
+    """Баланс одной карты по журналу (для перепроверки расхождения); None — точки нет"""
+    return expected_balances(card_id, card_id + 1).get(card_id)
+
+
+def reconcile_chunk(start, end, apply=None):
+    """
+    Сверяет карты с id в [start, end). Возвращает (проверено карт, [расхождения],
+    карт без контрольной точки), где расхождение — словарь для отчета JSONL.
+    """
+    rows = list(BankCard.objects.filter(id__gte=start, id__lt=end).values_list('id', 'balance', 'balance_shards'))
+    pending = pending_totals([card_id for card_id, _, shards in rows if shards])
+    balances = {card_id: balance + pending.get(card_id, ZERO) for card_id, balance, _ in rows}
+    expected = expected_balances(start, end)
+    unchecked = sum(1 for card_id in balances if card_id not in expected)
+    suspects = [card_id for card_id, balance in balances.items() if card_id in expected and balance != expected[card_id]]
+
+    mismatches = []
+    for card_id in sorted(suspects):
+        with db_transaction.atomic():
+            row = (
+                BankCard.objects.select_for_update().filter(id=card_id)
+                .values_list('balance', 'balance_shards').first()
+            )
+            if row is None:
+                continue
+            balance, shards = row
+            if shards:
+                # Зачисления на горячую карту ждут блокировки строки карты, строки не меняются
+                balance += pending_totals([card_id]).get(card_id, ZERO)
+            journal = card_expected_balance(card_id)
+            if journal is None or balance == journal:
+                continue
+            difference = balance - journal
+            action = 'reported'
+            if apply == 'adjust':
+                create_checkpoints([card_id])
+                action = 'adjusted'
+            elif apply == 'reset':
+                if shards:
+                    fold(card_id)
+                BankCard.objects.filter(id=card_id).update(balance=journal)
+                action = 'reset'
+        mismatches.append({
+            'card_id': card_id,
+            'balance': str(balance),
+            'expected': str(journal),
+            'difference': str(difference),
+            'action': action,
+        })
+    return len(balances) - unchecked, mismatches, unchecked
@@ -0,0 +1,246 @@
+"""
+Поиск по описаниям операций (Transaction.description).
+
+PostgreSQL: полнотекстовый поиск по to_tsvector('russian', description)
+с префиксными термами («перев:*»), а при установленном pg_trgm — еще и
+триграммное сходство (description % запрос) для опечаток. Оба условия
+обслуживаются GIN-индексами из миграции 0009, ранг — ts_rank + similarity.
+
+Другие СУБД (SQLite в разработке): триграммный индекс NgramIndex в памяти
+процесса по операциям клиента. Индекс дополняется новыми операциями по
+возрастанию id, нормализация (casefold, ё → е) не зависит от СУБД.
+
+Результат в обоих случаях — QuerySet с аннотацией search_rank, который
+пагинируется KeysetPaginator с сортировкой SEARCH_ORDERING.
+"""
+import re
+import threading
+from collections import OrderedDict, defaultdict
+
+from django.db import connections
+from django.db.models import BooleanField, Case, FloatField, Func, Q, Value, When
+from django.db.models.functions import Cast
+
+from .history import client_transactions
+
+SEARCH_CONFIG = 'russian'
+SEARCH_ORDERING = ('-search_rank', '-created_at', '-id')
+# Сколько лучших совпадений отдает запасной индекс
+FALLBACK_LIMIT = 500
+# Совпадений запасного индекса на один запрос проверки фильтров
+FALLBACK_CHUNK = 2000
+# Сколько клиентских индексов держать в памяти процесса
+MAX_CACHED_INDEXES = 256
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    return (text or '').casefold().replace('ё', 'е')
+
+
+def tokenize(text):
+    return _WORD_RE.findall(normalize(text))
+
+
+class NgramIndex:
+    """
+    Триграммный индекс коротких текстов в памяти.
+
+    Слова индексируются с ведущим пробелом (« перевод» → « пе», «пер», ...),
+    поэтому триграммы префикса запроса — подмножество триграмм слова и
+    префиксный поиск сводится к пересечению списков документов. Кандидаты
+    проверяются по словам: каждый токен запроса должен совпасть со словом
+    документа целиком или быть его префиксом.
+    """
+
+    def __init__(self, n=3):
+        self.n = n
+        self.postings = defaultdict(set)
+        self.documents = {}
+
+    def __len__(self):
+        return len(self.documents)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.documents
+
+    def _grams(self, word):
+        padded = f' {word}'
+        return {padded[i:i + self.n] for i in range(len(padded) - self.n + 1)}
+
+    def add(self, doc_id, text):
+        if doc_id in self.documents:
+            self.remove(doc_id)
+        words = tuple(dict.fromkeys(tokenize(text)))
+        self.documents[doc_id] = words
+        for word in words:
+            for gram in self._grams(word):
+                self.postings[gram].add(doc_id)
+
+    def remove(self, doc_id):
+        for word in self.documents.pop(doc_id, ()):
+            for gram in self._grams(word):
+                docs = self.postings.get(gram)
+                if docs is not None:
+                    docs.discard(doc_id)
+                    if not docs:
+                        del self.postings[gram]
+
+    def candidates(self, tokens):
+        """Документы, содержащие все триграммы всех токенов"""
+        grams = set()
+        for token in tokens:
+            grams |= self._grams(token)
+        if not grams:
+            return set(self.documents)
+        lists = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+        result = set(lists[0])
+        for docs in lists[1:]:
+            if not result:
+                break
+            result &= docs
+        return result
+
+    @staticmethod
+    def score(tokens, words):
+        """Ранг документа: 1 за точное совпадение слова, доля длины — за префикс; None — нет совпадения"""
+        total = 0.0
+        for token in tokens:
+            best = 0.0
+            for word in words:
+                if word == token:
+                    best = 1.0
+                    break
+                if word.startswith(token):
+                    best = max(best, len(token) / len(word))
+            if not best:
+                return None
+            total += best
+        return total / len(tokens)
+
+    def search(self, query, limit=None):
+        """Возвращает [(doc_id, rank)] по убыванию ранга (при равенстве — новые id первыми)"""
+        tokens = tokenize(query) if isinstance(query, str) else list(query)
+        if not tokens:
+            return []
+        results = []
+        for doc_id in self.candidates(tokens):
+            rank = self.score(tokens, self.documents[doc_id])
+            if rank is not None:
+                results.append((doc_id, rank))
+        results.sort(key=lambda item: (item[1], item[0]), reverse=True)
+        return results[:limit] if limit else results
+
+
+_client_indexes = OrderedDict()
+_client_indexes_lock = threading.Lock()
+
+
+def _client_index(client):
+    """NgramIndex операций клиента, дополненный операциями, созданными после построения"""
+    with _client_indexes_lock:
+        entry = _client_indexes.pop(client.pk, None)
+        if entry is None:
+            entry = {'index': NgramIndex(), 'last_id': 0, 'lock': threading.Lock()}
+        _client_indexes[client.pk] = entry
+        while len(_client_indexes) > MAX_CACHED_INDEXES:
+            _client_indexes.popitem(last=False)
+
+    with entry['lock']:
+        rows = (
+            client_transactions(client)
+            .filter(id__gt=entry['last_id'])
+            .order_by('id')
+            .values_list('id', 'description')
+        )
+        for tx_id, description in rows.iterator(chunk_size=2000):
+            entry['index'].add(tx_id, description)
+            entry['last_id'] = tx_id
+    return entry
+
+
+class TrigramMatch(Func):
+    """description % 'запрос' — оператор pg_trgm, обслуживается GIN-индексом gin_trgm_ops"""
+    template = '%(expressions)s'
+    arg_joiner = ' %% '
+    output_field = BooleanField()
+
+
+_trigram_available = {}
+
+
+def trigram_available(using):
+    """Установлено ли расширение pg_trgm (результат кешируется на процесс)"""
+    if using not in _trigram_available:
+        with connections[using].cursor() as cursor:
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trigram_available[using] = cursor.fetchone() is not None
+    return _trigram_available[using]
+
+
+def _postgres_search(queryset, query, tokens):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+
+    vector = SearchVector('description', config=SEARCH_CONFIG)
+    ts_query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), config=SEARCH_CONFIG, search_type='raw')
+    queryset = queryset.alias(search_vector=vector)
+    condition = Q(search_vector=ts_query)
+    rank = SearchRank(vector, ts_query)
+    if trigram_available(queryset.db):
+        condition |= Q(TrigramMatch('description', Value(query)))
+        rank = rank + TrigramSimilarity('description', query)
+    # ts_rank возвращает real: приводим к double precision, чтобы значение
+    # в курсоре пагинации точно совпадало со значением в БД
+    return queryset.filter(condition).annotate(search_rank=Cast(rank, FloatField()))
+
+
+def annotate_ranked(queryset, ranked):
+    """Строки queryset из результата NgramIndex.search с аннотацией search_rank"""
+    if not ranked:
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+    # Различных рангов немного — одна ветка CASE на ранг, а не на каждую строку
+    by_rank = defaultdict(list)
+    for doc_id, rank in ranked:
+        by_rank[rank].append(doc_id)
+    return queryset.filter(id__in=[doc_id for doc_id, _ in ranked]).annotate(
+        search_rank=Case(*[When(id__in=ids, then=Value(rank)) for rank, ids in by_rank.items()], output_field=FloatField())
+    )
+
+
+def _fallback_search(queryset, tokens, client):
+    entry = _client_index(client)
+    with entry['lock']:
+        ranked = entry['index'].search(tokens)
+    if not queryset.query.has_filters():
+        return annotate_ranked(queryset, ranked[:FALLBACK_LIMIT])
+    # Фильтры view (тип, статус, период) — до отбора лучших: среди FALLBACK_LIMIT
+    # лучших по всей истории подходящих под фильтр может не оказаться
+    matched = []
+    for start in range(0, len(ranked), FALLBACK_CHUNK):
+        chunk = ranked[start:start + FALLBACK_CHUNK]
+        allowed = set(queryset.filter(id__in=[doc_id for doc_id, _ in chunk]).values_list('id', flat=True))
+        matched.extend(item for item in chunk if item[0] in allowed)
+        if len(matched) >= FALLBACK_LIMIT:
+            break
+    return annotate_ranked(queryset, matched[:FALLBACK_LIMIT])
+
+
+def search_transactions(queryset, query, client):
+    """
+    Ищет операции клиента по описанию.
+
+    Args:
+        queryset: Операции (дополнительные фильтры, select_related)
+        query: Строка поиска; слова объединяются через И, каждое — как префикс
+        client: Клиент, по операциям которого строится запасной индекс
+
+    Returns:
+        QuerySet с аннотацией search_rank (сортировать по SEARCH_ORDERING)
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+    if connections[queryset.db].vendor == 'postgresql':
+        return _postgres_search(queryset, query, tokens)
+    return _fallback_search(queryset, tokens, client)
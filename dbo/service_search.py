@@ -0,0 +1,244 @@
+"""
+Поиск по каталогу услуг и подсказки названий.
+
+Поиск (фильтр q страницы banking_services) на PostgreSQL — полнотекстовый:
+to_tsvector('russian') названия (вес A) и описания (вес B) с префиксными
+термами, а при установленном pg_trgm — еще и триграммное сходство названия
+для опечаток. Оба условия обслуживаются GIN-индексами из миграции 0021,
+ранг — ts_rank + similarity. На других СУБД ищет NgramIndex (dbo/search.py)
+в памяти процесса.
+
+Подсказки (api/services/autocomplete/) отвечает PrefixIndex — отсортированный
+список пар (слово названия, id услуги): слова с префиксом лежат подряд, и
+диапазон находится двумя bisect, так что ответ не зависит от размера
+каталога. Индексы процесса (ServiceIndex) строятся при первом обращении и
+дальше обновляются по строкам: сохранение и удаление услуги в этом процессе
+(dbo/signals.py) — сразу после фиксации, изменения из других процессов — по
+Service.updated_at не реже раза в SERVICE_INDEX_REFRESH секунд. Если число
+услуг в индексе и в БД разошлось (удаление в другом процессе), индекс
+строится заново.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Service
+from .search import SEARCH_CONFIG, FALLBACK_LIMIT, NgramIndex, TrigramMatch, annotate_ranked, tokenize, trigram_available
+
+# Категории, которые не показываются в каталоге
+HIDDEN_CATEGORIES = 'Служебные'
+# Сколько слов индекса просматривать на один запрос подсказок
+MAX_SCAN = 2000
+# Запас по updated_at: строки транзакций, зафиксированных позже чтения, не теряются
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+_FIELDS = ('id', 'uuid', 'name', 'description', 'price', 'is_active', 'category__name')
+
+
+def visible_services():
+    """Услуги, которые показывает каталог"""
+    return Service.objects.filter(is_active=True).exclude(category__name__icontains=HIDDEN_CATEGORIES)
+
+
+def _summary(values):
+    """Поля услуги в ответе подсказок"""
+    return {
+        'uuid': str(values['uuid']),
+        'name': values['name'],
+        'category': values['category__name'],
+        'price': float(values['price']),
+    }
+
+
+class PrefixIndex:
+    """Префиксный индекс слов: отсортированный список (слово, id) — «плоский» trie"""
+
+    def __init__(self):
+        self.entries = []
+        self.words = {}
+
+    def __len__(self):
+        return len(self.words)
+
+    def build(self, documents):
+        """Строит индекс заново из пар (doc_id, текст) одной сортировкой"""
+        self.words = {doc_id: tuple(dict.fromkeys(tokenize(text))) for doc_id, text in documents}
+        self.entries = sorted((word, doc_id) for doc_id, words in self.words.items() for word in words)
+
+    def add(self, doc_id, text):
+        self.remove(doc_id)
+        words = tuple(dict.fromkeys(tokenize(text)))
+        self.words[doc_id] = words
+        for word in words:
+            insort(self.entries, (word, doc_id))
+
+    def remove(self, doc_id):
+        for word in self.words.pop(doc_id, ()):
+            i = bisect_left(self.entries, (word, doc_id))
+            if i < len(self.entries) and self.entries[i] == (word, doc_id):
+                del self.entries[i]
+
+    def search(self, query, limit=10):
+        """
+        id документов, в которых последний токен запроса — префикс слова, а
+        остальные токены — префиксы других слов; по алфавиту слов.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        prefix, others = tokens[-1], tokens[:-1]
+        start = bisect_left(self.entries, (prefix,))
+        found = []
+        for word, doc_id in self.entries[start:start + MAX_SCAN]:
+            if not word.startswith(prefix):
+                break
+            if doc_id in found:
+                continue
+            words = self.words[doc_id]
+            if all(any(other.startswith(token) for other in words) for token in others):
+                found.append(doc_id)
+                if len(found) == limit:
+                    break
+        return found
+
+
+class ServiceIndex:
+    """Индексы услуг каталога в памяти процесса: подсказки и (не на PostgreSQL) поиск"""
+
+    def __init__(self, fulltext):
+        self.prefix = PrefixIndex()
+        self.ngram = NgramIndex() if fulltext else None
+        self.services = {}
+        self.synced_at = None
+        self.checked = 0.0
+
+    def _add(self, values):
+        self.services[values['id']] = _summary(values)
+        self.prefix.add(values['id'], values['name'])
+        if self.ngram is not None:
+            self.ngram.add(values['id'], f"{values['name']} {values['description']}")
+
+    def remove(self, service_id):
+        self.services.pop(service_id, None)
+        self.prefix.remove(service_id)
+        if self.ngram is not None:
+            self.ngram.remove(service_id)
+
+    def build(self):
+        self.synced_at = timezone.now()
+        rows = [dict(zip(_FIELDS, row)) for row in visible_services().values_list(*_FIELDS)]
+        self.services = {values['id']: _summary(values) for values in rows}
+        self.prefix.build((values['id'], values['name']) for values in rows)
+        if self.ngram is not None:
+            self.ngram = NgramIndex()
+            for values in rows:
+                self.ngram.add(values['id'], f"{values['name']} {values['description']}")
+        self.checked = time.monotonic()
+
+    def update(self, service_ids):
+        """Перечитывает услуги service_ids из БД"""
+        visible = {
+            row[0]: dict(zip(_FIELDS, row))
+            for row in visible_services().filter(id__in=service_ids).values_list(*_FIELDS)
+        }
+        for service_id in service_ids:
+            if service_id in visible:
+                self._add(visible[service_id])
+            else:
+                self.remove(service_id)
+
+    def refresh(self):
+        """Применяет изменения других процессов (по updated_at); при расхождении числа услуг — строит заново"""
+        since = self.synced_at - REFRESH_OVERLAP
+        self.synced_at = timezone.now()
+        self.update(list(Service.objects.filter(updated_at__gte=since).values_list('id', flat=True)))
+        if visible_services().count() != len(self.services):
+            self.build()
+        self.checked = time.monotonic()
+
+    def suggest(self, query, limit=10):
+        return [{'id': service_id, **self.services[service_id]} for service_id in self.prefix.search(query, limit)]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def service_index():
+    """ServiceIndex процесса, синхронизированный с БД не раньше SERVICE_INDEX_REFRESH секунд назад"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ServiceIndex(fulltext=connections['default'].vendor != 'postgresql')
+            _index.build()
+        elif time.monotonic() - _index.checked > settings.SERVICE_INDEX_REFRESH:
+            _index.refresh()
+        return _index
+
+
+def services_changed(service_ids):
+    """Обновляет индекс процесса после фиксации изменений услуг (если он уже построен)"""
+    with _index_lock:
+        if _index is not None:
+            _index.update(service_ids)
+
+
+def services_deleted(service_ids):
+    with _index_lock:
+        if _index is not None:
+            for service_id in service_ids:
+                _index.remove(service_id)
+
+
+def reset_index():
+    """Индекс будет построен заново при следующем обращении (изменились категории)"""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def autocomplete(query, limit=10):
+    """Подсказки названий услуг: [{'id', 'uuid', 'name', 'category', 'price'}]"""
+    index = service_index()
+    with _index_lock:
+        return index.suggest(query, limit)
+
+
+def _postgres_search(queryset, tokens):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+
+    vector = (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    )
+    ts_query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), config=SEARCH_CONFIG, search_type='raw')
+    queryset = queryset.alias(search_vector=vector)
+    condition = Q(search_vector=ts_query)
+    rank = SearchRank(vector, ts_query)
+    if trigram_available(queryset.db):
+        query = ' '.join(tokens)
+        condition |= Q(TrigramMatch('name', Value(query)))
+        rank = rank + TrigramSimilarity('name', query)
+    return queryset.filter(condition).annotate(search_rank=Cast(rank, FloatField()))
+
+
+def search_services(queryset, tokens):
+    """
+    Услуги queryset, подходящие под токены запроса (каждый — как префикс
+    слова названия или описания), с аннотацией search_rank.
+    """
+    if not tokens:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    if connections[queryset.db].vendor == 'postgresql':
+        return _postgres_search(queryset, tokens)
+    index = service_index()
+    with _index_lock:
+        ranked = index.ngram.search(tokens, limit=FALLBACK_LIMIT)
+    return annotate_ranked(queryset, ranked)
@@ -0,0 +1,181 @@
+"""
+Отложенный расчет переводов с неттингом (TRANSFER_SETTLEMENT).
+
+Перевод записывается в статусе pending без изменения балансов: строка карты
+списания блокируется, чтобы проверить доступные средства (balance минус
+сумма ее переводов в статусе pending — резерв) и учесть дневной лимит, но
+не обновляется; карта зачисления не блокируется вовсе. Резерв учитывают и
+обычные списания (posting.debit, group_commit), поэтому баланс не уходит в
+минус до расчета.
+
+Расчет (settle_batch, команда settle_transactions) берет пачку pending-
+операций в порядке id (SKIP LOCKED — параллельные запуски не мешают друг
+другу), блокирует строки всех затронутых карт в порядке id, считает чистую
+позицию каждой карты и меняет balance одним UPDATE на пачку: сотни
+переводов между одними и теми же картами дают по одному обновлению строки
+на карту, а не по два на перевод. Затем операции переводятся в completed,
+пишутся журнал проводок (на момент расчета) и статистика. Операция, которую
+провести нельзя (карта заблокирована после записи), получает статус failed,
+а ее сумма возвращается в дневной лимит.
+"""
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from .hot_accounts import card_balances, fold
+from .idempotency import mark_committed
+from .ledger import record_postings
+from .limits import LIMITED_TYPES, consume, release, spend_day
+from .models import BankCard, Transaction
+from .posting import (
+    DailyLimitExceeded, InsufficientFunds, PostingError, lock_cards, reserved_amounts, validate_operation,
+)
+from .statements import invalidate_cards
+from .stats import apply_deltas, record_transactions, status_deltas
+
+
+def submit_transfer(transaction_type, amount, from_card=None, to_card=None, description='', currency='RUB'):
+    """
+    Записывает операцию в статусе pending и резервирует ее сумму на карте
+    списания. Исключения те же, что у post_transaction; балансы не меняются
+    до расчета (settle_batch).
+    """
+    amount = validate_operation(amount, from_card, to_card)
+    with db_transaction.atomic():
+        locked = lock_cards([from_card.pk]) if from_card is not None else {}
+        if to_card is not None:
+            row = BankCard.objects.filter(id=to_card.pk).values_list('is_active', 'client_id').first()
+            if row is not None:
+                locked[to_card.pk] = (row[0], row[1])
+        for card in (from_card, to_card):
+            if card is not None and (card.pk not in locked or not locked[card.pk][0]):
+                raise PostingError('Карта не найдена или заблокирована')
+
+        if from_card is not None:
+            available = card_balances([from_card.pk])[from_card.pk] - reserved_amounts([from_card.pk]).get(from_card.pk, 0)
+            if available < amount:
+                raise InsufficientFunds('Недостаточно средств на счете')
+            if transaction_type in LIMITED_TYPES and not consume(
+                from_card.pk, amount, locked[from_card.pk][2], spend_day()
+            ):
+                raise DailyLimitExceeded('Превышен дневной лимит по карте')
+
+        tx = Transaction.objects.create(
+            from_card=from_card,
+            to_card=to_card,
+            from_client_id=locked[from_card.pk][1] if from_card is not None else None,
+            to_client_id=locked[to_card.pk][1] if to_card is not None else None,
+            amount=amount,
+            currency=currency,
+            transaction_type=transaction_type,
+            description=description,
+            status='pending',
+        )
+        record_transactions([tx])
+        card_ids = [card.pk for card in (from_card, to_card) if card is not None]
+        db_transaction.on_commit(lambda: invalidate_cards(card_ids), robust=True)
+        db_transaction.on_commit(mark_committed)
+    return tx
+
+
+# settled/failed — операций; card_updates — обновлено строк BankCard (по одной
+# на карту с ненулевой позицией); card_legs — сколько обновлений строк карт
+# потребовала бы проводка по одной операции
+RESULT_FIELDS = ('settled', 'failed', 'card_updates', 'card_legs')
+
+
+def settle_batch(batch_size=None):
+    """
+    Рассчитывает одну пачку pending-операций одной транзакцией БД.
+    Возвращает {поле RESULT_FIELDS: значение}.
+    """
+    batch_size = batch_size or settings.SETTLEMENT_BATCH_SIZE
+    result = dict.fromkeys(RESULT_FIELDS, 0)
+    with db_transaction.atomic():
+        batch = list(
+            Transaction.objects.select_for_update(skip_locked=True)
+            .filter(status='pending')
+            .order_by('id')[:batch_size]
+        )
+        if not batch:
+            return result
+        card_ids = sorted({card_id for tx in batch for card_id in (tx.from_card_id, tx.to_card_id) if card_id})
+        rows = list(
+            BankCard.objects.select_for_update()
+            .filter(id__in=card_ids)
+            .order_by('id')
+            .values_list('id', 'is_active', 'balance', 'balance_shards')
+        )
+        active = {card_id: is_active for card_id, is_active, _, _ in rows}
+        balances = {card_id: balance for card_id, _, balance, _ in rows}
+        # Строки горячих карт переносятся в balance: карты уже заблокированы
+        for card_id in [row[0] for row in rows if row[3]]:
+            balances[card_id] += fold(card_id)
+
+        now = timezone.now()
+        settled, failed = [], []
+        positions = defaultdict(int)
+        for tx in batch:
+            cards = [card_id for card_id in (tx.from_card_id, tx.to_card_id) if card_id]
+            # Средства зарезервированы при записи; проверка баланса — страховка
+            if not all(active.get(card_id) for card_id in cards) or (
+                tx.from_card_id and balances[tx.from_card_id] < tx.amount
+            ):
+                tx.status = 'failed'
+                failed.append(tx)
+                continue
+            if tx.from_card_id:
+                balances[tx.from_card_id] -= tx.amount
+                positions[tx.from_card_id] -= tx.amount
+            if tx.to_card_id:
+                balances[tx.to_card_id] += tx.amount
+                positions[tx.to_card_id] += tx.amount
+            tx.status = 'completed'
+            tx.completed_at = now
+            settled.append(tx)
+            result['card_legs'] += len(cards)
+
+        changed = {card_id: position for card_id, position in positions.items() if position}
+        if changed:
+            # Чистая позиция каждой карты — одним UPDATE на пачку
+            BankCard.objects.filter(id__in=changed).update(balance=F('balance') + Case(
+                *[When(id=card_id, then=Value(position)) for card_id, position in changed.items()],
+                output_field=DecimalField(max_digits=15, decimal_places=2),
+            ))
+        if settled:
+            Transaction.objects.filter(id__in=[tx.id for tx in settled]).update(status='completed', completed_at=now)
+            record_postings(settled, at=now)
+        if failed:
+            Transaction.objects.filter(id__in=[tx.id for tx in failed]).update(status='failed')
+            for tx in failed:
+                if tx.from_card_id and tx.transaction_type in LIMITED_TYPES:
+                    release(tx.from_card_id, tx.amount, spend_day(tx.created_at))
+        apply_deltas(status_deltas(batch, 'pending'))
+        db_transaction.on_commit(lambda: invalidate_cards(card_ids), robust=True)
+
+    result.update(settled=len(settled), failed=len(failed), card_updates=len(changed))
+    return result
+
+
+def settle_pending(batch_size=None, progress=None):
+    """
+    Рассчитывает все pending-операции пачками; возвращает (итог, число пачек,
+    секунд). progress(пачка, результат пачки) вызывается после каждой пачки.
+    """
+    total = dict.fromkeys(RESULT_FIELDS, 0)
+    batches = 0
+    started = time.monotonic()
+    while True:
+        result = settle_batch(batch_size)
+        if not result['settled'] and not result['failed']:
+            break
+        batches += 1
+        for field in RESULT_FIELDS:
+            total[field] += result[field]
+        if progress is not None:
+            progress(batches, result)
+    return total, batches, time.monotonic() - started
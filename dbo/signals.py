@@ -0,0 +1,72 @@
+"""
+Обработчики сигналов моделей.
+
+Сохранение и удаление услуг и категорий после фиксации транзакции
+сбрасывают кэш каталога (dbo/catalog.py) и обновляют индекс подсказок
+процесса (dbo/service_search.py): услуги — по строке, изменение категорий
+(название влияет на видимость и подсказки) — перестроением индекса.
+Счетчики фасетов (dbo/facets.py) меняются сразу при записи услуги: прежний
+фасет читается из строки услуги под блокировкой в транзакции записи
+(Service.save, удаление), так что параллельная запись той же услуги ждет
+и переносит счетчик уже из нового фасета.
+"""
+from django.db import transaction as db_transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import facets
+from .catalog import invalidate_catalog
+from .models import Service, ServiceCategory
+from .service_search import reset_index, services_changed, services_deleted
+
+
+def _locked_facet(instance, using):
+    """Фасет строки услуги в БД (под блокировкой); None — строки нет"""
+    old = (
+        Service.objects.using(using).select_for_update().filter(pk=instance.pk)
+        .values('category_id', 'price', 'is_active').first()
+    )
+    return facets.facet_key(Service(**old)) if old else None
+
+
+@receiver(pre_save, sender=Service)
+def service_saving(sender, instance, using, **kwargs):
+    # Фасет до изменения: из него счетчик переносится в новый
+    instance._facet_before = _locked_facet(instance, using) if instance.pk is not None else None
+
+
+@receiver(post_save, sender=Service)
+def service_saved(sender, instance, created, **kwargs):
+    before = None if created else getattr(instance, '_facet_before', None)
+    after = facets.facet_key(instance)
+    if before != after:
+        deltas = {after: 1}
+        if before is not None:
+            deltas[before] = -1
+        facets.apply_deltas(deltas)
+    db_transaction.on_commit(invalidate_catalog)
+    db_transaction.on_commit(lambda: services_changed([instance.pk]))
+
+
+@receiver(pre_delete, sender=Service)
+def service_deleting(sender, instance, using, origin=None, **kwargs):
+    # При удалении категории ее счетчики удаляются вместе с ней
+    cascade = isinstance(origin, ServiceCategory)
+    instance._facet_before = None if cascade else _locked_facet(instance, using)
+
+
+@receiver(post_delete, sender=Service)
+def service_deleted(sender, instance, **kwargs):
+    service_id = instance.pk
+    # Строку уже удалил параллельный запрос — его сигнал счетчик и уменьшил
+    before = getattr(instance, '_facet_before', None)
+    if before is not None:
+        facets.apply_deltas({before: -1})
+    db_transaction.on_commit(invalidate_catalog)
+    db_transaction.on_commit(lambda: services_deleted([service_id]))
+
+
+@receiver([post_save, post_delete], sender=ServiceCategory)
+def category_changed(sender, **kwargs):
+    db_transaction.on_commit(invalidate_catalog)
+    db_transaction.on_commit(reset_index)
@@ -0,0 +1,96 @@
+"""
+Последние операции по карте (выписка для страницы карт).
+
+Первая страница выписки — последние STATEMENT_SIZE операций карты — хранится
+в кэше (settings.CACHES) уже сериализованным JSON вместе с ETag, поэтому
+повторные запросы не выполняют выборку по Transaction, а неизменившаяся
+выписка отдается ответом 304.
+
+Буфер карты хранится под ключом с версией карты. Проводка (dbo/posting.py)
+после фиксации транзакции БД удаляет версию через invalidate_cards, и
+следующий запрос заводит новую версию и перестраивает буфер одной выборкой. Версия читается до
+выборки, поэтому буфер, собранный параллельно с проводкой, сохраняется под
+старой версией и не отдается. Дописывать строку в буфер на месте нельзя:
+у кэша нет атомарного чтения-записи, и параллельные проводки по карте
+теряли бы строки друг друга.
+"""
+import hashlib
+import json
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import Transaction
+from .pagination import KeysetPaginator
+
+STATEMENT_SIZE = 20
+
+
+def _version_key(card_id):
+    return f'dbo:card-statements-version:{card_id}'
+
+
+def _buffer_key(card_id, version):
+    return f'dbo:card-statements:{card_id}:{version}'
+
+
+def card_statements_paginator(card_id, per_page=STATEMENT_SIZE):
+    """KeysetPaginator по операциям карты (списания и зачисления)"""
+    return KeysetPaginator(Transaction.objects.filter(Q(from_card_id=card_id) | Q(to_card_id=card_id)), per_page)
+
+
+def serialize_statement(tx):
+    return {
+        'id': tx.id,
+        'type': tx.transaction_type,
+        'amount': float(tx.amount),
+        'currency': tx.currency,
+        'status': tx.status,
+        'description': tx.description,
+        'created_at': tx.created_at.strftime('%d.%m.%Y %H:%M'),
+    }
+
+
+def statements_payload(card_id, cursor=None):
+    """JSON-строка ответа get_card_statements для страницы cursor (без кэша)"""
+    page = card_statements_paginator(card_id).get_page(cursor)
+    return json.dumps({
+        'success': True,
+        'statements': [serialize_statement(tx) for tx in page],
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    }, cls=DjangoJSONEncoder)
+
+
+def make_etag(payload):
+    return '"%s"' % hashlib.md5(payload.encode(), usedforsecurity=False).hexdigest()
+
+
+def _card_version(card_id):
+    version = cache.get(_version_key(card_id))
+    if version is None:
+        cache.add(_version_key(card_id), uuid.uuid4().hex, timeout=None)
+        version = cache.get(_version_key(card_id))
+    return version
+
+
+def latest_statements(card_id):
+    """(etag, JSON) последних STATEMENT_SIZE операций карты из кэша или из БД"""
+    version = _card_version(card_id)
+    key = _buffer_key(card_id, version)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    payload = statements_payload(card_id)
+    entry = (make_etag(payload), payload)
+    cache.set(key, entry, timeout=settings.STATEMENTS_CACHE_TIMEOUT)
+    return entry
+
+
+def invalidate_cards(card_ids):
+    """Сбрасывает буферы выписок карт (вызывать после фиксации изменений)"""
+    # delete_many — один запрос и для DatabaseCache, в отличие от set_many
+    cache.delete_many([_version_key(card_id) for card_id in card_ids])
@@ -0,0 +1,227 @@
+"""
+Статистика операций клиентов (ClientTransactionStats).
+
+Строка статистики обновляется в той же транзакции БД, что и проводка
+(см. dbo/posting.py), через UPDATE ... SET x = x + delta; приращения для
+многих клиентов сразу (пачки, расчет, биллинг) — одним upsert. Если строки
+еще нет, она строится по истории клиента без текущей проводки и вставляется
+без перезаписи, а приращения проводки добавляются к ней тем же UPDATE: две
+первые параллельные проводки клиента не затирают счетчики друг друга.
+Полный пересчет по всем клиентам выполняет команда rebuild_transaction_stats.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, Q, Sum
+
+from .models import CardBalanceShard, ClientTransactionStats, Transaction
+
+TYPE_FIELDS = {
+    'transfer': 'transfer_count',
+    'payment': 'payment_count',
+    'deposit': 'deposit_count',
+    'withdrawal': 'withdrawal_count',
+    'fee': 'fee_count',
+}
+STATUS_FIELDS = {
+    'completed': 'completed_count',
+    'pending': 'pending_count',
+    'failed': 'failed_count',
+    'cancelled': 'cancelled_count',
+}
+COUNTER_FIELDS = ['total_count', *TYPE_FIELDS.values(), *STATUS_FIELDS.values()]
+AMOUNT_FIELDS = ['total_income', 'total_expense']
+STATS_FIELDS = COUNTER_FIELDS + AMOUNT_FIELDS
+# Поля, приращения которых копятся в строках горячих карт (зачисления от других клиентов)
+PENDING_STATS_FIELDS = ['total_count', *TYPE_FIELDS.values(), 'completed_count', 'total_income']
+
+
+def transaction_deltas(transactions):
+    """Возвращает {client_id: {поле: приращение}} для списка новых транзакций"""
+    deltas = defaultdict(lambda: defaultdict(int))
+    for tx in transactions:
+        from_client = tx.from_client_id
+        to_client = tx.to_client_id
+        # Перевод между своими картами учитывается у клиента один раз
+        for client_id in {from_client, to_client} - {None}:
+            delta = deltas[client_id]
+            delta['total_count'] += 1
+            delta[TYPE_FIELDS[tx.transaction_type]] += 1
+            delta[STATUS_FIELDS[tx.status]] += 1
+        # Доходы и расходы — только между разными клиентами
+        if tx.status == 'completed' and from_client != to_client:
+            if to_client is not None:
+                deltas[to_client]['total_income'] += tx.amount
+            if from_client is not None:
+                deltas[from_client]['total_expense'] += tx.amount
+    return deltas
+
+
+def status_deltas(transactions, old_status):
+    """
+    Приращения статистики при смене статуса транзакций с old_status
+    (pending) на текущий tx.status: счетчик old_status уменьшается,
+    счетчик нового статуса, доходы и расходы — увеличиваются.
+    """
+    deltas = transaction_deltas(transactions)
+    for tx in transactions:
+        for client_id in {tx.from_client_id, tx.to_client_id} - {None}:
+            delta = deltas[client_id]
+            delta['total_count'] -= 1
+            delta[TYPE_FIELDS[tx.transaction_type]] -= 1
+            delta[STATUS_FIELDS[old_status]] -= 1
+    return deltas
+
+
+# Начиная с этого числа клиентов приращения пишутся одним upsert, а не UPDATE на клиента
+BULK_DELTAS_THRESHOLD = 20
+
+
+def _apply_bulk(deltas):
+    """
+    Пачечный вариант apply_deltas: строки блокируются одним SELECT в порядке
+    client_id, новые значения считаются в памяти и записываются одним upsert.
+    Возвращает client_id без строки статистики.
+    """
+    client_ids = sorted(client_id for client_id, delta in deltas.items() if any(delta.values()))
+    rows = list(ClientTransactionStats.objects.select_for_update().filter(pk__in=client_ids).order_by('pk'))
+    for row in rows:
+        for field, value in deltas[row.pk].items():
+            if value:
+                setattr(row, field, getattr(row, field) + value)
+    if rows:
+        ClientTransactionStats.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['client'], update_fields=STATS_FIELDS + ['updated_at'],
+        )
+    found = {row.pk for row in rows}
+    return [client_id for client_id in client_ids if client_id not in found]
+
+
+def _update(client_id, delta):
+    """UPDATE ... SET x = x + delta строки клиента; False, если строки нет"""
+    changes = {field: F(field) + value for field, value in delta.items() if value}
+    return bool(ClientTransactionStats.objects.filter(pk=client_id).update(**changes))
+
+
+def _create_missing(missing, deltas):
+    """
+    Создает строки клиентов из missing по истории без приращений deltas и
+    затем применяет к ним deltas. Вставка не перезаписывает строку, созданную
+    параллельной проводкой (ее история не видит наших незафиксированных
+    операций), поэтому приращения добавляются UPDATE в обоих случаях.
+    """
+    stats = compute_stats(missing)
+    for client_id in missing:
+        for field, value in deltas[client_id].items():
+            stats[client_id][field] -= value
+    store_stats(stats)
+    for client_id in missing:
+        _update(client_id, deltas[client_id])
+
+
+def apply_deltas(deltas):
+    """
+    Применяет приращения к строкам статистики. Вызывается внутри транзакции
+    проводки; строки обновляются в порядке client_id, чтобы не было взаимоблокировок.
+    """
+    if len(deltas) >= BULK_DELTAS_THRESHOLD:
+        missing = _apply_bulk(deltas)
+    else:
+        missing = [
+            client_id for client_id in sorted(deltas)
+            if any(deltas[client_id].values()) and not _update(client_id, deltas[client_id])
+        ]
+    if missing:
+        _create_missing(missing, deltas)
+
+
+def record_transactions(transactions):
+    """Учитывает новые транзакции в статистике клиентов"""
+    apply_deltas(transaction_deltas(transactions))
+
+
+def _aggregates():
+    aggregates = {'total_count': Count('id')}
+    for tx_type, field in TYPE_FIELDS.items():
+        aggregates[field] = Count('id', filter=Q(transaction_type=tx_type))
+    for status, field in STATUS_FIELDS.items():
+        aggregates[field] = Count('id', filter=Q(status=status))
+    return aggregates
+
+
+def compute_stats(client_ids):
+    """
+    Считает статистику по истории для набора клиентов тремя сгруппированными
+    запросами: исходящие, входящие и переводы между своими картами
+    (последние вычитаются, так как попали и в исходящие, и во входящие).
+    """
+    client_ids = list(client_ids)
+    own = Q(from_client_id=F('to_client_id'))
+    external = Q(from_client__isnull=True) | Q(to_client__isnull=True) | ~own
+    external_completed = Q(status='completed') & external
+
+    outgoing = (
+        Transaction.objects.filter(from_client_id__in=client_ids)
+        .values('from_client_id')
+        .annotate(**_aggregates(), expense=Sum('amount', filter=external_completed))
+        .order_by()
+    )
+    incoming = (
+        Transaction.objects.filter(to_client_id__in=client_ids)
+        .values('to_client_id')
+        .annotate(**_aggregates(), income=Sum('amount', filter=external_completed))
+        .order_by()
+    )
+    own_transfers = (
+        Transaction.objects.filter(own, from_client_id__in=client_ids)
+        .values('from_client_id')
+        .annotate(**_aggregates())
+        .order_by()
+    )
+
+    stats = {client_id: dict.fromkeys(STATS_FIELDS, 0) for client_id in client_ids}
+    for row in outgoing:
+        target = stats[row['from_client_id']]
+        for field in COUNTER_FIELDS:
+            target[field] += row[field]
+        target['total_expense'] = row['expense'] or 0
+    for row in incoming:
+        target = stats[row['to_client_id']]
+        for field in COUNTER_FIELDS:
+            target[field] += row[field]
+        target['total_income'] = row['income'] or 0
+    for row in own_transfers:
+        target = stats[row['from_client_id']]
+        for field in COUNTER_FIELDS:
+            target[field] -= row[field]
+    return stats
+
+
+def store_stats(stats, overwrite=False):
+    """Сохраняет посчитанную статистику; overwrite=False не трогает существующие строки"""
+    rows = [ClientTransactionStats(client_id=client_id, **values) for client_id, values in stats.items()]
+    if overwrite:
+        ClientTransactionStats.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['client'], update_fields=STATS_FIELDS + ['updated_at'],
+        )
+    else:
+        ClientTransactionStats.objects.bulk_create(rows, ignore_conflicts=True)
+    return rows
+
+
+def pending_stats(client_id):
+    """Приращения статистики клиента, еще не перенесенные из строк его горячих карт (dbo/hot_accounts.py)"""
+    totals = CardBalanceShard.objects.filter(card__client_id=client_id).aggregate(
+        **{field: Sum(field) for field in PENDING_STATS_FIELDS}
+    )
+    return {field: value for field, value in totals.items() if value}
+
+
+def get_client_stats(client):
+    """Возвращает статистику клиента: строка по первичному ключу плюс неперенесенные приращения"""
+    try:
+        stats = ClientTransactionStats.objects.get(pk=client.pk)
+    except ClientTransactionStats.DoesNotExist:
+        stats = store_stats(compute_stats([client.pk]))[0]
+    for field, value in pending_stats(client.pk).items():
+        setattr(stats, field, getattr(stats, field) + value)
+    return stats
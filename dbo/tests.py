@@ -1,3 +1,1286 @@
-from django.test import TestCase
+import base64
+import json
+import os
+from datetime import date, datetime, timedelta
+from importlib import import_module
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.apps import apps
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count, F, Q, Sum
+from django.http import JsonResponse
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+
+from . import holds, stats as stats_module
+from .billing import run_billing
+from .catalog import catalog_page
+from .credits import evaluate, iterate_schedule, pay_credit, update_credits
+from .deposits import run_accrual
+from .facets import compute_facets, facet_counts, rebuild_facets
+from .group_commit import _Operation, apply_batch
+from .history import client_history_paginator, client_transactions, period_filter
+from .hot_accounts import card_balances, fold, set_hot
+from .idempotency import clear_cache, idempotent, mark_committed
+from .investments import PriceSeries, revalue_positions
+from .ledger import balance_as_of, balance_series, create_checkpoints
+from .limits import release, spend_day, spent
+from .models import (
+    BalanceCheckpoint, BankCard, CardBalanceShard, CardDailySpend, CardHold, Client, ClientService,
+    ClientInvestment, ClientTransactionStats, Credit, CreditPayment, Deposit, DepositAccrual, IdempotencyKey,
+    InvestmentProduct, Operator, Posting, ProductPrice, Service, ServiceCategory, ServiceRatingDelta,
+    ServiceRecommendation, ServiceRequest, ServiceVote, Transaction,
+)
+from .pagination import LAST_PAGE, KeysetPaginator
+from .posting import DailyLimitExceeded, InsufficientFunds, PostingError, post_transaction, reserved_amounts
+from .ratings import RatingError, average, flush_ratings, rate
+from .recommendations import CooccurrenceMatrix, build_recommendations, recommended_services, top_k
+from .reconciliation import reconcile_chunk
+from .service_search import PrefixIndex, reset_index
+from .settlement import settle_batch, submit_transfer
+from .stats import get_client_stats
+
+
+def make_client(name, balance='0.00', daily_limit='100000.00'):
+    """Клиент с одной активной дебетовой картой; возвращает (client, card)"""
+    user = User.objects.create_user(username=name, password='password')
+    number = User.objects.count()
+    client = Client.objects.create(
+        user=user, client_id=f'C{number:05d}', full_name=name, email=f'{name}@example.com', phone=f'7900000{number:04d}',
+    )
+    card = BankCard.objects.create(
+        client=client, card_number=f'4081781000000{number:04d}', card_type='debit',
+        balance=Decimal(balance), daily_limit=Decimal(daily_limit), expiry_date=date(2030, 1, 1),
+    )
+    return client, card
+
+
+def balance(card):
+    return BankCard.objects.get(pk=card.pk).balance
+
+
+class PostTransactionTests(TestCase):
+    def setUp(self):
+        self.sender, self.from_card = make_client('sender', balance='1000.00', daily_limit='300.00')
+        self.recipient, self.to_card = make_client('recipient')
+
+    def test_transfer_moves_money_and_records_side_effects(self):
+        tx = post_transaction('transfer', '250.00', from_card=self.from_card, to_card=self.to_card)
+
+        self.assertEqual(tx.status, 'completed')
+        self.assertEqual((tx.from_client_id, tx.to_client_id), (self.sender.pk, self.recipient.pk))
+        self.assertEqual(balance(self.from_card), Decimal('750.00'))
+        self.assertEqual(balance(self.to_card), Decimal('250.00'))
+        # Переданные объекты карт получают баланс из БД
+        self.assertEqual(self.from_card.balance, Decimal('750.00'))
+        self.assertEqual(self.to_card.balance, Decimal('250.00'))
+
+        postings = {p.side: (p.card_id, p.amount) for p in Posting.objects.filter(transaction_id=tx.pk)}
+        self.assertEqual(postings, {
+            'debit': (self.from_card.pk, Decimal('-250.00')),
+            'credit': (self.to_card.pk, Decimal('250.00')),
+        })
+        self.assertEqual(spent(self.from_card), Decimal('250.00'))
+
+        # Вторая проводка идет через UPDATE существующих строк статистики
+        post_transaction('transfer', '50.00', from_card=self.from_card, to_card=self.to_card)
+        sender_stats = ClientTransactionStats.objects.get(pk=self.sender.pk)
+        recipient_stats = ClientTransactionStats.objects.get(pk=self.recipient.pk)
+        for stats in (sender_stats, recipient_stats):
+            self.assertEqual((stats.total_count, stats.transfer_count, stats.completed_count), (2, 2, 2))
+        self.assertEqual((sender_stats.total_expense, sender_stats.total_income), (Decimal('300.00'), 0))
+        self.assertEqual((recipient_stats.total_expense, recipient_stats.total_income), (0, Decimal('300.00')))
+
+    def test_insufficient_funds_changes_nothing(self):
+        with self.assertRaises(InsufficientFunds):
+            post_transaction('transfer', '1000.01', from_card=self.from_card, to_card=self.to_card)
+
+        self.assertEqual(balance(self.from_card), Decimal('1000.00'))
+        self.assertEqual(balance(self.to_card), Decimal('0.00'))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertFalse(Posting.objects.exists())
+        self.assertFalse(ClientTransactionStats.objects.exists())
+        self.assertEqual(spent(self.from_card), Decimal('0.00'))
+
+    def test_daily_limit_rejects_and_release_restores_it(self):
+        post_transaction('transfer', '200.00', from_card=self.from_card, to_card=self.to_card)
+
+        with self.assertRaises(DailyLimitExceeded):
+            post_transaction('transfer', '150.00', from_card=self.from_card, to_card=self.to_card)
+        # Списание отклоненной операции откатывается вместе со счетчиком лимита
+        self.assertEqual(balance(self.from_card), Decimal('800.00'))
+        self.assertEqual(balance(self.to_card), Decimal('200.00'))
+        self.assertEqual(spent(self.from_card), Decimal('200.00'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+        # Пополнения лимитом не ограничены
+        post_transaction('deposit', '500.00', to_card=self.from_card)
+
+        release(self.from_card.pk, Decimal('200.00'), spend_day())
+        post_transaction('transfer', '150.00', from_card=self.from_card, to_card=self.to_card)
+        self.assertEqual(spent(self.from_card), Decimal('150.00'))
+        self.assertEqual(balance(self.from_card), Decimal('1150.00'))
+
+    def test_hot_card_credit_goes_to_shards_and_folds_on_debit(self):
+        set_hot(self.to_card.pk, shards=4)
+        post_transaction('transfer', '250.00', from_card=self.from_card, to_card=self.to_card)
+
+        # Зачисление лежит в строках карты, а не в balance
+        self.assertEqual(balance(self.to_card), Decimal('0.00'))
+        self.assertEqual(card_balances([self.to_card.pk]), {self.to_card.pk: Decimal('250.00')})
+        self.assertEqual(self.to_card.balance, Decimal('250.00'))
+        self.assertEqual(get_client_stats(self.recipient).total_income, Decimal('250.00'))
+
+        # Списанию не хватает balance: строки переносятся, и оно проходит
+        _, other_card = make_client('other')
+        post_transaction('transfer', '100.00', from_card=self.to_card, to_card=other_card)
+        self.assertEqual(balance(self.to_card), Decimal('150.00'))
+        self.assertEqual(card_balances([self.to_card.pk]), {self.to_card.pk: Decimal('150.00')})
+        stats = get_client_stats(self.recipient)
+        self.assertEqual((stats.total_count, stats.total_income, stats.total_expense),
+                         (2, Decimal('250.00'), Decimal('100.00')))
+
+
+class ClientStatsTests(TestCase):
+    def test_first_posting_keeps_row_created_concurrently(self):
+        sender, from_card = make_client('sender', balance='1000.00')
+        recipient, to_card = make_client('recipient')
+        compute_stats = stats_module.compute_stats
+
+        def compute_then_race(client_ids):
+            result = compute_stats(client_ids)
+            # Параллельная первая проводка получателя успела создать его строку
+            ClientTransactionStats.objects.create(
+                client=recipient, total_count=1, deposit_count=1, completed_count=1,
+            )
+            return result
+
+        with mock.patch.object(stats_module, 'compute_stats', compute_then_race):
+            post_transaction('transfer', '250.00', from_card=from_card, to_card=to_card)
+
+        stats = ClientTransactionStats.objects.get(pk=recipient.pk)
+        self.assertEqual((stats.total_count, stats.deposit_count, stats.transfer_count, stats.completed_count),
+                         (2, 1, 1, 2))
+        self.assertEqual(stats.total_income, Decimal('250.00'))
+        self.assertEqual(ClientTransactionStats.objects.get(pk=sender.pk).total_expense, Decimal('250.00'))
+
+
+class TransactionHistoryTests(TestCase):
+    def setUp(self):
+        self.client_obj, self.card = make_client('owner')
+        self.client.force_login(self.client_obj.user)
+        post_transaction('deposit', '100.00', to_card=self.card)
+
+    def test_period_filter_open_end_at_max_date(self):
+        self.assertEqual(Transaction.objects.filter(period_filter('2000-01-01', '9999-12-31')).count(), 1)
+        with self.assertRaises(ValueError):
+            period_filter('2024-02-30')
+        # Строка не в формате YYYY-MM-DD игнорируется
+        self.assertEqual(Transaction.objects.filter(period_filter('garbage', '')).count(), 1)
+
+    def test_views_accept_max_date(self):
+        response = self.client.get('/client/transactions/', {'date_to': '9999-12-31'})
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/client/transactions/export/', {'format': 'jsonl', 'date_to': '9999-12-31'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 1)
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        clear_cache()
+        self.sender, self.from_card = make_client('sender', balance='1000.00')
+        self.recipient, self.to_card = make_client('recipient')
+        self.client.force_login(self.sender.user)
+        self.calls = 0
+
+    def transfer(self, amount, key='key-1', **headers):
+        return self.client.post(
+            '/service/transfers/',
+            {'from_account': self.from_card.pk, 'recipient_phone': self.recipient.phone, 'amount': amount},
+            headers={'Idempotency-Key': key, **headers},
+        )
+
+    def call(self, view, body='{"amount": 1}', key='key-1'):
+        request = RequestFactory().post('/test/', body, content_type='application/json',
+                                        headers={'Idempotency-Key': key})
+        request.user = self.sender.user
+        return idempotent('test')(view)(request)
+
+    def counted(self, response):
+        def view(request):
+            self.calls += 1
+            return response
+        return view
+
+    def test_retry_replays_stored_response_without_second_debit(self):
+        first = self.transfer('100.00')
+        retry = self.transfer('100.00')
+
+        self.assertEqual(first.status_code, 302)
+        self.assertNotIn('Idempotent-Replayed', first)
+        self.assertEqual(retry.status_code, 302)
+        self.assertEqual(retry['Location'], first['Location'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(balance(self.from_card), Decimal('900.00'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+        # Ответ сохранен в таблице: повтор без LRU процесса тоже не проводит перевод
+        clear_cache()
+        self.assertEqual(self.transfer('100.00')['Idempotent-Replayed'], 'true')
+        self.assertEqual(balance(self.from_card), Decimal('900.00'))
+
+    def test_same_key_with_different_body_is_rejected(self):
+        self.transfer('100.00')
+        response = self.transfer('200.00', **{'X-Requested-With': 'XMLHttpRequest'})
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(balance(self.from_card), Decimal('900.00'))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_server_error_releases_key(self):
+        failing = self.counted(JsonResponse({'success': False}, status=503))
+        self.assertEqual(self.call(failing).status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.assertEqual(self.call(self.counted(JsonResponse({'success': True}))).status_code, 200)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 200)
+
+    def test_rejection_is_not_replayed_after_cause_is_fixed(self):
+        rejected = self.transfer('2000.00')
+        self.assertEqual(rejected.status_code, 302)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(Transaction.objects.count(), 0)
+
+        post_transaction('deposit', '1500.00', to_card=self.from_card, description='Пополнение')
+        retry = self.transfer('2000.00')
+        self.assertNotIn('Idempotent-Replayed', retry)
+        self.assertEqual(balance(self.from_card), Decimal('500.00'))
+        self.assertEqual(self.transfer('2000.00')['Idempotent-Replayed'], 'true')
+        self.assertEqual(balance(self.from_card), Decimal('500.00'))
+
+    def test_client_error_releases_key_unless_committed(self):
+        self.assertEqual(self.call(self.counted(JsonResponse({'success': False}, status=402))).status_code, 402)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.call(self.counted(JsonResponse({'success': True}))).status_code, 200)
+        self.assertEqual(self.calls, 2)
+
+        def rejected_after_commit(request):
+            mark_committed()
+            return JsonResponse({'success': False}, status=400)
+
+        self.call(rejected_after_commit, key='key-2')
+        retry = self.call(self.counted(JsonResponse({'success': True})), key='key-2')
+        self.assertEqual((retry.status_code, retry['Idempotent-Replayed']), (400, 'true'))
+        self.assertEqual(self.calls, 2)
+
+    def test_exception_releases_key_unless_committed(self):
+        def broken(request):
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            self.call(broken)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        def broken_after_commit(request):
+            mark_committed()
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            self.call(broken_after_commit, key='key-2')
+        # Деньги уже двигались: ключ хранит ошибку, повтор ее получает, а не проводит операцию снова
+        retry = self.call(self.counted(JsonResponse({'success': True})), key='key-2')
+        self.assertEqual(retry.status_code, 500)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.calls, 0)
+
+    def test_expired_key_is_taken_over(self):
+        self.call(self.counted(JsonResponse({'step': 1})))
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        clear_cache()
+
+        response = self.call(self.counted(JsonResponse({'step': 2})), body='{"amount": 2}')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(self.calls, 2)
+        record = IdempotencyKey.objects.get()
+        self.assertIn('"step": 2', record.content)
+        self.assertGreater(record.expires_at, timezone.now())
+
+
+class GroupCommitTests(TestCase):
+    # (тип, сумма, карта списания, карта зачисления) — роли карт из make_cards
+    OPERATIONS = [
+        ('transfer', '200.00', 'a', 'b'),
+        ('transfer', '250.00', 'b', 'c'),  # проходит за счет зачисления из первой операции
+        ('transfer', '400.00', 'a', 'c'),  # недостаточно средств
+        ('transfer', '150.00', 'a', 'b'),  # превышен дневной лимит
+        ('deposit', '50.00', None, 'a'),
+        ('transfer', '100.00', 'c', 'a'),
+    ]
+    OUTCOMES = [None, None, InsufficientFunds, DailyLimitExceeded, None, None]
+
+    def make_cards(self, prefix):
+        cards = {}
+        for role, amount in (('a', '500.00'), ('b', '100.00'), ('c', '0.00')):
+            _, cards[role] = make_client(f'{prefix}-{role}', balance=amount, daily_limit='300.00')
+        return cards
+
+    def snapshot(self, cards):
+        roles = {card.pk: role for role, card in cards.items()}
+        clients = {card.client_id: role for role, card in cards.items()}
+        stats = {
+            clients[row.pk]: (row.total_count, row.transfer_count, row.deposit_count, row.completed_count,
+                              row.total_income, row.total_expense)
+            for row in ClientTransactionStats.objects.filter(pk__in=clients)
+        }
+        transactions = Transaction.objects.filter(Q(from_card__in=roles) | Q(to_card__in=roles))
+        postings = Posting.objects.filter(transaction_id__in=transactions.values('id'))
+        return {
+            'balances': {role: balance(card) for role, card in cards.items()},
+            'spend': {roles[card_id]: amount for card_id, amount in
+                      CardDailySpend.objects.filter(card__in=roles).values_list('card_id', 'amount')},
+            'stats': stats,
+            'postings': sorted(
+                (roles.get(card_id, ''), side, amount) for card_id, side, amount in
+                postings.values_list('card_id', 'side', 'amount')
+            ),
+            'transactions': sorted(
+                (roles.get(from_id, ''), roles.get(to_id, ''), tx_type, amount, status)
+                for from_id, to_id, tx_type, amount, status in
+                transactions.values_list('from_card_id', 'to_card_id', 'transaction_type', 'amount', 'status')
+            ),
+        }
+
+    def test_batch_matches_sequential_posting(self):
+        sequential = self.make_cards('seq')
+        outcomes = []
+        for tx_type, amount, from_role, to_role in self.OPERATIONS:
+            try:
+                post_transaction(tx_type, amount, from_card=sequential.get(from_role), to_card=sequential.get(to_role))
+            except Exception as e:
+                outcomes.append(type(e))
+            else:
+                outcomes.append(None)
+        self.assertEqual(outcomes, self.OUTCOMES)
+
+        batched = self.make_cards('batch')
+        results = apply_batch([
+            _Operation(tx_type, Decimal(amount), batched[from_role].pk if from_role else None,
+                       batched[to_role].pk, '', 'RUB')
+            for tx_type, amount, from_role, to_role in self.OPERATIONS
+        ])
+        self.assertEqual([type(r) if isinstance(r, Exception) else None for r in results], self.OUTCOMES)
+
+        expected = self.snapshot(sequential)
+        self.assertEqual(self.snapshot(batched), expected)
+        self.assertEqual(expected['balances'], {'a': Decimal('450.00'), 'b': Decimal('50.00'), 'c': Decimal('150.00')})
+        # Каждая проведенная операция получает балансы своих карт после пачки
+        for result in results:
+            if not isinstance(result, Exception):
+                _, balances = result
+                self.assertEqual(balances, {card_id: balance(BankCard(pk=card_id)) for card_id in balances})
+
+
+class BillingTests(TestCase):
+    BILLING_DATE = date(2026, 3, 31)
+
+    def setUp(self):
+        category = ServiceCategory.objects.create(name='Подписки')
+        self.service = Service.objects.create(name='СМС-информирование', description='', category=category, price=100)
+
+    def subscribe(self, name, balance, next_payment_date, auto_renewal=True):
+        client, card = make_client(name, balance=balance)
+        subscription = ClientService.objects.create(
+            client=client, service=self.service, monthly_fee=Decimal('100.00'),
+            next_payment_date=next_payment_date, auto_renewal=auto_renewal,
+        )
+        return subscription, card
+
+    def test_charges_every_missed_period(self):
+        # 65 дней просрочки — наступили три 30-дневных периода
+        subscription, card = self.subscribe('payer', '1000.00', self.BILLING_DATE - timedelta(days=65))
+        result = run_billing(self.BILLING_DATE)
+
+        self.assertEqual((result['charged'], result['transactions'], result['amount']), (1, 3, Decimal('300.00')))
+        self.assertEqual(balance(card), Decimal('700.00'))
+        fees = Transaction.objects.filter(from_card=card, transaction_type='fee')
+        self.assertEqual(sorted(fees.values_list('amount', flat=True)), [Decimal('100.00')] * 3)
+        self.assertEqual(Posting.objects.filter(card=card).count(), 3)
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.status, 'active')
+        self.assertEqual(subscription.next_payment_date, self.BILLING_DATE + timedelta(days=25))
+        self.assertEqual(ClientTransactionStats.objects.get(pk=subscription.client_id).fee_count, 3)
+
+    def test_suspends_when_funds_are_insufficient(self):
+        # Средств хватает на один период из двух: подписка не оплачивается частично
+        subscription, card = self.subscribe('poor', '150.00', self.BILLING_DATE - timedelta(days=30))
+        result = run_billing(self.BILLING_DATE)
+
+        self.assertEqual((result['suspended'], result['transactions']), (1, 0))
+        self.assertEqual(balance(card), Decimal('150.00'))
+        subscription.refresh_from_db()
+        self.assertEqual((subscription.status, subscription.is_active), ('suspended', False))
+
+    def test_expires_without_auto_renewal(self):
+        subscription, card = self.subscribe('leaving', '1000.00', self.BILLING_DATE, auto_renewal=False)
+        result = run_billing(self.BILLING_DATE)
+
+        self.assertEqual((result['expired'], result['transactions']), (1, 0))
+        self.assertEqual(balance(card), Decimal('1000.00'))
+        subscription.refresh_from_db()
+        self.assertEqual((subscription.status, subscription.is_active), ('expired', False))
+
+    def test_second_run_for_same_date_charges_nothing(self):
+        _, card = self.subscribe('payer', '1000.00', self.BILLING_DATE)
+        self.subscribe('poor', '10.00', self.BILLING_DATE)
+        self.subscribe('leaving', '1000.00', self.BILLING_DATE, auto_renewal=False)
+        first = run_billing(self.BILLING_DATE, chunk_size=2)
+        self.assertEqual((first['charged'], first['suspended'], first['expired']), (1, 1, 1))
+
+        second = run_billing(self.BILLING_DATE, chunk_size=2)
+        self.assertEqual(second, dict.fromkeys(second, 0))
+        self.assertEqual(balance(card), Decimal('900.00'))
+        self.assertEqual(Transaction.objects.filter(transaction_type='fee').count(), 1)
+
+
+class SettlementTests(TestCase):
+    def setUp(self):
+        self.payer, self.a = make_client('payer', balance='1000.00', daily_limit='500.00')
+        self.payee, self.b = make_client('payee', balance='500.00')
+
+    def test_opposing_transfers_settle_as_net_positions(self):
+        first = submit_transfer('transfer', '300.00', from_card=self.a, to_card=self.b)
+        second = submit_transfer('transfer', '200.00', from_card=self.b, to_card=self.a)
+
+        # До расчета балансы не меняются, а сумма зарезервирована
+        self.assertEqual((balance(self.a), balance(self.b)), (Decimal('1000.00'), Decimal('500.00')))
+        self.assertEqual(reserved_amounts([self.a.pk]), {self.a.pk: Decimal('300.00')})
+        with self.assertRaises(InsufficientFunds):
+            post_transaction('payment', '750.00', from_card=self.a)
+        self.assertFalse(Posting.objects.exists())
+
+        result = settle_batch()
+        self.assertEqual(result, {'settled': 2, 'failed': 0, 'card_updates': 2, 'card_legs': 4})
+        self.assertEqual((balance(self.a), balance(self.b)), (Decimal('900.00'), Decimal('600.00')))
+        self.assertEqual(reserved_amounts([self.a.pk, self.b.pk]), {})
+        for tx in (first, second):
+            tx.refresh_from_db()
+            self.assertEqual(tx.status, 'completed')
+            postings = dict(Posting.objects.filter(transaction_id=tx.pk).values_list('side', 'amount'))
+            self.assertEqual(postings, {'debit': -tx.amount, 'credit': tx.amount})
+            self.assertEqual(
+                set(Posting.objects.filter(transaction_id=tx.pk).values_list('created_at', flat=True)),
+                {tx.completed_at},
+            )
+        stats = ClientTransactionStats.objects.get(pk=self.payer.pk)
+        self.assertEqual((stats.pending_count, stats.completed_count), (0, 2))
+        self.assertEqual((stats.total_expense, stats.total_income), (Decimal('300.00'), Decimal('200.00')))
+        self.assertEqual(settle_batch()['settled'], 0)
+
+    def test_failed_settlement_releases_reservation_and_limit(self):
+        tx = submit_transfer('transfer', '400.00', from_card=self.a, to_card=self.b)
+        self.assertEqual(spent(self.a), Decimal('400.00'))
+        BankCard.objects.filter(pk=self.b.pk).update(is_active=False)
+
+        self.assertEqual(settle_batch()['failed'], 1)
+        tx.refresh_from_db()
+        self.assertEqual(tx.status, 'failed')
+        self.assertEqual((balance(self.a), balance(self.b)), (Decimal('1000.00'), Decimal('500.00')))
+        self.assertEqual(reserved_amounts([self.a.pk]), {})
+        self.assertEqual(spent(self.a), Decimal('0.00'))
+        self.assertFalse(Posting.objects.exists())
+        stats = ClientTransactionStats.objects.get(pk=self.payer.pk)
+        self.assertEqual((stats.pending_count, stats.failed_count, stats.total_expense), (0, 1, 0))
+        # Резерв снят: сумма снова доступна для списаний
+        post_transaction('fee', '1000.00', from_card=self.a)
+
+
+class CardHoldTests(TestCase):
+    def setUp(self):
+        # Книга удержаний без фонового потока: очередь записывается при списании и отмене
+        self.book = holds.HoldBook(flush_interval=3600, snapshot_ttl=3600)
+        self.book._pid = os.getpid()
+        patcher = mock.patch.object(holds, '_book', self.book)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.owner, self.card = make_client('owner', balance='1000.00', daily_limit='600.00')
+        self.client.force_login(self.owner.user)
+
+    def post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def authorize(self, amount):
+        return self.post(f'/api/cards/{self.card.pk}/authorize/', {'amount': amount, 'merchant': 'Shop'})
+
+    def test_authorization_rejected_over_funds_or_daily_limit(self):
+        self.assertEqual(self.authorize('500.00').status_code, 200)
+        # Лимит: 600 - 500 удержано
+        response = self.authorize('150.00')
+        self.assertEqual(response.status_code, 402)
+        self.assertEqual(response.json()['error'], 'Превышен дневной лимит по карте')
+
+        BankCard.objects.filter(pk=self.card.pk).update(daily_limit=Decimal('5000.00'))
+        self.book.invalidate([self.card.pk])
+        self.book.flush()
+        self.book.refresh()
+        # Средства: 1000 - 500 удержано
+        response = self.authorize('500.01')
+        self.assertEqual(response.status_code, 402)
+        self.assertEqual(response.json()['error'], 'Недостаточно средств на счете')
+        self.assertEqual(self.book.available(self.card.pk), Decimal('500.00'))
+
+    def test_capture_posts_payment_and_rejects_amount_over_hold(self):
+        hold_id = self.authorize('300.00').json()['hold_id']
+
+        response = self.post(f'/api/holds/{hold_id}/capture/', {'amount': '300.01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CardHold.objects.count(), 1)
+
+        response = self.post(f'/api/holds/{hold_id}/capture/', {'amount': '250.00'})
+        self.assertEqual(response.status_code, 200)
+        tx = Transaction.objects.get(pk=response.json()['transaction_id'])
+        self.assertEqual((tx.transaction_type, tx.status, tx.amount), ('payment', 'completed', Decimal('250.00')))
+        self.assertEqual(dict(Posting.objects.filter(transaction_id=tx.pk).values_list('side', 'amount')),
+                         {'debit': Decimal('-250.00'), 'credit': Decimal('250.00')})
+        self.assertEqual(balance(self.card), Decimal('750.00'))
+        self.assertEqual(spent(self.card), Decimal('250.00'))
+        self.assertFalse(CardHold.objects.exists())
+        self.assertEqual(self.post(f'/api/holds/{hold_id}/capture/', {}).status_code, 404)
+
+    def test_release_frees_reserve(self):
+        hold_id = self.authorize('550.00').json()['hold_id']
+        self.book.flush()
+        self.assertEqual(reserved_amounts([self.card.pk]), {self.card.pk: Decimal('550.00')})
+        with self.assertRaises(InsufficientFunds):
+            post_transaction('fee', '500.00', from_card=self.card)
+
+        # Снимок процесса помечается устаревшим после фиксации отмены
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.post(f'/api/holds/{hold_id}/release/', {}).status_code, 200)
+        self.assertEqual(reserved_amounts([self.card.pk]), {})
+        self.assertEqual(Transaction.objects.get().status, 'cancelled')
+        self.assertEqual(balance(self.card), Decimal('1000.00'))
+        self.assertFalse(Posting.objects.exists())
+        self.book.refresh()
+        self.assertEqual(self.book.available(self.card.pk), Decimal('1000.00'))
+        self.assertEqual(self.post(f'/api/holds/{hold_id}/release/', {}).status_code, 404)
+
+    def test_invalid_amounts_are_rejected(self):
+        for amount in (float('nan'), '-10', 0, 'abc', None):
+            self.assertEqual(self.authorize(amount).status_code, 400, amount)
+        hold_id = self.authorize('100.00').json()['hold_id']
+        for amount in (float('nan'), '-10', 'Infinity'):
+            response = self.post(f'/api/holds/{hold_id}/capture/', {'amount': amount})
+            self.assertEqual(response.status_code, 400, amount)
+        self.assertEqual(CardHold.objects.count(), 1)
+        self.assertFalse(Transaction.objects.exists())
+
+
+class ReconciliationTests(TestCase):
+    def setUp(self):
+        _, self.a = make_client('a', balance='1000.00')
+        _, self.b = make_client('b')
+        create_checkpoints([self.a.pk, self.b.pk])
+        post_transaction('transfer', '100.00', from_card=self.a, to_card=self.b)
+
+    def reconcile(self, apply=None):
+        return reconcile_chunk(self.a.pk, self.b.pk + 100, apply=apply)
+
+    def drift(self, card, amount):
+        BankCard.objects.filter(pk=card.pk).update(balance=F('balance') + Decimal(amount))
+
+    def test_consistent_cards_have_no_mismatches(self):
+        self.assertEqual(self.reconcile(), (2, [], 0))
+
+    def test_drift_is_reported_without_writes(self):
+        self.drift(self.a, '5.00')
+        checked, mismatches, unchecked = self.reconcile()
+
+        self.assertEqual((checked, unchecked), (2, 0))
+        self.assertEqual(mismatches, [{
+            'card_id': self.a.pk, 'balance': '905.00', 'expected': '900.00', 'difference': '5.00',
+            'action': 'reported',
+        }])
+        self.assertEqual(balance(self.a), Decimal('905.00'))
+        self.assertEqual(BalanceCheckpoint.objects.count(), 2)
+
+    def test_adjust_accepts_balance_with_new_checkpoint(self):
+        self.drift(self.a, '5.00')
+        self.assertEqual(self.reconcile('adjust')[1][0]['action'], 'adjusted')
+
+        self.assertEqual(balance(self.a), Decimal('905.00'))
+        latest = BalanceCheckpoint.objects.filter(card=self.a).latest('as_of')
+        self.assertEqual(latest.balance, Decimal('905.00'))
+        self.assertEqual(self.reconcile(), (2, [], 0))
+
+    def test_reset_restores_checkpoint_plus_postings(self):
+        self.drift(self.a, '-40.00')
+        self.assertEqual(self.reconcile('reset')[1][0]['action'], 'reset')
+
+        self.assertEqual(balance(self.a), Decimal('900.00'))
+        self.assertEqual(BalanceCheckpoint.objects.count(), 2)
+        self.assertEqual(self.reconcile(), (2, [], 0))
+
+    def test_card_without_checkpoint_is_unchecked(self):
+        _, card = make_client('c', balance='10.00')
+        self.drift(card, '1.00')
+        self.assertEqual(self.reconcile(), (2, [], 1))
+
+    def test_hot_card_shards_are_included(self):
+        set_hot(self.b.pk, shards=2)
+        post_transaction('transfer', '50.00', from_card=self.a, to_card=self.b)
+        self.assertEqual(balance(self.b), Decimal('100.00'))
+        self.assertEqual(self.reconcile(), (2, [], 0))
+
+        # Расхождение в строках горячей карты: reset переносит их и выравнивает баланс
+        CardBalanceShard.objects.filter(card=self.b, shard=0).update(amount=F('amount') + 7)
+        mismatch = self.reconcile('reset')[1]
+        self.assertEqual([(m['card_id'], m['difference']) for m in mismatch], [(self.b.pk, '7.00')])
+        self.assertEqual(card_balances([self.b.pk]), {self.b.pk: Decimal('150.00')})
+        self.assertEqual(self.reconcile(), (2, [], 0))
+
+
+def moment(day, hour=12):
+    return timezone.make_aware(datetime(2026, 1, day, hour))
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        _, self.card = make_client('owner', balance='1000.00')
+        _, self.other = make_client('other')
+        # Проводки 1, 3 и 5 января: -100, -200, +50; текущий баланс 750
+        for day, (amount, from_card, to_card) in zip((1, 3, 5), (
+            ('100.00', self.card, self.other),
+            ('200.00', self.card, self.other),
+            ('50.00', self.other, self.card),
+        )):
+            tx = post_transaction('transfer', amount, from_card=from_card, to_card=to_card)
+            Posting.objects.filter(transaction_id=tx.pk).update(created_at=moment(day))
+
+    def add_checkpoints(self):
+        BalanceCheckpoint.objects.create(card=self.card, as_of=moment(2), balance=Decimal('900.00'))
+        BalanceCheckpoint.objects.create(card=self.card, as_of=moment(4), balance=Decimal('700.00'))
+
+    def test_balance_as_of_without_checkpoints_counts_back_from_current(self):
+        self.assertEqual(balance_as_of(self.card.pk, moment(1, 0)), Decimal('1000.00'))
+        self.assertEqual(balance_as_of(self.card.pk, moment(2)), Decimal('900.00'))
+        self.assertEqual(balance_as_of(self.card.pk, moment(6)), Decimal('750.00'))
+
+    def test_balance_as_of_around_checkpoints(self):
+        self.add_checkpoints()
+        # Точка после момента: отсчет назад от нее
+        self.assertEqual(balance_as_of(self.card.pk, moment(1, 0)), Decimal('1000.00'))
+        # Проводка в сам момент еще не учтена
+        self.assertEqual(balance_as_of(self.card.pk, moment(1)), Decimal('1000.00'))
+        self.assertEqual(balance_as_of(self.card.pk, moment(2)), Decimal('900.00'))
+        self.assertEqual(balance_as_of(self.card.pk, moment(3, 18)), Decimal('700.00'))
+        self.assertEqual(balance_as_of(self.card.pk, moment(4)), Decimal('700.00'))
+        self.assertEqual(balance_as_of(self.card.pk, moment(6)), Decimal('750.00'))
+
+    def test_balance_series(self):
+        self.add_checkpoints()
+        self.assertEqual(balance_series(self.card.pk, date(2025, 12, 31), date(2026, 1, 5)), [
+            (date(2025, 12, 31), Decimal('1000.00')),
+            (date(2026, 1, 1), Decimal('900.00')),
+            (date(2026, 1, 2), Decimal('900.00')),
+            (date(2026, 1, 3), Decimal('700.00')),
+            (date(2026, 1, 4), Decimal('700.00')),
+            (date(2026, 1, 5), Decimal('750.00')),
+        ])
+
+    def test_postings_of_each_transaction_sum_to_zero(self):
+        post_transaction('deposit', '30.00', to_card=self.card)
+        post_transaction('payment', '20.00', from_card=self.card)
+        totals = Posting.objects.values('transaction_id').annotate(total=Sum('amount'), rows=Count('id'))
+        self.assertEqual(len(totals), Transaction.objects.count())
+        self.assertEqual({(row['total'], row['rows']) for row in totals}, {(Decimal('0.00'), 2)})
+        # У внешней стороны карты нет
+        deposit = Transaction.objects.get(transaction_type='deposit')
+        self.assertEqual(dict(Posting.objects.filter(transaction_id=deposit.pk).values_list('side', 'card_id')),
+                         {'debit': None, 'credit': self.card.pk})
+
+    def test_backfill_is_idempotent(self):
+        backfill = import_module('dbo.migrations.0025_backfill_postings').backfill_postings
+        # Операции до появления журнала: строк проводок у них нет
+        Posting.objects.all().delete()
+        Transaction.objects.create(from_card=self.card, amount=Decimal('5.00'), transaction_type='payment',
+                                   description='', status='pending')
+        schema_editor = mock.Mock(connection=connection)
+        backfill(apps, schema_editor)
+        backfill(apps, schema_editor)
+
+        self.assertEqual(Posting.objects.count(), 6)
+        self.assertEqual(
+            set(Posting.objects.values('transaction_id').annotate(rows=Count('id')).values_list('rows', flat=True)),
+            {2},
+        )
+        self.assertEqual(balance_as_of(self.card.pk, moment(1, 0)), Decimal('1000.00'))
+
+
+class HotCardTests(TestCase):
+    def setUp(self):
+        self.payer, self.a = make_client('payer', balance='1000.00')
+        self.owner, self.hot = make_client('hot', balance='10.00')
+        set_hot(self.hot.pk, shards=4)
+        for amount in ('100.00', '20.00', '3.00'):
+            post_transaction('transfer', amount, from_card=self.a, to_card=self.hot)
+
+    def test_card_balances_adds_pending_shards(self):
+        pending = CardBalanceShard.objects.filter(card=self.hot).aggregate(total=Sum('amount'))['total']
+        self.assertEqual(pending, Decimal('123.00'))
+        self.assertEqual(balance(self.hot), Decimal('10.00'))
+        self.assertEqual(card_balances([self.hot.pk, self.a.pk]),
+                         {self.hot.pk: Decimal('133.00'), self.a.pk: Decimal('877.00')})
+
+    def test_fold_is_idempotent(self):
+        self.assertEqual(fold(self.hot.pk), Decimal('123.00'))
+        self.assertEqual(fold(self.hot.pk), Decimal('0.00'))
+        self.assertEqual(balance(self.hot), Decimal('133.00'))
+        self.assertEqual(card_balances([self.hot.pk]), {self.hot.pk: Decimal('133.00')})
+        stats = get_client_stats(self.owner)
+        self.assertEqual((stats.total_count, stats.total_income), (3, Decimal('123.00')))
+        self.assertFalse(CardBalanceShard.objects.filter(card=self.hot).exclude(amount=0).exists())
+
+    def test_turning_hot_mode_off_folds_remaining_shards(self):
+        set_hot(self.hot.pk, shards=0)
+
+        self.assertFalse(CardBalanceShard.objects.filter(card=self.hot).exists())
+        self.assertEqual(balance(self.hot), Decimal('133.00'))
+        self.assertEqual(BankCard.objects.get(pk=self.hot.pk).balance_shards, 0)
+        self.assertEqual(get_client_stats(self.owner).total_income, Decimal('123.00'))
+        # Дальше зачисления идут прямо в balance
+        post_transaction('transfer', '7.00', from_card=self.a, to_card=self.hot)
+        self.assertEqual(balance(self.hot), Decimal('140.00'))
+
+
+class CardStatementsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner, self.card = make_client('owner')
+        self.client.force_login(self.owner.user)
+        for number in range(25):
+            post_transaction('deposit', '10.00', to_card=self.card, description=f'Пополнение {number}')
+        self.url = f'/card/{self.card.pk}/statements/'
+
+    def test_unchanged_statement_is_not_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(first.json()['statements']), 20)
+
+        second = self.client.get(self.url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_posting_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            post_transaction('deposit', '1.00', to_card=self.card, description='Новое пополнение')
+
+        response = self.client.get(self.url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['statements'][0]['description'], 'Новое пополнение')
+
+    def test_cursor_page_bypasses_cache(self):
+        next_cursor = self.client.get(self.url).json()['next_cursor']
+        # Изменение без сброса кэша: первая страница отдается из кэша, следующие — из БД
+        Transaction.objects.update(description='Изменено')
+
+        self.assertNotEqual(self.client.get(self.url).json()['statements'][0]['description'], 'Изменено')
+        response = self.client.get(self.url, {'cursor': next_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        statements = response.json()['statements']
+        self.assertEqual([s['description'] for s in statements], ['Изменено'] * 5)
+        self.assertIsNone(response.json()['next_cursor'])
+
+    def test_garbage_cursor_returns_first_page(self):
+        for cursor in ('garbage', '!!!', 'WyJuZXh0IiwgWzEsIDJdXQ', 'WyJuZXh0IixbIngiLCJ5Il1d'):
+            response = self.client.get(self.url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 200, cursor)
+            self.assertEqual(len(response.json()['statements']), 20)
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        self.owner, self.card = make_client('owner', balance='1000.00')
+        self.peer, self.peer_card = make_client('peer', balance='1000.00')
+        for number in range(4):
+            post_transaction('transfer', '1.00', from_card=self.card, to_card=self.peer_card)
+            post_transaction('transfer', '2.00', from_card=self.peer_card, to_card=self.card)
+        post_transaction('deposit', '3.00', to_card=self.peer_card)
+        # Половина операций — в одну и ту же секунду: порядок между ними задает id
+        ids = list(Transaction.objects.order_by('id').values_list('id', flat=True))
+        for position, tx_id in enumerate(ids):
+            Transaction.objects.filter(id=tx_id).update(created_at=moment(1 + position // 2))
+        self.expected = list(Transaction.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def walk(self, paginator, cursor=None):
+        pages = []
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append(page)
+            if not page.has_next():
+                return pages
+            cursor = page.next_cursor
+
+    def ids(self, page):
+        return [tx.id for tx in page]
+
+    def test_next_pages_cover_ties_once(self):
+        pages = self.walk(KeysetPaginator(Transaction.objects.all(), 4))
+
+        self.assertEqual([len(page) for page in pages], [4, 4, 1])
+        self.assertEqual([tx_id for page in pages for tx_id in self.ids(page)], self.expected)
+        self.assertFalse(pages[0].has_previous())
+        self.assertTrue(pages[-1].has_previous())
+
+    def test_previous_cursor_returns_previous_page(self):
+        paginator = KeysetPaginator(Transaction.objects.all(), 4)
+        pages = self.walk(paginator)
+
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(pages[1]))
+        self.assertTrue(back.has_next())
+        self.assertTrue(back.has_previous())
+        first = paginator.get_page(back.previous_cursor)
+        self.assertEqual(self.ids(first), self.expected[:4])
+        self.assertFalse(first.has_previous())
+
+        last = paginator.get_page(LAST_PAGE)
+        self.assertEqual(self.ids(last), self.expected[-4:])
+        self.assertFalse(last.has_next())
+        self.assertEqual(self.ids(paginator.get_page(last.previous_cursor)), self.expected[-8:-4])
+
+    def test_branches_merge_like_or(self):
+        expected = list(
+            client_transactions(self.owner).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(len(expected), 8)
+        pages = self.walk(client_history_paginator(self.owner, 3))
+
+        self.assertEqual([tx_id for page in pages for tx_id in self.ids(page)], expected)
+        back = client_history_paginator(self.owner, 3).get_page(pages[-1].previous_cursor)
+        self.assertEqual(self.ids(back), self.ids(pages[-2]))
+
+    def test_invalid_cursors_give_first_page(self):
+        paginator = KeysetPaginator(Transaction.objects.all(), 4)
+
+        def encoded(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        for cursor in (
+            'garbage', '%%%', encoded(['sideways', ['2026-01-01T12:00:00+00:00', 1]]),
+            encoded(['next', [1]]), encoded(['next', [None, 1]]), encoded(['next', ['not a date', 1]]),
+            encoded({'next': 1}),
+        ):
+            page = paginator.get_page(cursor)
+            self.assertEqual(self.ids(page), self.expected[:4], cursor)
+            self.assertFalse(page.has_previous())
+
+
+class DepositAccrualTests(TestCase):
+    START = date(2026, 1, 1)
+
+    def setUp(self):
+        self.owner, self.card = make_client('owner')
+
+    def open_deposit(self, amount, rate, days):
+        return Deposit.objects.create(
+            client=self.owner, card=self.card, amount=Decimal(amount), interest_rate=Decimal(rate), term_months=1,
+            start_date=self.START, end_date=self.START + timedelta(days=days),
+        )
+
+    def test_accrued_total_is_rounded_to_kopecks_once(self):
+        # 365 ₽ под 1,5% — 1,5 копейки в день
+        daily = self.open_deposit('365.00', '1.50', 30)
+        run_accrual(self.START + timedelta(days=1))
+        daily.refresh_from_db()
+        self.assertEqual(daily.accrued_interest, Decimal('0.02'))
+
+        skipped = self.open_deposit('365.00', '1.50', 30)
+        run_accrual(self.START + timedelta(days=2))
+        daily.refresh_from_db()
+        skipped.refresh_from_db()
+        # Итог за два дня — 3 копейки, а не 2 + 2; расчет с пропуском дня дает то же
+        self.assertEqual(daily.accrued_interest, Decimal('0.03'))
+        self.assertEqual(skipped.accrued_interest, Decimal('0.03'))
+        self.assertEqual(daily.accrued_through, self.START + timedelta(days=2))
+        self.assertEqual(
+            list(DepositAccrual.objects.filter(deposit=daily).order_by('id').values_list('amount', flat=True)),
+            [Decimal('0.02'), Decimal('0.01')],
+        )
+
+    def test_matured_deposit_is_paid_out_once(self):
+        deposit = self.open_deposit('10000.00', '7.30', 10)
+        on_date = self.START + timedelta(days=15)
+        result = run_accrual(on_date)
+
+        self.assertEqual((result['matured'], result['transactions'], result['paid_out']),
+                         (1, 2, Decimal('10020.00')))
+        deposit.refresh_from_db()
+        # Проценты — только по дату окончания срока
+        self.assertEqual((deposit.accrued_interest, deposit.accrued_through, deposit.is_active),
+                         (Decimal('20.00'), self.START + timedelta(days=10), False))
+        self.assertEqual(balance(self.card), Decimal('10020.00'))
+
+        # Повторный запуск с той же датой ничего не начисляет и не выплачивает
+        self.assertEqual(run_accrual(on_date), dict.fromkeys(result, 0))
+        self.assertEqual(balance(self.card), Decimal('10020.00'))
+        self.assertEqual(Transaction.objects.count(), 2)
+
+
+class CreditScheduleTests(TestCase):
+    def arrays(self, *credits):
+        """Массивы iterate_schedule / evaluate: (сумма в копейках, ставка в сотых долях %, срок)"""
+        amount, rate, term = zip(*credits)
+        return np.array(amount, dtype=np.int64), np.array(rate, dtype=np.int64), np.array(term, dtype=np.int64)
+
+    def test_schedule_sums_to_principal_plus_interest(self):
+        amount, rate, term = self.arrays((1_200_000, 1200, 12), (10_000, 0, 3), (5_000_000, 1999, 36))
+        rows = list(iterate_schedule(amount, rate, term))
+
+        payments = sum(row['payment'] for row in rows)
+        interest = sum(row['interest'] for row in rows)
+        self.assertEqual(list(sum(row['principal'] for row in rows)), list(amount))
+        self.assertEqual(list(payments), list(amount + interest))
+        self.assertEqual(list(rows[-1]['balance']), [0, 0, 0])
+        self.assertEqual(list(rows[-1]['cumulative']), list(payments))
+        # Аннуитет 12 000 ₽ под 12% на год — 1066,19 ₽; без процентов последний платеж закрывает остаток
+        self.assertEqual(rows[0]['payment'][0], 106_619)
+        self.assertEqual([int(row['payment'][1]) for row in rows[:4]], [3333, 3333, 3334, 0])
+
+    def test_non_positive_term_is_one_month(self):
+        amount, rate, term = self.arrays((120_000, 1200, 0), (120_000, 1200, -3), (120_000, 1200, 1))
+        state = evaluate(amount, rate, term, np.array(['2026-01-15'] * 3, dtype='datetime64[D]'),
+                         np.zeros(3, dtype=np.int64), date(2026, 1, 20))
+
+        self.assertEqual(list(state['total']), [121_200] * 3)
+        self.assertEqual(list(state['payment']), [121_200] * 3)
+        self.assertEqual(list(state['repaid']), [False] * 3)
+        self.assertEqual(list(state['remaining']), [120_000] * 3)
+
+
+class CreditPaymentTests(TestCase):
+    def setUp(self):
+        self.owner, self.card = make_client('owner', balance='50000.00')
+        start = timezone.localdate() - timedelta(days=75)
+        self.credit = Credit.objects.create(
+            client=self.owner, amount=Decimal('12000.00'), interest_rate=Decimal('12.00'), term_months=12,
+            monthly_payment=0, remaining_amount=Decimal('12000.00'), start_date=start,
+            end_date=start + timedelta(days=365),
+        )
+
+    def test_payment_and_nightly_update(self):
+        # Наступили два платежа, не внесено ничего
+        result = update_credits(timezone.localdate())
+        self.assertEqual((result['credits'], result['changed'], result['overdue']), (1, 1, 1))
+        self.credit.refresh_from_db()
+        self.assertEqual((self.credit.status, self.credit.monthly_payment), ('overdue', Decimal('1066.19')))
+        # Повторный пересчет на ту же дату ничего не меняет
+        self.assertEqual(update_credits(timezone.localdate())['changed'], 0)
+
+        credit = pay_credit(self.credit.pk, self.owner, self.card, '2132.38')
+        self.assertEqual((credit.status, credit.paid_amount), ('active', Decimal('2132.38')))
+        # После двух платежей: 12000 - (1066,19 - 120) - (1066,19 - 110,54)
+        self.assertEqual(credit.remaining_amount, Decimal('10098.16'))
+        self.assertEqual(balance(self.card), Decimal('47867.62'))
+        payment = CreditPayment.objects.get(credit=credit)
+        self.assertEqual(Transaction.objects.get(pk=payment.transaction_id).amount, Decimal('2132.38'))
+        self.assertEqual(update_credits(timezone.localdate())['changed'], 0)
+
+        with self.assertRaises(PostingError):
+            pay_credit(self.credit.pk, self.owner, self.card, '20000.00')
+
+
+class InvestmentRevaluationTests(TestCase):
+    def setUp(self):
+        self.owner, _ = make_client('owner')
+        self.fund, self.unpriced, self.bonds = [
+            InvestmentProduct.objects.create(name=name, description='', product_type='pif', min_amount=1000,
+                                             risk_level='medium', expected_return=5)
+            for name in ('Фонд', 'Без цен', 'Облигации')
+        ]
+        for product, day, price in ((self.fund, 2, '100'), (self.fund, 5, '110'), (self.bonds, 1, '50')):
+            ProductPrice.objects.create(product=product, date=date(2026, 1, day), price=Decimal(price))
+
+    def lookup(self, series, product, day):
+        prices, days = series.lookup(np.array([product.pk], dtype=np.int64),
+                                     np.array([date(2026, 1, day).toordinal()], dtype=np.int64))
+        return prices[0], days[0]
+
+    def test_lookup(self):
+        series = PriceSeries(date(2026, 1, 31))
+        # До начала ряда — первая цена ряда
+        self.assertEqual(self.lookup(series, self.fund, 1), (100.0, date(2026, 1, 2).toordinal()))
+        self.assertEqual(self.lookup(series, self.fund, 4), (100.0, date(2026, 1, 2).toordinal()))
+        self.assertEqual(self.lookup(series, self.fund, 9), (110.0, date(2026, 1, 5).toordinal()))
+        self.assertEqual(self.lookup(series, self.bonds, 1), (50.0, date(2026, 1, 1).toordinal()))
+        price, day = self.lookup(series, self.unpriced, 9)
+        self.assertTrue(np.isnan(price))
+        self.assertEqual(day, 0)
+        # Цены позже даты ряда не видны
+        self.assertEqual(self.lookup(PriceSeries(date(2026, 1, 4)), self.fund, 9)[0], 100.0)
+        self.assertTrue(np.isnan(self.lookup(PriceSeries(date(2025, 12, 31)), self.fund, 9)[0]))
+
+    def test_revalue_positions(self):
+        position = ClientInvestment.objects.create(client=self.owner, product=self.fund, amount=Decimal('1000.00'),
+                                                   current_value=Decimal('1000.00'), purchase_date=date(2026, 1, 1))
+        unpriced = ClientInvestment.objects.create(client=self.owner, product=self.unpriced,
+                                                   amount=Decimal('500.00'), current_value=Decimal('500.00'),
+                                                   purchase_date=date(2026, 1, 1))
+        on_date = date(2026, 1, 10)
+
+        result = revalue_positions(on_date)
+        self.assertEqual(result, {'positions': 2, 'revalued': 1, 'unpriced': 1})
+        position.refresh_from_db()
+        self.assertEqual((position.current_value, position.return_percent, position.revalued_on),
+                         (Decimal('1100.00'), Decimal('10.00'), date(2026, 1, 5)))
+        unpriced.refresh_from_db()
+        self.assertEqual((unpriced.current_value, unpriced.revalued_on), (Decimal('500.00'), None))
+
+        self.assertEqual(revalue_positions(on_date), {'positions': 2, 'revalued': 0, 'unpriced': 1})
+
+
+class CatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_index()
+        self.owner, _ = make_client('owner')
+        category = ServiceCategory.objects.create(name='Подписки')
+        for name, price in (('СМС-информирование', 100), ('Кэшбэк', 0), ('Страховка карты', 2000)):
+            Service.objects.create(name=name, description='', category=category, price=price)
+        user = User.objects.create_user(username='security', password='x')
+        self.operator = Operator.objects.create(user=user, operator_type='security', email='security@example.com')
+
+    def test_approved_service_shows_up_in_catalog(self):
+        page = catalog_page()
+        self.assertEqual((page['total'], page['free']), (3, 1))
+        self.assertEqual(catalog_page(q='консультация')['services'], [])
+        service_request = ServiceRequest.objects.create(client=self.owner, service_name='Юридическая консультация',
+                                                        service_description='Помощь юриста', price=500)
+
+        self.client.force_login(self.operator.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/approve-request/{service_request.pk}/')
+
+        page = catalog_page()
+        self.assertEqual((page['total'], page['free']), (4, 1))
+        self.assertIn('Юридическая консультация', [service['name'] for service in page['services']])
+        self.assertEqual([s['name'] for s in catalog_page(q='консультация')['services']], ['Юридическая консультация'])
+        page = catalog_page(category='Дополнительные услуги')
+        self.assertEqual((page['total'], [s['name'] for s in page['services']]), (1, ['Юридическая консультация']))
+
+    def test_cache_key_ignores_query_formatting(self):
+        catalog_page(q='Страховка')
+        # Изменение без сброса кэша: тот же нормализованный запрос отдается из кэша
+        Service.objects.update(name='Изменено')
+        page = catalog_page(q='  страховка СТРАХОВКА ')
+        self.assertEqual([s['name'] for s in page['services']], ['Страховка карты'])
+
+
+class PrefixIndexTests(TestCase):
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.build([(1, 'Страхование карты'), (2, 'Страхование жизни'), (3, 'Кредитная карта')])
+
+    def test_search(self):
+        self.assertEqual(self.index.search('страх'), [1, 2])
+        self.assertEqual(self.index.search('страх', limit=1), [1])
+        self.assertEqual(self.index.search('карт'), [3, 1])
+        self.assertEqual(self.index.search(''), [])
+
+    def test_multiple_tokens(self):
+        # Последний токен — префикс слова, остальные — префиксы других слов документа
+        self.assertEqual(self.index.search('карт страх'), [1])
+        self.assertEqual(self.index.search('СТРАХ  Карт'), [1])
+        self.assertEqual(self.index.search('кред карт'), [3])
+        self.assertEqual(self.index.search('страх жизн'), [2])
+        self.assertEqual(self.index.search('жизн карт'), [])
+        self.assertEqual(self.index.search('страх автомоб'), [])
+
+    def test_add_and_remove(self):
+        self.index.add(2, 'Страхование жизни и карты')
+        self.assertEqual(self.index.search('карт страх'), [1, 2])
+        self.index.remove(1)
+        self.assertEqual(self.index.search('карт страх'), [2])
+        self.assertEqual(len(self.index), 2)
+        self.assertNotIn(('страхование', 1), self.index.entries)
+
+
+class ServiceFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.subscriptions = ServiceCategory.objects.create(name='Подписки')
+        self.insurance = ServiceCategory.objects.create(name='Страхование')
+
+    def assertFacetsMatch(self):
+        self.assertEqual(facet_counts(), {key: count for key, count in compute_facets().items() if count})
+
+    def test_counts_follow_service_writes(self):
+        sms, cashback, policy = [
+            Service.objects.create(name=name, description='', category=category, price=price)
+            for name, category, price in (
+                ('СМС-информирование', self.subscriptions, 100),
+                ('Кэшбэк', self.subscriptions, 0),
+                ('Страховка карты', self.insurance, 2000),
+            )
+        ]
+        self.assertFacetsMatch()
+        self.assertEqual(facet_counts()[(self.subscriptions.pk, 'low', True)], 1)
+
+        sms.price = 6000
+        sms.save()
+        self.assertFacetsMatch()
+        cashback.category = self.insurance
+        cashback.save()
+        self.assertFacetsMatch()
+        policy.is_active = False
+        policy.save()
+        self.assertFacetsMatch()
+        self.assertEqual(facet_counts(), {
+            (self.subscriptions.pk, 'high', True): 1,
+            (self.insurance.pk, 'free', True): 1,
+            (self.insurance.pk, 'medium', False): 1,
+        })
+
+        sms.delete()
+        self.assertFacetsMatch()
+        with self.captureOnCommitCallbacks(execute=True):
+            cashback.delete()
+        self.assertFacetsMatch()
+        self.assertEqual(facet_counts(), {(self.insurance.pk, 'medium', False): 1})
+        page = catalog_page()
+        self.assertEqual((page['total'], page['free']), (0, 0))
+
+    def test_unchanged_save_keeps_counts(self):
+        service = Service.objects.create(name='Кэшбэк', description='', category=self.subscriptions, price=0)
+        service.name = 'Кэшбэк+'
+        service.save()
+        self.assertEqual(facet_counts(), {(self.subscriptions.pk, 'free', True): 1})
+
+    def test_rebuild_after_bulk_writes(self):
+        Service.objects.bulk_create([
+            Service(name=f'Услуга {number}', description='', category=self.subscriptions, price=number * 1000)
+            for number in range(4)
+        ])
+        self.assertEqual(facet_counts(), {})
+        self.assertEqual(rebuild_facets(), 3)
+        self.assertFacetsMatch()
+
+
+class ServiceRatingTests(TestCase):
+    def setUp(self):
+        category = ServiceCategory.objects.create(name='Подписки')
+        self.service, self.other = [
+            Service.objects.create(name=name, description='', category=category, price=100)
+            for name in ('СМС-информирование', 'Кэшбэк')
+        ]
+        self.clients = [make_client(f'client{number}')[0] for number in range(3)]
+
+    def deltas(self):
+        return list(ServiceRatingDelta.objects.order_by('id').values_list('service_id', 'votes', 'score'))
+
+    def test_revote_stores_score_delta(self):
+        client = self.clients[0]
+        self.assertIsNone(rate(self.service.pk, client.pk, 4))
+        self.assertEqual(rate(self.service.pk, client.pk, 2), 4)
+        self.assertEqual(rate(self.service.pk, client.pk, 2), 2)
+        self.assertEqual(self.deltas(), [(self.service.pk, 1, 4), (self.service.pk, 0, -2)])
+        self.assertEqual(ServiceVote.objects.get(service=self.service, client=client).score, 2)
+
+        for score in (0, 6, 3.0, '3', True, None):
+            with self.assertRaises(RatingError):
+                rate(self.service.pk, client.pk, score)
+        self.assertEqual(len(self.deltas()), 2)
+
+    def test_flush_matches_votes(self):
+        for client, score in zip(self.clients, (5, 4, 1)):
+            rate(self.service.pk, client.pk, score)
+        rate(self.other.pk, self.clients[0].pk, 3)
+        rate(self.service.pk, self.clients[2].pk, 3)
+        # До переноса рейтинг услуги прежний
+        self.assertEqual(Service.objects.get(pk=self.service.pk).rating_count, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(flush_ratings(batch_size=2), 5)
+        self.assertEqual(self.deltas(), [])
+        for service in Service.objects.filter(pk__in=[self.service.pk, self.other.pk]):
+            votes = ServiceVote.objects.filter(service=service).aggregate(count=Count('id'), total=Sum('score'))
+            self.assertEqual((service.rating_count, service.rating_total), (votes['count'], votes['total']))
+            self.assertEqual(service.rating, average(votes['total'], votes['count']))
+        self.assertEqual(Service.objects.get(pk=self.service.pk).rating, Decimal('4.00'))
+
+        rate(self.service.pk, self.clients[1].pk, 1)
+        flush_ratings()
+        service = Service.objects.get(pk=self.service.pk)
+        self.assertEqual((service.rating_count, service.rating_total, service.rating), (3, 9, Decimal('3.00')))
+        self.assertEqual(flush_ratings(), 0)
+
+
+class RecommendationTests(TestCase):
+    # Клиент → услуги; общих клиентов: 10-20 — 3, 10-30 — 2, остальные пары — по 1
+    SUBSCRIPTIONS = {1: (10, 20, 30), 2: (20, 10), 3: (10, 20, 40), 4: (30, 40), 5: (50,), 6: (30, 10)}
+
+    def matrix(self):
+        pairs = [(client, service) for client, services in self.SUBSCRIPTIONS.items() for service in services]
+        client_ids, service_ids = np.array(pairs, dtype=np.int64).T
+        return CooccurrenceMatrix(client_ids, service_ids)
+
+    def pairs(self, matrix, first, second, counts):
+        services = matrix.services
+        return sorted(zip(services[first].tolist(), services[second].tolist(), counts.tolist()))
+
+    def test_cooccurrence(self):
+        matrix = self.matrix()
+        expected = [
+            (10, 20, 3), (10, 30, 2), (10, 40, 1), (20, 10, 3), (20, 30, 1), (20, 40, 1),
+            (30, 10, 2), (30, 20, 1), (30, 40, 1), (40, 10, 1), (40, 20, 1), (40, 30, 1),
+        ]
+        self.assertEqual(self.pairs(matrix, *matrix.cooccurrence()), expected)
+        # Порции по одному клиенту дают те же суммы
+        self.assertEqual(self.pairs(matrix, *matrix.cooccurrence(chunk=1)), expected)
+        # Клиенты с тремя услугами пропускаются
+        self.assertEqual(self.pairs(matrix, *matrix.cooccurrence(max_client_services=2)), [
+            (10, 20, 1), (10, 30, 1), (20, 10, 1), (30, 10, 1), (30, 40, 1), (40, 30, 1),
+        ])
+
+    def test_top_k(self):
+        matrix = self.matrix()
+        first, second, counts, rank = top_k(*matrix.cooccurrence())
+        services = matrix.services
+        # Пары с числом клиентов меньше MIN_CLIENTS отброшены, у 40 и 50 рекомендаций нет
+        self.assertEqual(
+            list(zip(services[first].tolist(), services[second].tolist(), counts.tolist(), rank.tolist())),
+            [(10, 20, 3, 0), (10, 30, 2, 1), (20, 10, 3, 0), (30, 10, 2, 0)],
+        )
+        first, second, counts, rank = top_k(*matrix.cooccurrence(), k=1, min_clients=1)
+        self.assertEqual(list(zip(services[first].tolist(), services[second].tolist(), rank.tolist())),
+                         [(10, 20, 0), (20, 10, 0), (30, 10, 0), (40, 10, 0)])
+
+    def test_build_recommendations(self):
+        category = ServiceCategory.objects.create(name='Подписки')
+        services = {
+            number: Service.objects.create(name=f'Услуга {number}', description='', category=category, price=100)
+            for number in (10, 20, 30, 40, 50)
+        }
+        for number, services_of_client in self.SUBSCRIPTIONS.items():
+            client, _ = make_client(f'client{number}')
+            for service_number in services_of_client:
+                ClientService.objects.create(client=client, service=services[service_number], status='active')
+
+        result = build_recommendations()
+        self.assertEqual(result, {'subscriptions': 13, 'clients': 6, 'services': 5, 'pairs': 12, 'recommendations': 4})
+        self.assertEqual(recommended_services(services[10].pk), [services[20], services[30]])
+        self.assertEqual(recommended_services(services[40].pk), [])
+        # Перестроение перезаписывает таблицу целиком
+        build_recommendations(k=1)
+        self.assertEqual(ServiceRecommendation.objects.count(), 3)
+        self.assertEqual(recommended_services(services[10].pk), [services[20]])
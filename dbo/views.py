@@ -3,18 +3,21 @@ from django.contrib.auth import authenticate, login, logout, update_session_auth
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse
-from django.db import connection, models
+from django.db import models
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from django.core.paginator import Paginator
 from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
 from django.conf import settings
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 import json
 import logging
 import secrets
 import string
+import uuid
 
 from .models import (
     Operator,
@@ -34,6 +37,23 @@ from .models import (
 )
 from django.contrib.auth.models import User
 from .logging_helper import log_from_request
+from .posting import post_transaction, PostingError, InsufficientFunds, DailyLimitExceeded
+from .stats import get_client_stats
+from .pagination import KeysetPaginator
+from .history import client_history_paginator, latest_client_transactions, period_filter
+from .search import search_transactions, SEARCH_ORDERING
+from .export import export_queryset, export_response, EXPORT_FORMATS
+from .idempotency import idempotent
+from .statements import latest_statements, make_etag, statements_payload
+from .ledger import balance_as_of, balance_series
+from .group_commit import post_transfer
+from .hot_accounts import card_balance
+from .holds import authorize, capture_holds, release_holds
+from .credits import credit_schedule, pay_credit
+from .catalog import PRICE_BUCKETS, bucket_counts, catalog_categories, catalog_facets, catalog_page
+from .service_search import autocomplete
+from .ratings import RatingError, rate
+from .recommendations import recommended_for_client, recommended_services
 
 logger = logging.getLogger(__name__)
 
@@ -41,84 +61,97 @@ def home(request):
     """Главная страница системы ДБО"""
     return render(request, 'index.html')
 def banking_services(request):
+    """Каталог услуг: выборка по категории, цене, поиску и сортировке (dbo/catalog.py)"""
     q = request.GET.get('q', '')
     price_filter = request.GET.get('price', 'all').strip()
-    sort_by = request.GET.get('sort', 'name').strip()
+    sort_by = request.GET.get('sort', '').strip()
     category_name = request.GET.get('category', '').strip()
 
-    categories = ServiceCategory.objects.exclude(name__icontains='Служебные').prefetch_related('service_set')
-    if not category_name and categories.exists():
-        category_name = categories.first().name
-
-    where_clauses = ["s.is_active = true"]
-    if category_name:
-        where_clauses.append(f"c.name = '{category_name}'")
-    if q:
-        # УЯЗВИМОСТЬ: SQL-инъекция - прямая подстановка пользовательского ввода
-        where_clauses.append(f"(s.name LIKE '%{q}%' OR s.description LIKE '%{q}%')")
-    if price_filter == 'free':
-        where_clauses.append("s.price = 0")
-    elif price_filter == 'low':
-        where_clauses.append("s.price > 0 AND s.price <= 1000")
-    elif price_filter == 'medium':
-        where_clauses.append("s.price > 1000 AND s.price <= 5000")
-    elif price_filter == 'high':
-        where_clauses.append("s.price > 5000")
-
-    order_map = {'name': 's.name', 'price-low': 's.price ASC', 'price-high': 's.price DESC', 'popular': 's.rating_count DESC'}
-    order_by = order_map.get(sort_by, 's.name')
-
-    sql = f"""SELECT s.id, s.uuid, s.name, s.description, s.price, s.is_active, s.rating, s.rating_count, c.name as category_name
-              FROM dbo_service s JOIN dbo_servicecategory c ON s.category_id = c.id
-              WHERE {' AND '.join(where_clauses)} ORDER BY {order_by}"""
-
-    services_rows = []
-    try:
-        with connection.cursor() as cursor:
-            cursor.execute(sql)
-            columns = [col[0] for col in cursor.description]
-            services_rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
-    except:
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT s.id, s.uuid, s.name, s.description, s.price, s.is_active, s.rating, s.rating_count, c.name as category_name FROM dbo_service s JOIN dbo_servicecategory c ON s.category_id = c.id WHERE s.is_active = true ORDER BY s.name")
-            columns = [col[0] for col in cursor.description]
-            services_rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    categories = catalog_categories()
+    if not category_name and categories:
+        category_name = categories[0]['name']
+    page = catalog_page(category_name, price_filter, sort_by, q)
+
+    # Счетчики боковой панели: услуги категорий в выбранном диапазоне цен и диапазоны цен выбранной категории
+    facets = catalog_facets()
+    price_key = price_filter if price_filter in PRICE_BUCKETS else 'all'
+    categories = [{**item, 'count': bucket_counts(facets, {item['id']})[price_key]} for item in categories]
+    price_counts = bucket_counts(facets, {item['id'] for item in categories if item['name'] == category_name})
 
     connected_services = set()
+    recommended = []
     if request.user.is_authenticated:
-        try:
-            client = Client.objects.get(user=request.user)
-            connected_services = set(ClientService.objects.filter(client=client, status='active').values_list('service_id', flat=True))
-        except Client.DoesNotExist:
-            pass
+        connected_services = set(
+            ClientService.objects.filter(
+                client__user=request.user, status='active',
+                service_id__in=[service['id'] for service in page['services']],
+            ).values_list('service_id', flat=True)
+        )
+        client_id = Client.objects.filter(user=request.user).values_list('id', flat=True).first()
+        if client_id is not None:
+            recommended = recommended_for_client(client_id)
 
     services_by_category = {}
-    for service in services_rows:
-        # UUID уже есть из SQL-запроса, конвертируем в строку
-        if service.get('uuid'):
-            service['uuid'] = str(service['uuid'])
-        services_by_category.setdefault(service.get('category_name', 'Без категории'), []).append(service)
+    for service in page['services']:
+        services_by_category.setdefault(service['category_name'], []).append(service)
 
     return render(request, 'banking_services.html', {
         'categories': categories,
         'services_by_category': services_by_category,
         'connected_services': connected_services,
-        'total_services': len(services_rows),
-        'free_services': sum(1 for s in services_rows if float(s.get('price', 0)) == 0),
+        'recommended_services': recommended,
+        'total_services': page['total'],
+        'shown_services': len(page['services']),
+        'free_services': page['free'],
+        'price_counts': price_counts,
         'q': q, 'price': price_filter, 'sort': sort_by, 'category_active': category_name,
     })
 
+@require_http_methods(["GET"])
+def service_autocomplete(request):
+    """Подсказки названий услуг для строки поиска каталога (dbo/service_search.py)"""
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        limit = 10
+    return JsonResponse({'suggestions': autocomplete(request.GET.get('q', ''), limit)})
+
 @login_required
 def service_detail(request, service_uuid):
     """Детальная информация об услуге"""
     service = get_object_or_404(Service, uuid=service_uuid, is_active=True)
     is_connected = False
+    my_score = None
     try:
         client = Client.objects.get(user=request.user)
         is_connected = ClientService.objects.filter(client=client, service=service, is_active=True).exists()
+        my_score = service.votes.filter(client=client).values_list('score', flat=True).first()
     except Client.DoesNotExist:
         pass
-    return render(request, 'services/detail.html', {'service': service, 'is_connected': is_connected})
+    return render(request, 'services/detail.html', {
+        'service': service, 'is_connected': is_connected, 'my_score': my_score,
+        'related_services': recommended_services(service.id),
+    })
+
+@login_required
+@require_http_methods(["POST"])
+def rate_service(request, service_uuid):
+    """Оценка услуги клиентом (score 1-5); рейтинг услуги обновится при переносе оценок (dbo/ratings.py)"""
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'success': False, 'error': 'Неверный формат JSON'}, status=400)
+    try:
+        client = Client.objects.get(user=request.user)
+    except Client.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Клиент не найден'}, status=400)
+    service_id = Service.objects.filter(uuid=service_uuid, is_active=True).values_list('id', flat=True).first()
+    if service_id is None:
+        return JsonResponse({'success': False, 'error': 'Услуга не найдена'}, status=404)
+    try:
+        previous = rate(service_id, client.id, data.get('score'))
+    except RatingError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'score': data['score'], 'previous_score': previous})
 
 @login_required
 @require_http_methods(["POST", "GET"]) 
@@ -246,6 +279,7 @@ def create_service_request(request):
 
 @login_required
 @require_http_methods(["POST"])
+@idempotent('connect_service', redirect_to='banking_services')
 def connect_service(request, service_uuid):
     """Подключение услуги: JSON для AJAX, redirect с message для обычного запроса"""
     try:
@@ -321,15 +355,23 @@ def connect_service(request, service_uuid):
                 logger.warning(warn_msg)
                 messages.warning(request, warn_msg)
             else:
-                # Проверяем баланс
+                # Списываем и создаем транзакцию одной проводкой
                 price_amount = Decimal(service.price)
-                if from_card.balance < price_amount:
-                    # Недостаточно средств — отключаем обратно и сообщаем
+                try:
+                    post_transaction(
+                        'payment', price_amount, from_card=from_card,
+                        description=f'Оплата подключения услуги "{service.name}"',
+                    )
+                except PostingError as e:
+                    # Недостаточно средств или превышен лимит — отключаем обратно и сообщаем
                     client_service.status = 'cancelled'
                     client_service.is_active = False
                     client_service.cancelled_at = timezone.now()
                     client_service.save(update_fields=['status','is_active','cancelled_at'])
-                    err_msg = f'Недостаточно средств для оплаты услуги "{service.name}"'
+                    if isinstance(e, InsufficientFunds):
+                        err_msg = f'Недостаточно средств для оплаты услуги "{service.name}"'
+                    else:
+                        err_msg = f'Не удалось оплатить услугу "{service.name}": {e}'
                     if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.content_type == 'application/json':
                         return JsonResponse({'success': False, 'error': err_msg}, status=400)
                     messages.error(request, err_msg)
@@ -338,21 +380,6 @@ def connect_service(request, service_uuid):
                         return redirect(next_url)
                     return redirect('banking_services')
 
-                # Списываем и создаем транзакцию
-                from_card.balance -= price_amount
-                from_card.save(update_fields=['balance'])
-
-                Transaction.objects.create(
-                    from_card=from_card,
-                    to_card=None,
-                    amount=price_amount,
-                    currency='RUB',
-                    transaction_type='payment',
-                    description=f'Оплата подключения услуги "{service.name}"',
-                    status='completed',
-                    completed_at=timezone.now()
-                )
-
         # Ответ в зависимости от типа запроса
         if request.headers.get('x-requested-with') == 'XMLHttpRequest' or request.content_type == 'application/json':
             return JsonResponse({'success': True, 'message': message, 'service_uuid': str(service.uuid)})
@@ -419,6 +446,7 @@ def deposits_view(request):
 
 @login_required
 @require_http_methods(["POST"])
+@idempotent('create_deposit', redirect_to='deposits_service')
 def create_deposit(request):
     """Создание заявки на депозит (фикция - объект не создается)"""
     try:
@@ -602,6 +630,7 @@ def create_card_request(request):
 
 @login_required
 @require_http_methods(["POST"])
+@idempotent('create_card')
 def create_card(request):
     """Создание реальной банковской карты, привязанной к счету клиента."""
     try:
@@ -857,7 +886,7 @@ def client_dashboard(request):
         'client': client, 'cards': cards,
         'connected_services': ClientService.objects.filter(client=client, status='active', is_active=True).select_related('service', 'service__category')[:20],
         'service_requests': ServiceRequest.objects.filter(client=client).order_by('-created_at')[:10],
-        'transactions': Transaction.objects.filter(models.Q(from_card__client=client) | models.Q(to_card__client=client)).select_related('from_card', 'to_card').order_by('-created_at')[:10],
+        'transactions': latest_client_transactions(client, 10, Transaction.objects.select_related('from_card', 'to_card')),
         'deposits': Deposit.objects.filter(client=client, is_active=True)[:10],
         'credits': credits,
         'total_balance': cards.aggregate(total=models.Sum('balance'))['total'] or 0,
@@ -971,13 +1000,14 @@ def operator1_logs(request):
     if date_to:
         logs = logs.filter(created_at__lte=date_to)
     
-    # Пагинация
-    paginator = Paginator(logs, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Пагинация (keyset по created_at, id; общее количество — оценка по плану запроса)
+    paginator = KeysetPaginator(logs, 50, estimate_total=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     # Статистика
-    total_logs = logs.count()
+    total_logs = paginator.estimated_total
+    if total_logs is None:
+        total_logs = logs.count()
     client_created_count = logs.filter(event_type='client_created').count()
     
     context = {
@@ -1075,7 +1105,7 @@ def approve_service_request(request, request_id):
     service_request.reviewed_at = timezone.now()
     service_request.save()
     
-    # Создаем услугу в каталоге
+    # Создаем услугу в каталоге (сохранение сбрасывает кэш каталога — услуга видна сразу)
     # Гарантируем наличие категории
     category, _ = ServiceCategory.objects.get_or_create(
         name='Дополнительные услуги', defaults={'description': 'Пользовательские услуги'}
@@ -1187,7 +1217,8 @@ def transfers_view(request):
     main_card = client.primary_card if hasattr(client, 'primary_card') and client.primary_card else cards.first()
     return render(request, 'transfers.html', {
         'client': client, 'cards': cards, 'accounts': cards, 'main_card': main_card, 'main_account': main_card,
-        'recent_transfers': Transaction.objects.filter(models.Q(from_card__client=client) | models.Q(to_card__client=client), transaction_type='transfer').select_related('from_card', 'to_card', 'from_card__client', 'to_card__client').order_by('-created_at')[:10],
+        'recent_transfers': latest_client_transactions(client, 10, Transaction.objects.filter(transaction_type='transfer').select_related('from_card', 'to_card', 'from_card__client', 'to_card__client')),
+        'idempotency_key': uuid.uuid4().hex,
     })
 
 @login_required
@@ -1200,9 +1231,7 @@ def transactions_view(request):
         return redirect('home')
     
     # Получаем все операции клиента (входящие и исходящие) - транзакции, переводы и т.д.
-    transactions = Transaction.objects.filter(
-        models.Q(from_card__client=client) | models.Q(to_card__client=client)
-    ).select_related('from_card', 'to_card', 'from_card__client', 'to_card__client').order_by('-created_at')
+    transactions = Transaction.objects.select_related('from_card', 'to_card', 'from_card__client', 'to_card__client')
     
     # Фильтрация по типу транзакции
     transaction_type = request.GET.get('type', '')
@@ -1214,46 +1243,27 @@ def transactions_view(request):
     if status_filter:
         transactions = transactions.filter(status=status_filter)
     
-    # Поиск по описанию
-    search_query = request.GET.get('search', '')
+    # Фильтрация по периоду (диапазон по created_at — отсекает помесячные секции)
+    date_from = request.GET.get('date_from', '')
+    date_to = request.GET.get('date_to', '')
+    try:
+        transactions = transactions.filter(period_filter(date_from, date_to))
+    except ValueError:
+        date_from = date_to = ''
+    
+    # Поиск по описанию (ранжированный: сначала лучшие совпадения)
+    search_query = request.GET.get('search', '').strip()
+    ordering = ('-created_at', '-id')
     if search_query:
-        transactions = transactions.filter(description__icontains=search_query)
+        transactions = search_transactions(transactions, search_query, client)
+        ordering = SEARCH_ORDERING
     
-    # Пагинация
-    paginator = Paginator(transactions, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Пагинация (keyset по created_at, id; исходящие и входящие — отдельными индексами)
+    paginator = client_history_paginator(client, 50, transactions, ordering=ordering)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
-    # Статистика
-    all_transactions = Transaction.objects.filter(
-        models.Q(from_card__client=client) | models.Q(to_card__client=client)
-    )
-    total_transactions = all_transactions.count()
-    completed_transactions = all_transactions.filter(status='completed').count()
-    pending_transactions = all_transactions.filter(status='pending').count()
-    failed_transactions = all_transactions.filter(status='failed').count()
-    
-    # Статистика по типам
-    transfers_count = all_transactions.filter(transaction_type='transfer').count()
-    payments_count = all_transactions.filter(transaction_type='payment').count()
-    deposits_count = all_transactions.filter(transaction_type='deposit').count()
-    withdrawals_count = all_transactions.filter(transaction_type='withdrawal').count()
-    fees_count = all_transactions.filter(transaction_type='fee').count()
-    
-    # Общая сумма по типам
-    # Доходы: входящие транзакции, где получатель - клиент, но отправитель - не он сам
-    total_income = all_transactions.filter(
-        models.Q(to_card__client=client) & 
-        models.Q(status='completed') &
-        ~models.Q(from_card__client=client)  # Исключаем переводы самому себе
-    ).aggregate(total=models.Sum('amount'))['total'] or 0
-    
-    # Расходы: исходящие транзакции, где отправитель - клиент, но получатель - не он сам
-    total_expense = all_transactions.filter(
-        models.Q(from_card__client=client) & 
-        models.Q(status='completed') &
-        ~models.Q(to_card__client=client)  # Исключаем переводы самому себе
-    ).aggregate(total=models.Sum('amount'))['total'] or 0
+    # Статистика (предрасчитанная, одно чтение по первичному ключу)
+    stats = get_client_stats(client)
     
     # Типы транзакций для фильтра
     transaction_types = [
@@ -1278,22 +1288,24 @@ def transactions_view(request):
         'client': client,
         'page_obj': page_obj,
         'transactions': page_obj,
-        'total_transactions': total_transactions,
-        'completed_transactions': completed_transactions,
-        'pending_transactions': pending_transactions,
-        'failed_transactions': failed_transactions,
-        'transfers_count': transfers_count,
-        'payments_count': payments_count,
-        'deposits_count': deposits_count,
-        'withdrawals_count': withdrawals_count,
-        'fees_count': fees_count,
-        'total_income': total_income,
-        'total_expense': total_expense,
+        'total_transactions': stats.total_count,
+        'completed_transactions': stats.completed_count,
+        'pending_transactions': stats.pending_count,
+        'failed_transactions': stats.failed_count,
+        'transfers_count': stats.transfer_count,
+        'payments_count': stats.payment_count,
+        'deposits_count': stats.deposit_count,
+        'withdrawals_count': stats.withdrawal_count,
+        'fees_count': stats.fee_count,
+        'total_income': stats.total_income,
+        'total_expense': stats.total_expense,
         'transaction_types': transaction_types,
         'statuses': statuses,
         'current_type': transaction_type,
         'current_status': status_filter,
         'search_query': search_query,
+        'date_from': date_from,
+        'date_to': date_to,
     }
     
     return render(request, 'transactions.html', context)
@@ -1321,17 +1333,82 @@ def get_card_details(request, card_id):
         'id': card.id,
         'card_number': card.card_number,
         'card_type': card.card_type,
-        'balance': float(card.balance),
+        'balance': float(card_balance(card)),
         'currency': card.currency,
         'is_active': card.is_active,
         'created_at': card.created_at.strftime('%d.%m.%Y %H:%M') if hasattr(card, 'created_at') else '',
     }
-    return JsonResponse({'success': True, 'card': data})
+    response = JsonResponse({'success': True, 'card': data})
+    etag = make_etag(response.content.decode())
+    return _with_etag(get_conditional_response(request, etag=etag) or response, etag)
+
+@login_required
+@require_http_methods(["GET"])
+def export_transactions(request):
+    """Выгрузка истории операций клиента (CSV или JSONL, потоково)"""
+    try:
+        client = Client.objects.get(user=request.user)
+    except Client.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Клиент не найден'}, status=400)
+
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'success': False, 'error': 'Неподдерживаемый формат'}, status=400)
+
+    try:
+        date_filter = period_filter(request.GET.get('date_from', ''), request.GET.get('date_to', ''))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Некорректная дата'}, status=400)
+
+    card = None
+    card_id = request.GET.get('card', '')
+    if card_id:
+        try:
+            card = BankCard.objects.get(id=int(card_id), client=client)
+        except (ValueError, BankCard.DoesNotExist):
+            return JsonResponse({'success': False, 'error': 'Счет не найден'}, status=404)
+
+    queryset = export_queryset(client, date_filter, card, request.GET.get('type', ''))
+    log_from_request('other', f'Выгрузка истории операций ({export_format})', request, client=client,
+                     metadata={k: v for k, v in request.GET.items() if k in ('date_from', 'date_to', 'card', 'type')})
+    filename = f'statement_{client.client_id}_{timezone.localdate():%Y%m%d}'
+    return export_response(queryset, client, export_format, filename)
 
 @login_required
 @require_http_methods(["GET"])
 def get_card_statements(request, card_id):
-    """Возвращает последние операции по счету клиента (JSON)."""
+    """Возвращает последние операции по счету клиента (JSON, первая страница — из кэша, с ETag)."""
+    try:
+        client = Client.objects.get(user=request.user)
+    except Client.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Клиент не найден'}, status=400)
+
+    try:
+        card = BankCard.objects.get(id=card_id, client=client)
+    except BankCard.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Счет не найден'}, status=404)
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        # Следующие страницы читаются реже и не кэшируются
+        return HttpResponse(statements_payload(card.id, cursor), content_type='application/json')
+
+    etag, payload = latest_statements(card.id)
+    response = get_conditional_response(request, etag=etag) or HttpResponse(payload, content_type='application/json')
+    return _with_etag(response, etag)
+
+
+def _with_etag(response, etag):
+    response['ETag'] = etag
+    # Ответ зависит от пользователя: проверять у сервера при каждом обращении
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+@require_http_methods(["GET"])
+def get_card_balance(request, card_id):
+    """Баланс карты на конец дня date (YYYY-MM-DD) или на момент at (ISO 8601); по умолчанию — текущий."""
     try:
         client = Client.objects.get(user=request.user)
     except Client.DoesNotExist:
@@ -1342,22 +1419,220 @@ def get_card_statements(request, card_id):
     except BankCard.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Счет не найден'}, status=404)
 
-    txs = Transaction.objects.filter(
-        models.Q(from_card=card) | models.Q(to_card=card)
-    ).order_by('-created_at')[:20]
-
-    items = []
-    for tx in txs:
-        items.append({
-            'id': tx.id,
-            'type': tx.transaction_type,
-            'amount': float(tx.amount),
-            'currency': tx.currency,
-            'status': tx.status,
-            'description': tx.description,
-            'created_at': tx.created_at.strftime('%d.%m.%Y %H:%M'),
+    date_raw = request.GET.get('date')
+    at_raw = request.GET.get('at')
+    try:
+        if date_raw:
+            day = parse_date(date_raw)
+            if day is None:
+                raise ValueError
+            moment = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+        elif at_raw:
+            moment = parse_datetime(at_raw)
+            if moment is None:
+                raise ValueError
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+        else:
+            moment = timezone.now()
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Неверная дата'}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'card_id': card.id,
+        'as_of': moment.isoformat(),
+        'balance': float(balance_as_of(card.id, moment)),
+        'currency': card.currency,
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def balance_history(request):
+    """Балансы карт клиента на конец каждого дня за последние days дней (для графика в кабинете)."""
+    try:
+        client = Client.objects.get(user=request.user)
+    except Client.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Клиент не найден'}, status=400)
+
+    try:
+        days = min(max(int(request.GET.get('days', 30)), 1), 366)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Неверный период'}, status=400)
+
+    day_to = timezone.localdate()
+    day_from = day_to - timedelta(days=days - 1)
+    cards = []
+    for card in BankCard.objects.filter(client=client, is_active=True).order_by('id'):
+        series = balance_series(card.id, day_from, day_to)
+        cards.append({
+            'id': card.id,
+            'card_number': card.card_number,
+            'balances': [float(balance) for _, balance in series],
         })
-    return JsonResponse({'success': True, 'statements': items})
+    return JsonResponse({
+        'success': True,
+        'days': [(day_from + timedelta(days=i)).isoformat() for i in range(days)],
+        'cards': cards,
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def deposit_accruals(request, deposit_id):
+    """Начисленные проценты по депозиту и журнал начислений (dbo/deposits.py), последние limit строк."""
+    try:
+        client = Client.objects.get(user=request.user)
+    except Client.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Клиент не найден'}, status=400)
+
+    try:
+        deposit = Deposit.objects.get(id=deposit_id, client=client)
+    except Deposit.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Депозит не найден'}, status=404)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', 100)), 1), 1000)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Неверный limit'}, status=400)
+
+    accruals = deposit.accruals.order_by('-period_end').values('period_start', 'period_end', 'amount', 'total')[:limit]
+    return JsonResponse({
+        'success': True,
+        'deposit_id': deposit.id,
+        'accrued_interest': float(deposit.accrued_interest),
+        'accrued_through': deposit.accrued_through.isoformat() if deposit.accrued_through else None,
+        'is_active': deposit.is_active,
+        'accruals': [
+            {
+                'period_start': row['period_start'].isoformat(),
+                'period_end': row['period_end'].isoformat(),
+                'amount': float(row['amount']),
+                'total': float(row['total']),
+            }
+            for row in accruals
+        ],
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def credit_schedule_view(request, credit_id):
+    """График платежей по кредиту (dbo/credits.py): кэшируется до платежа или ночного пересчета."""
+    try:
+        client = Client.objects.get(user=request.user)
+    except Client.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Клиент не найден'}, status=400)
+
+    try:
+        credit = Credit.objects.get(id=credit_id, client=client)
+    except Credit.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Кредит не найден'}, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'credit_id': credit.id,
+        'status': credit.status,
+        'monthly_payment': float(credit.monthly_payment),
+        'remaining_amount': float(credit.remaining_amount),
+        'paid_amount': float(credit.paid_amount),
+        'schedule': credit_schedule(credit),
+    })
+
+
+def _json_body(request):
+    """Тело запроса — JSON-объект (пустое тело — {}); None, если это не объект"""
+    try:
+        data = json.loads(request.body) if request.body else {}
+    except ValueError:  # JSONDecodeError и тело не в UTF-8
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@login_required
+@require_http_methods(["POST"])
+def authorize_card(request, card_id):
+    """Авторизация покупки по карте: удержание суммы без записи в БД (dbo/holds.py)."""
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'success': False, 'error': 'Неверный формат JSON'}, status=400)
+    try:
+        hold_id = authorize(card_id, data.get('amount'), merchant=str(data.get('merchant', ''))[:100],
+                            user_id=request.user.id)
+    except (InsufficientFunds, DailyLimitExceeded) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=402)
+    except PostingError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'hold_id': str(hold_id)})
+
+
+@login_required
+@require_http_methods(["POST"])
+def capture_hold(request, hold_id):
+    """Списание удержания (полностью или на меньшую сумму amount)."""
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'success': False, 'error': 'Неверный формат JSON'}, status=400)
+    amounts = {hold_id: data['amount']} if data.get('amount') is not None else None
+    try:
+        results = capture_holds([hold_id], amounts, user_id=request.user.id)
+    except ArithmeticError:
+        return JsonResponse({'success': False, 'error': 'Некорректная сумма операции'}, status=400)
+    if hold_id not in results:
+        return JsonResponse({'success': False, 'error': 'Удержание не найдено'}, status=404)
+    result = results[hold_id]
+    if isinstance(result, Exception):
+        return JsonResponse({'success': False, 'error': str(result)}, status=402 if isinstance(result, InsufficientFunds) else 400)
+    return JsonResponse({'success': True, 'transaction_id': result.id, 'amount': float(result.amount)})
+
+
+@login_required
+@require_http_methods(["POST"])
+@idempotent('credit_payment')
+def credit_payment(request, credit_id):
+    """Платеж по кредиту с карты клиента (card_id; по умолчанию основная или первая активная карта)."""
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'success': False, 'error': 'Неверный формат JSON'}, status=400)
+    try:
+        client = Client.objects.get(user=request.user)
+    except Client.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Клиент не найден'}, status=400)
+
+    cards = BankCard.objects.filter(client=client, is_active=True)
+    try:
+        card_id = int(data.get('card_id') or client.primary_card_id or 0)
+    except (TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Некорректный номер карты'}, status=400)
+    card = cards.filter(id=card_id).first() if card_id else cards.order_by('id').first()
+    if card is None:
+        return JsonResponse({'success': False, 'error': 'Карта не найдена или заблокирована'}, status=400)
+    try:
+        credit = pay_credit(credit_id, client, card, data.get('amount'))
+    except ArithmeticError:
+        return JsonResponse({'success': False, 'error': 'Некорректная сумма операции'}, status=400)
+    except (InsufficientFunds, DailyLimitExceeded) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=402)
+    except PostingError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({
+        'success': True,
+        'status': credit.status,
+        'remaining_amount': float(credit.remaining_amount),
+        'paid_amount': float(credit.paid_amount),
+    })
+
+
+@login_required
+@require_http_methods(["POST"])
+def release_hold(request, hold_id):
+    """Отмена удержания: сумма снова доступна."""
+    if not release_holds([hold_id], user_id=request.user.id):
+        return JsonResponse({'success': False, 'error': 'Удержание не найдено'}, status=404)
+    return JsonResponse({'success': True})
+
+
 @login_required
 def settings_view(request):
     """Страница настроек клиента"""
@@ -1474,9 +1749,7 @@ def transfers_service(request):
     try:
         client = Client.objects.get(user=request.user)
         cards = BankCard.objects.filter(client=client, is_active=True)
-        transactions = Transaction.objects.filter(
-            models.Q(from_card__client=client) | models.Q(to_card__client=client)
-        ).order_by('-created_at')[:20]
+        transactions = latest_client_transactions(client, 20)
     except Client.DoesNotExist:
         messages.error(request, 'Клиент не найден')
         return redirect('home')
@@ -1541,9 +1814,7 @@ def client_dashboard(request):
     credits = Credit.objects.filter(client=client)
     deposits = Deposit.objects.filter(client=client)
     investments = ClientInvestment.objects.filter(client=client)
-    transactions = Transaction.objects.filter(
-        models.Q(from_card__client=client) | models.Q(to_card__client=client)
-    ).order_by('-created_at')[:5]
+    transactions = latest_client_transactions(client, 5)
     
     # Подключенные услуги
     connected_services = ClientService.objects.filter(client=client, status='active')
@@ -1552,7 +1823,7 @@ def client_dashboard(request):
     total_cost = sum(service.monthly_fee for service in connected_services)
     
     # Статистика
-    total_balance = sum(card.balance for card in cards)
+    total_balance = sum(card_balance(card) for card in cards)
     total_credit_debt = sum(credit.remaining_amount for credit in credits if credit.status == 'active')
     total_credit_amount = total_credit_debt if total_credit_debt > 0 else 0  # Гарантируем, что всегда будет число
     total_deposit_amount = sum(deposit.amount for deposit in deposits)
@@ -1578,6 +1849,7 @@ def client_dashboard(request):
 
 
 @login_required
+@idempotent('transfer', redirect_to='transfers_service')
 def transfers_service(request):
     """Страница переводов и платежей"""
     try:
@@ -1662,7 +1934,7 @@ def transfers_service(request):
                 messages.error(request, 'Карта списания не найдена или неактивна')
                 return redirect('transfers_service')
 
-            if from_card.balance < amount:
+            if card_balance(from_card) < amount:
                 messages.error(request, 'Недостаточно средств на счете')
                 return redirect('transfers_service')
 
@@ -1689,24 +1961,18 @@ def transfers_service(request):
                     messages.error(request, f'У получателя с номером {recipient_phone} нет активных карт')
                     return redirect('transfers_service')
 
-                # Выполняем перевод
-                from_card.balance -= amount
-                from_card.save()
-
-                recipient_card.balance += amount
-                recipient_card.save()
-
-                # Создаем транзакцию
-                Transaction.objects.create(
-                    from_card=from_card,
-                    to_card=recipient_card,
-                    amount=amount,
-                    currency='RUB',
-                    transaction_type='transfer',
-                    description=f"Перевод по номеру телефона {recipient_phone}: {description}",
-                    status='completed',
-                    completed_at=timezone.now()
-                )
+                # Выполняем перевод: списание, зачисление и транзакция атомарно
+                try:
+                    post_transfer(
+                        'transfer', amount, from_card=from_card, to_card=recipient_card,
+                        description=f"Перевод по номеру телефона {recipient_phone}: {description}",
+                    )
+                except InsufficientFunds:
+                    messages.error(request, 'Недостаточно средств на счете')
+                    return redirect('transfers_service')
+                except PostingError as e:
+                    messages.error(request, f'Перевод не выполнен: {e}')
+                    return redirect('transfers_service')
 
                 messages.success(request, f'Перевод на сумму {amount} ₽ успешно выполнен на номер {recipient_phone}')
 
@@ -1724,9 +1990,7 @@ def transfers_service(request):
         return redirect('transfers_service')
     
     # Получаем последние транзакции
-    transactions = Transaction.objects.filter(
-        models.Q(from_card__client=client) | models.Q(to_card__client=client)
-    ).order_by('-created_at')[:10]
+    transactions = latest_client_transactions(client, 10)
     
     print(f"DEBUG: Передаем в шаблон - клиент: {client.full_name}, карт: {cards.count()}, основная карта: {main_card.card_number if main_card else 'НЕТ'}")
     
@@ -1735,6 +1999,7 @@ def transfers_service(request):
         'accounts': cards,
         'main_account': main_card,
         'transactions': transactions,
+        'idempotency_key': uuid.uuid4().hex,
     }
     
     return render(request, 'transfers.html', context)